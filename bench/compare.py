@@ -0,0 +1,32 @@
+# compare.py
+# 对比两次 run_bench.py 的结果：python compare.py base.json new.json
+import argparse
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate")
+
+def change(base, new):
+    if base in (None, 0) or new is None:
+        return ""
+    return f"{(new - base) / base:+.1%}"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='对比两次压测结果',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('base', help='基线结果文件')
+    parser.add_argument('new', help='新结果文件')
+    args = parser.parse_args()
+
+    with open(args.base, 'r') as f:
+        base = json.load(f)
+    with open(args.new, 'r') as f:
+        new = json.load(f)
+    print(f"base: {(base.get('commit') or '?')[:8]}  new: {(new.get('commit') or '?')[:8]}")
+    print(f"{'route':<14}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    for route in sorted(set(base["routes"]) | set(new["routes"])):
+        for metric in METRICS:
+            old_value = base["routes"].get(route, {}).get(metric)
+            new_value = new["routes"].get(route, {}).get(metric)
+            print(f"{route:<14}{metric:<16}{str(old_value):>12}{str(new_value):>12}{change(old_value, new_value):>10}")
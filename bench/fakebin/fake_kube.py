@@ -0,0 +1,40 @@
+# fake_kube.py
+# 基准测试用的 kubeadm/kubectl 替身：按命令模拟耗时，可按比例注入瞬时失败。
+# 环境变量:
+#   MOLINK_FAKE_LATENCY       JSON，如 {"kubeadm token": 0.05, "kubectl drain": 0.5, "default": 0.02}（秒）
+#   MOLINK_FAKE_JITTER        耗时的随机浮动比例，缺省 0.2
+#   MOLINK_FAKE_FAILURE_RATE  kubectl 调用返回 "connection refused" 的概率，缺省 0
+#   MOLINK_FAKE_TOKEN         `kubeadm token list` 返回的 bootstrap token
+import json
+import os
+import random
+import sys
+import time
+
+def simulate(program, args):
+    command = ' '.join([program] + args[:1])
+    latency = json.loads(os.environ.get('MOLINK_FAKE_LATENCY') or '{}')
+    seconds = float(latency.get(command, latency.get(program, latency.get('default', 0.02))))
+    jitter = float(os.environ.get('MOLINK_FAKE_JITTER', 0.2))
+    time.sleep(max(0.0, seconds * random.uniform(1 - jitter, 1 + jitter)))
+
+    if program == 'kubeadm':
+        if args[:2] == ['token', 'list']:
+            token = os.environ.get('MOLINK_FAKE_TOKEN', 'abcdef.0123456789abcdef')
+            print(json.dumps({"token": token, "expires": None, "usages": ["authentication", "signing"]}))
+        return 0
+
+    if random.random() < float(os.environ.get('MOLINK_FAKE_FAILURE_RATE', 0)):
+        print('The connection to the server localhost:6443 was refused', file=sys.stderr)
+        return 1
+    verb = args[0] if args else ''
+    if verb == 'cordon':
+        print(f'node/{args[1]} cordoned')
+    elif verb == 'drain':
+        print(f'node/{args[1]} drained')
+    elif verb == 'delete' and len(args) > 2:
+        print(f'node "{args[2]}" deleted')
+    return 0
+
+def main():
+    sys.exit(simulate(os.path.basename(sys.argv[0]), sys.argv[1:]))
@@ -0,0 +1,424 @@
+# run_bench.py
+# 控制平面负载测试：启动本地数据库与 backend.py（kubeadm/kubectl 为模拟耗时的替身），
+# 用 N 个并发模拟节点按 加入 -> 登记 -> （按比例）退出 的流程压测，
+# 输出各路由吞吐、p50/p95/p99 延迟与错误率，结果写入 JSON 便于跨提交对比（见 compare.py）。
+#
+# 依赖: requests, werkzeug；--db mysql 时还需要 mysql-connector-python，未指定 --db-host 时需要本机有 mysqld
+import argparse
+import datetime
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import urllib3
+
+urllib3.disable_warnings()
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+DEFAULT_FAKE_LATENCY = {
+    "kubeadm token": 0.15,
+    "kubectl cordon": 0.2,
+    "kubectl drain": 1.0,
+    "kubectl delete": 0.3,
+    "default": 0.05,
+}
+BENCH_USER = "bench"
+BENCH_PASSWORD = "bench-password"
+INVALID_TOKEN = "zzzzzz.0000000000000000"
+# 模拟节点都来自 127.0.0.1，缺省关闭按IP/用户的限流，只保留路由级的准入排队
+DEFAULT_OVERRIDES = {
+    "RateLimitPerIP": [1000000, 1000000],
+    "RateLimitPerUser": [1000000, 1000000],
+    "InformerEnabled": False,
+    "MetricsSelfScrape": False,
+}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for(check, timeout, message):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(message)
+
+class TempMySQL:
+    """临时 mysqld 实例，数据目录位于工作目录下，结束时删除"""
+
+    def __init__(self, workdir):
+        self.datadir = os.path.join(workdir, 'mysql')
+        self.port = free_port()
+        self.proc = None
+
+    def start(self):
+        mysqld = shutil.which('mysqld')
+        if mysqld is None:
+            raise SystemExit("未找到 mysqld，请安装或通过 --db-host 指定已有的测试数据库")
+        subprocess.run(
+            [mysqld, '--no-defaults', '--initialize-insecure', f'--datadir={self.datadir}', '--user=root'],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.proc = subprocess.Popen(
+            [mysqld, '--no-defaults', f'--datadir={self.datadir}', f'--port={self.port}',
+             '--bind-address=127.0.0.1', f'--socket={self.datadir}/mysqld.sock', '--mysqlx=OFF',
+             '--skip-log-bin', '--user=root', f'--max-connections=500'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        wait_for(lambda: socket.create_connection(('127.0.0.1', self.port), timeout=1).close() or True,
+                 60, "mysqld 启动超时")
+        return {"DbHost": "127.0.0.1", "DbPort": self.port, "DbUser": "root", "DbPwd": "", "DbName": "dkube"}
+
+    def stop(self):
+        if self.proc is not None:
+            self.proc.terminate()
+            self.proc.wait(timeout=30)
+
+def bootstrap_mysql(db):
+    """建库、按 storage.MIGRATIONS 建表并创建压测用户（密码为预计算哈希，与生产一致）"""
+    import types
+    import mysql.connector
+    sys.path.insert(0, os.path.join(ROOT, 'k8s', 'control_plane'))
+    from storage import MySQLStorage, migrate
+    from werkzeug.security import generate_password_hash
+
+    conn = mysql.connector.connect(host=db["DbHost"], port=db["DbPort"], user=db["DbUser"], password=db["DbPwd"])
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{db['DbName']}`")
+    cursor.close()
+    conn.close()
+
+    storage = MySQLStorage(types.SimpleNamespace(
+        MaxIdleConns=0, MaxOpenConns=1, MaxLifeTime=0, DbPoolTimeout=30, DbPingAfterIdle=5, **db
+    ))
+    migrate(storage)
+    conn = storage.connect()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM node WHERE name LIKE 'bench-%'")
+    cursor.execute("SELECT id FROM users WHERE username = %s", (BENCH_USER,))
+    if cursor.fetchone() is None:
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
+                       (BENCH_USER, generate_password_hash(BENCH_PASSWORD)))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def bootstrap_sqlite(path):
+    """建表由 storage.SQLiteStorage 完成，这里只创建压测用户"""
+    sys.path.insert(0, os.path.join(ROOT, 'k8s', 'control_plane'))
+    from storage import SQLiteStorage
+    from werkzeug.security import generate_password_hash
+
+    conn = SQLiteStorage(path).connect()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
+                   (BENCH_USER, generate_password_hash(BENCH_PASSWORD)))
+    conn.commit()
+    cursor.close()
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, route, seconds, outcome):
+        with self._lock:
+            self.samples.setdefault(route, []).append((seconds, outcome))
+
+    def summary(self, elapsed, expected):
+        routes = {}
+        for route, samples in sorted(self.samples.items()):
+            latencies = sorted(seconds for seconds, _ in samples)
+            outcomes = {}
+            for _, outcome in samples:
+                outcomes[str(outcome)] = outcomes.get(str(outcome), 0) + 1
+            rejected = outcomes.get('429', 0)
+            errors = sum(count for outcome, count in outcomes.items()
+                         if outcome not in expected.get(route, ()) and outcome != '429')
+            routes[route] = {
+                "requests": len(samples),
+                "throughput_rps": round(len(samples) / elapsed, 3),
+                "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+                "max_ms": round(latencies[-1] * 1000, 3),
+                "error_rate": round(errors / len(samples), 6),
+                "rejected_rate": round(rejected / len(samples), 6),
+                "outcomes": outcomes,
+            }
+        return routes
+
+class SimulatedNode(threading.Thread):
+    """一个模拟节点：循环执行 /k8s -> /k8s_complete -> （按比例）/k8s_delete 并等待移除任务完成"""
+
+    def __init__(self, index, args, base_url, recorder, deadline, run_id):
+        super().__init__(name=f'bench-node-{index}', daemon=True)
+        self.index = index
+        self.args = args
+        self.base_url = base_url
+        self.recorder = recorder
+        self.deadline = deadline
+        self.run_id = run_id
+        self.rng = random.Random(args.seed * 100003 + index)
+        self.session = requests.Session()
+
+    def call(self, route, payload=None, method='POST'):
+        start = time.perf_counter()
+        try:
+            if method == 'POST':
+                # verify 需按请求传入：Session.verify 会被 REQUESTS_CA_BUNDLE 环境变量覆盖
+                resp = self.session.post(f"{self.base_url}/{route}", json=payload, verify=False,
+                                         timeout=self.args.timeout)
+            else:
+                resp = self.session.get(f"{self.base_url}/{route}", verify=False, timeout=self.args.timeout)
+            outcome = resp.status_code
+            try:
+                body = resp.json()
+            except ValueError:
+                body = {}
+        except requests.exceptions.RequestException as e:
+            outcome, body = type(e).__name__, {}
+        self.recorder.record(route.split('/')[0], time.perf_counter() - start, outcome)
+        return outcome, body
+
+    def think(self):
+        if self.args.think_ms:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_ms / 1000)
+
+    def wait_job(self, job_id):
+        start = time.perf_counter()
+        while time.monotonic() < self.deadline + self.args.drain_seconds:
+            status, job = self.call(f"k8s_jobs/{job_id}", method='GET')
+            if status == 200 and job.get('state') in ('succeeded', 'failed'):
+                self.recorder.record('removal_job', time.perf_counter() - start, job['state'])
+                return
+            time.sleep(self.args.poll_interval)
+        self.recorder.record('removal_job', time.perf_counter() - start, 'timeout')
+
+    def run(self):
+        time.sleep(self.rng.uniform(0, self.args.ramp_up))
+        iteration = 0
+        while time.monotonic() < self.deadline:
+            iteration += 1
+            name = f"bench-{self.run_id}-{self.index}-{iteration}"
+            invalid = self.rng.random() < self.args.invalid_token_ratio
+            status, body = self.call('k8s', {
+                "token": INVALID_TOKEN if invalid else self.args.token,
+                "hash": "sha256:" + "0" * 64,
+                "username": BENCH_USER,
+                "user_password": BENCH_PASSWORD,
+                "node_name": name,
+            })
+            self.think()
+            if status != 200:
+                continue
+            session_token = body.get('session_token')
+            status, _ = self.call('k8s_complete', {
+                "session_token": session_token,
+                "hardware_info": {
+                    "name": name,
+                    "ip": f"10.{self.index // 250 % 250}.{self.index % 250}.{iteration % 250 + 1}",
+                    "num_cpu": 32,
+                    "size_mem": 251.5,
+                    "num_gpu": 8,
+                    "gpu_type": "NVIDIA A100-SXM4-80GB",
+                },
+                "timings": {"kubeadm_join": self.rng.uniform(5, 20), "total": self.rng.uniform(10, 40)},
+            })
+            self.think()
+            if status != 200 or self.rng.random() >= self.args.delete_ratio:
+                continue
+            status, body = self.call('k8s_delete', {
+                "node_name": name,
+                "session_token": session_token,
+                "username": BENCH_USER,
+                "user_password": BENCH_PASSWORD,
+            })
+            if status == 202 and body.get('job_id'):
+                self.wait_job(body['job_id'])
+            self.think()
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    stdout=subprocess.PIPE, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='MoLink控制平面负载测试',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--nodes', type=int, default=50, help='并发模拟节点数')
+    parser.add_argument('--duration', type=float, default=60, help='压测时长（秒）')
+    parser.add_argument('--ramp-up', type=float, default=5, help='模拟节点在该时间内随机错开启动（秒）')
+    parser.add_argument('--think-ms', type=float, default=100, help='节点两步之间的平均间隔（毫秒）')
+    parser.add_argument('--delete-ratio', type=float, default=0.5, help='登记后立即退出的节点比例')
+    parser.add_argument('--invalid-token-ratio', type=float, default=0.02, help='使用无效 token 加入的比例')
+    parser.add_argument('--poll-interval', type=float, default=0.5, help='轮询移除任务的间隔（秒）')
+    parser.add_argument('--drain-seconds', type=float, default=30, help='压测结束后等待移除任务完成的最长时间')
+    parser.add_argument('--timeout', type=float, default=10, help='单个请求的超时（秒），与 CLI 一致')
+    parser.add_argument('--fake-latency', default=json.dumps(DEFAULT_FAKE_LATENCY),
+                        help='kubeadm/kubectl 替身的耗时(JSON，秒)')
+    parser.add_argument('--fake-failure-rate', type=float, default=0.0, help='kubectl 替身的瞬时失败概率')
+    parser.add_argument('--token', default='abcdef.0123456789abcdef', help='替身 kubeadm 返回的 bootstrap token')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=JSON',
+                        help='覆盖 backend Config，如 --set \'AdmissionLimits={"k8s":[16,400]}\'')
+    parser.add_argument('--no-tls', action='store_true', help='服务端使用 HTTP')
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug', help='服务端 HTTP 服务器')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='--server gunicorn 的工作进程数（移除任务状态按进程保存，轮询可能落到其他进程）')
+    parser.add_argument('--db', choices=('sqlite', 'mysql'), default='sqlite', help='存储后端（Config.DbType）')
+    parser.add_argument('--db-host', help='--db mysql 时使用已有的测试 MySQL（缺省启动临时 mysqld）')
+    parser.add_argument('--db-port', type=int, default=3306)
+    parser.add_argument('--db-user', default='root')
+    parser.add_argument('--db-password', default='')
+    parser.add_argument('--db-name', default='molink_bench')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--output', help='结果文件，缺省为 bench/results/<时间>-<提交>.json')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时目录（含服务端日志）')
+    args = parser.parse_args()
+
+    overrides = dict(DEFAULT_OVERRIDES)
+    for item in args.set:
+        key, _, value = item.partition('=')
+        overrides[key] = json.loads(value)
+
+    workdir = tempfile.mkdtemp(prefix='molink-bench-')
+    mysqld = None
+    server = None
+    try:
+        if args.db == 'sqlite':
+            db = {"DbType": "sqlite", "SqlitePath": os.path.join(workdir, 'bench.db')}
+            bootstrap_sqlite(db["SqlitePath"])
+        else:
+            if args.db_host:
+                db = {"DbHost": args.db_host, "DbPort": args.db_port, "DbUser": args.db_user,
+                      "DbPwd": args.db_password, "DbName": args.db_name}
+            else:
+                mysqld = TempMySQL(workdir)
+                db = mysqld.start()
+            bootstrap_mysql(db)
+            db["DbType"] = "mysql"
+        overrides.update(db)
+
+        port = free_port()
+        scheme = 'http' if args.no_tls else 'https'
+        base_url = f"{scheme}://127.0.0.1:{port}"
+        env = dict(os.environ)
+        env.update({
+            "PATH": os.path.join(BENCH_DIR, 'fakebin') + os.pathsep + env.get('PATH', ''),
+            # 服务发现文件写到临时目录
+            "HOME": workdir,
+            "MOLINK_FAKE_LATENCY": args.fake_latency,
+            "MOLINK_FAKE_FAILURE_RATE": str(args.fake_failure_rate),
+            "MOLINK_FAKE_TOKEN": args.token,
+            # 多个工作进程共享会话令牌密钥
+            "MOLINK_SESSION_SECRET": env.get('MOLINK_SESSION_SECRET') or os.urandom(16).hex(),
+        })
+        server_log = open(os.path.join(workdir, 'backend.log'), 'w')
+        command = [sys.executable, os.path.join(BENCH_DIR, 'serve_backend.py'),
+                   '--port', str(port), '--config', json.dumps(overrides)]
+        if args.no_tls:
+            command.append('--no-tls')
+        command += ['--server', args.server, '--workers', str(args.workers)]
+        server = subprocess.Popen(command, env=env, stdout=server_log, stderr=subprocess.STDOUT)
+        wait_for(lambda: requests.get(f"{base_url}/admission", verify=False, timeout=1).ok, 30,
+                 f"backend 启动失败，日志见 {server_log.name}")
+
+        print(f"压测开始: {args.nodes} 个节点, {args.duration}s -> {base_url}")
+        recorder = Recorder()
+        run_id = format(int(time.time()), 'x')
+        started = datetime.datetime.now(datetime.timezone.utc)
+        start = time.monotonic()
+        deadline = start + args.duration
+        nodes = [SimulatedNode(i, args, base_url, recorder, deadline, run_id) for i in range(args.nodes)]
+        for node in nodes:
+            node.start()
+        for node in nodes:
+            node.join()
+        elapsed = time.monotonic() - start
+
+        server_stats = {}
+        for route in ('admission', 'join_stats'):
+            try:
+                server_stats[route] = requests.get(f"{base_url}/{route}", verify=False, timeout=5).json()
+            except (requests.exceptions.RequestException, ValueError):
+                pass
+
+        commit, dirty = git_revision()
+        result = {
+            "schema": 1,
+            "commit": commit,
+            "dirty": dirty,
+            "started": started.isoformat(),
+            "elapsed_s": round(elapsed, 3),
+            "args": vars(args),
+            "config_overrides": {k: v for k, v in overrides.items() if k != 'DbPwd'},
+            "routes": recorder.summary(elapsed, {
+                "k8s": ('200', '401'),
+                "k8s_complete": ('200',),
+                "k8s_delete": ('200', '202'),
+                "k8s_jobs": ('200',),
+                "removal_job": ('succeeded',),
+            }),
+            "server": server_stats,
+        }
+        output = args.output or os.path.join(
+            BENCH_DIR, 'results', f"{started.strftime('%Y%m%d-%H%M%S')}-{(commit or 'unknown')[:8]}.json"
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+        print(f"{'route':<14}{'reqs':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'err':>8}{'429':>8}")
+        for route, stats in result["routes"].items():
+            print(f"{route:<14}{stats['requests']:>8}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.1f}"
+                  f"{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}{stats['error_rate']:>8.2%}"
+                  f"{stats['rejected_rate']:>8.2%}")
+        print(f"结果已写入 {output}")
+    finally:
+        if server is not None:
+            # SIGINT 立即退出；SIGTERM 会让 gunicorn 等待空闲 keep-alive 连接到 graceful_timeout
+            server.send_signal(signal.SIGINT)
+            try:
+                server.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                server.kill()
+                server.wait()
+        if mysqld is not None:
+            mysqld.stop()
+        if args.keep_workdir:
+            print(f"临时目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# serve_backend.py
+# 基准测试用的控制平面启动器：覆盖 backend.Config 后通过 serve.py 启动（Werkzeug 或 gunicorn）。
+# 服务发现文件和 TLS 证书写到 $HOME 下（由 run_bench.py 指向临时目录）。
+import argparse
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'k8s', 'control_plane'))
+
+def apply_overrides(backend, overrides):
+    config = backend.Config
+    for key, value in overrides.items():
+        if not hasattr(config, key):
+            raise SystemExit(f"unknown Config.{key}")
+        if isinstance(getattr(config, key), tuple) and isinstance(value, list):
+            value = tuple(value)
+        setattr(config, key, value)
+    # 以下对象在导入时按 Config 创建，覆盖配置后重建
+    backend.ip_rate_limiter = backend.RateLimiter(*config.RateLimitPerIP)
+    backend.user_rate_limiter = backend.RateLimiter(*config.RateLimitPerUser)
+    backend.admission_controllers.clear()
+    backend.admission_controllers.update({
+        name: backend.AdmissionController(name, concurrency, queue_size, config.AdmissionQueueTimeout)
+        for name, (concurrency, queue_size) in config.AdmissionLimits.items()
+    })
+    backend.removal_jobs = backend.RemovalJobs(
+        workers=config.RemovalWorkers,
+        retries=config.RemovalRetries,
+        drain_timeout=config.DrainTimeout
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='基准测试用的控制平面启动器',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--port', type=int, default=12000, help='监听端口')
+    parser.add_argument('--config', default='{}', help='Config 覆盖项(JSON)')
+    parser.add_argument('--no-tls', action='store_true', help='使用 HTTP（缺省与生产一致使用 TLS）')
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug', help='HTTP 服务器')
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn 工作进程数')
+    parser.add_argument('--threads', type=int, default=64, help='gunicorn 每个工作进程的线程数')
+    args = parser.parse_args()
+
+    import backend
+    import serve
+    overrides = json.loads(args.config)
+    # 在主进程中覆盖一次，gunicorn 工作进程 fork 后继承
+    apply_overrides(backend, overrides)
+    cert_file = key_file = None
+    if not args.no_tls:
+        tls_dir = os.path.join(os.path.expanduser('~'), 'tls')
+        cert_file, key_file = serve.ensure_certificate(
+            os.path.join(tls_dir, 'server.crt'), os.path.join(tls_dir, 'server.key')
+        )
+    if args.server == 'gunicorn':
+        if args.no_tls:
+            raise SystemExit("--server gunicorn 需要 TLS")
+        serve.serve_gunicorn(f"127.0.0.1:{args.port}", args.workers, args.threads, cert_file, key_file,
+                             backend.Config.ServeKeepAlive, backend.Config.ServeGracefulTimeout)
+    else:
+        serve.serve_werkzeug('127.0.0.1', args.port, cert_file, key_file)
@@ -28,6 +28,7 @@ check_command curl
 check_command sed
 check_command tee
 check_command kubectl
+check_command python3
 
 # 备份原始配置文件
 backup_containerd_config() {
@@ -60,57 +61,25 @@ FTP_SERVER="10.202.210.104"  # 修改为实际FTP服务器IP
 FTP_PORT="12001"
 FTP_DIR="ftp_share"
 
-# 新增：下载文件函数
-download_from_ftp() {
-    local filename=$1
-    echo -e "${YELLOW}正在下载: ${filename}${NC}"
-    
-    if ! curl -s -S -O "ftp://${FTP_SERVER}:${FTP_PORT}/${FTP_DIR}/${filename}"; then
-        echo -e "${RED}FTP下载失败: ${filename}${NC}"
-        exit 1
-    fi
-    
-    if [ ! -f "${filename}" ]; then
-        echo -e "${RED}文件下载不完整: ${filename}${NC}"
-        exit 1
-    fi
-}
+# 镜像处理：由 molink_prefetch.py 并行下载（断点续传、sha256 校验、本地缓存）并流水线导入
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+IMAGE_CACHE_DIR="/var/cache/molink/images"
 
-# 修改后的镜像处理函数
 pull_images() {
   echo -e "${YELLOW}[3/5] 开始处理镜像...${NC}"
-  
-  # 下载镜像文件
-  download_from_ftp "cni.tar"
-  download_from_ftp "node.tar"
-  download_from_ftp "molink-release-0.9.tar"
-
-  # 导入本地镜像
-  for image in cni.tar node.tar molink-release-0.9.tar; do
-    echo -e "${YELLOW}正在导入: ${image}${NC}"
-    if ! ctr -n k8s.io images import "${image}"; then
-      echo -e "${RED}镜像导入失败: ${image}${NC}"
-      exit 1
-    fi
-    rm -f "${image}"  # 清理临时文件
-  done
-
-  # 拉取其他镜像
-  other_images=(
-    "registry.aliyuncs.com/google_containers/pause:3.9"
-    "registry.aliyuncs.com/google_containers/kube-proxy:v1.28.15"
-    "quay.io/prometheus/node-exporter:v1.8.2"
-    "nvcr.io/nvidia/k8s/dcgm-exporter:3.3.5-3.4.0-ubuntu22.04"
-    "nvcr.io/nvidia/k8s-device-plugin:v0.17.0"
-  )
-
-  for image in "${other_images[@]}"; do
-    echo -e "${YELLOW}正在拉取: ${image}${NC}"
-    if ! ctr -n k8s.io images pull "${image}"; then
-      echo -e "${RED}镜像拉取失败: ${image}${NC}"
-      exit 1
-    fi
-  done
+
+  local manifest_args=()
+  if [ -f "${SCRIPT_DIR}/images_manifest.json" ]; then
+    manifest_args=(--manifest "${SCRIPT_DIR}/images_manifest.json")
+  fi
+
+  if ! python3 "${SCRIPT_DIR}/molink_prefetch.py" \
+      --base-url "ftp://${FTP_SERVER}:${FTP_PORT}/${FTP_DIR}" \
+      --cache-dir "${IMAGE_CACHE_DIR}" \
+      "${manifest_args[@]}"; then
+    echo -e "${RED}镜像处理失败${NC}"
+    exit 1
+  fi
 }
 
 # 安装NVIDIA设备插件
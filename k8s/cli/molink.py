@@ -0,0 +1,132 @@
+# molink.py
+# 统一的节点命令行入口（setup.py 安装为 molink 命令）：
+#   molink join <控制平面> <token> <hash> <用户名> <密码>
+#   molink quit <控制平面> <用户名> <密码>
+#   molink logs <控制平面> [-n 100] [--nodes a,b]
+#   molink status <控制平面> [--node 名称]
+#   molink info [--json]
+# 本文件只导入标准库中的轻量模块；requests、psutil 等只在执行对应子命令时导入，
+# molink --help 与参数错误不需要加载它们（启动耗时预算见 tests/test_cli_startup.py）。
+import argparse
+import os
+import sys
+
+# 各 CLI 模块之间按文件名互相导入（from molink_hwprobe import ...）
+CLI_DIR = os.path.dirname(os.path.abspath(__file__))
+if CLI_DIR not in sys.path:
+    sys.path.insert(0, CLI_DIR)
+
+def run_join(argv):
+    import molink_join_k8s
+    return molink_join_k8s.main(argv, prog='molink join')
+
+def run_quit(argv):
+    import molink_quit_k8s
+    return molink_quit_k8s.main(argv, prog='molink quit')
+
+# 参数由各自模块解析，这里不导入它们
+DELEGATED = {'join': run_join, 'quit': run_quit}
+
+def run_logs(args):
+    import requests
+    from molink_client import ControlPlaneClient
+
+    client = ControlPlaneClient(args.control_plane, fingerprint=args.fingerprint)
+    params = {key: value for key, value in (
+        ("start", args.start), ("end", args.end), ("level", args.level), ("contains", args.contains),
+    ) if value is not None}
+    if not params:
+        params["n"] = args.n
+    if args.nodes:
+        params["nodes"] = args.nodes
+    try:
+        # 聚合请求在服务端有截止时间，不重试
+        resp = client.post('k8s_logs', params, idempotent=False, timeout=30)
+        resp.raise_for_status()
+        result = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"获取日志失败: {str(e)}", file=sys.stderr)
+        return 1
+    for entry in result.get("lines", []):
+        print(f"[{entry.get('node')}] {entry.get('line')}")
+    failed = {name: status for name, status in result.get("nodes", {}).items() if status.get("status") != "ok"}
+    for name, status in sorted(failed.items()):
+        print(f"节点 {name}: {status.get('status')} {status.get('error', '')}".rstrip(), file=sys.stderr)
+    return 0 if not failed else 2
+
+def run_status(args):
+    import json
+    import platform
+    import requests
+    from molink_client import ControlPlaneClient
+
+    client = ControlPlaneClient(args.control_plane, fingerprint=args.fingerprint)
+    node_name = args.node or platform.node().strip()
+    try:
+        resp = client.get(f"k8s_nodes/{node_name}")
+        result = resp.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        print(f"查询节点状态失败: {str(e)}", file=sys.stderr)
+        return 1
+    if resp.status_code != 200:
+        print(f"{node_name}: {result.get('error', resp.status_code)}", file=sys.stderr)
+        return 1
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+def run_info(args):
+    import json
+    from molink_hwprobe import probe_inventory, summarize
+
+    inventory = probe_inventory(refresh=args.refresh)
+    if args.json:
+        print(json.dumps({"summary": summarize(inventory), "inventory": inventory}, indent=2, ensure_ascii=False))
+        return 0
+    for key, value in summarize(inventory).items():
+        print(f"{key:>12}: {value}")
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='molink', description='MoLink 节点命令行工具')
+    subparsers = parser.add_subparsers(dest='command', metavar='<command>')
+    subparsers.required = True
+
+    # 只用于 molink --help 的列表，实际由 main 直接转交 DELEGATED
+    subparsers.add_parser('join', help='加入集群（molink join --help 查看参数）', add_help=False)
+    subparsers.add_parser('quit', help='退出集群（molink quit --help 查看参数）', add_help=False)
+
+    logs = subparsers.add_parser('logs', help='查看集群各节点的日志（经控制平面聚合）',
+                                 formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    logs.add_argument('control_plane', help='控制平面地址 (IP)')
+    logs.add_argument('-n', type=int, default=100, help='每个节点最后n行（指定 --start/--end/--level/--contains 时忽略）')
+    logs.add_argument('--start', help='起始时间')
+    logs.add_argument('--end', help='结束时间')
+    logs.add_argument('--level', help='日志级别')
+    logs.add_argument('--contains', help='包含的文本')
+    logs.add_argument('--nodes', help='节点名列表，逗号分隔，缺省为全部节点')
+    logs.add_argument('--fingerprint', help='控制平面证书的 SHA-256 指纹')
+    logs.set_defaults(func=run_logs)
+
+    status = subparsers.add_parser('status', help='查询节点在集群中的状态',
+                                   formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    status.add_argument('control_plane', help='控制平面地址 (IP)')
+    status.add_argument('--node', help='节点名称，缺省为本机')
+    status.add_argument('--fingerprint', help='控制平面证书的 SHA-256 指纹')
+    status.set_defaults(func=run_status)
+
+    info = subparsers.add_parser('info', help='显示本机硬件信息')
+    info.add_argument('--json', action='store_true', help='输出完整硬件清单(JSON)')
+    info.add_argument('--refresh', action='store_true', help='忽略缓存重新探测')
+    info.set_defaults(func=run_info)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # argparse.REMAINDER 无法透传以 - 开头的第一个参数（如 --help），join/quit 在解析前转交
+    if argv and argv[0] in DELEGATED:
+        return DELEGATED[argv[0]](argv[1:])
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
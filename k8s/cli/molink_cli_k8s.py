@@ -1,36 +1,499 @@
 # molink_log_service.py
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request, Response, stream_with_context
 import os
-from collections import deque
+import json
+import time
+import base64
+import re
+import struct
+import bisect
+import threading
+from array import array
+from datetime import datetime
 
 app = Flask(__name__)
 LOG_FILE = './molink_log.txt'
 PORT = 12000
+BLOCK_SIZE = 64 * 1024
+MAX_LINES = 10000
+MAX_READ_BYTES = 4 * 1024 * 1024  # 单次增量读取的上限
+FOLLOW_INTERVAL = 0.5  # seconds
+HEARTBEAT_INTERVAL = 15  # seconds
+INDEX_FILE = LOG_FILE + '.idx'
+INDEX_EVERY = 256  # 每隔多少行记录一个索引点
+INDEX_POLL_INTERVAL = 1.0  # seconds，后台索引线程检查日志增长的周期
+INDEX_PUBLISH_BYTES = 64 * 1024 * 1024  # 扫描大文件时每隔这么多字节发布一次索引，查询可先使用已扫描的部分
+QUERY_LIMIT = 1000
 
-def get_last_n_lines(n=10):
-    """获取日志文件最后n行"""
+def encode_cursor(stat, offset):
+    """游标 = 文件身份(dev, inode) + 字节偏移，对客户端不透明"""
+    raw = f"{stat.st_dev}:{stat.st_ino}:{offset}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor):
+    try:
+        dev, ino, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split(':')
+        return int(dev), int(ino), int(offset)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def get_last_n_lines(n=10, path=None):
+    """从文件末尾按块反向读取最后n行，只读取约n行对应的字节
+
+    返回 (lines, cursor)，文件不存在时返回 (None, None)。
+    """
     try:
-        with open(LOG_FILE, 'r') as f:
-            return list(deque(f, maxlen=n))
+        with open(path or LOG_FILE, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            end = stat.st_size
+            pos = end
+            data = b''
+            # 多读一个换行符，保证第一行是完整的
+            while pos > 0 and data.count(b'\n') <= n:
+                step = min(BLOCK_SIZE, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
     except FileNotFoundError:
+        return None, None
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    if pos > 0 and lines:
+        lines = lines[1:]
+    return lines[-n:] if n > 0 else [], encode_cursor(stat, end)
+
+def read_since(cursor, path=None, max_bytes=MAX_READ_BYTES):
+    """读取游标之后新增的完整行，返回 (lines, new_cursor, reset)
+
+    文件被轮转（inode 变化）或截断（大小小于偏移）时从新文件开头读取，reset 为 True。
+    """
+    decoded = decode_cursor(cursor)
+    try:
+        with open(path or LOG_FILE, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            reset = (
+                decoded is None
+                or (decoded[0], decoded[1]) != (stat.st_dev, stat.st_ino)
+                or decoded[2] > stat.st_size
+            )
+            offset = 0 if reset else decoded[2]
+            f.seek(offset)
+            data = f.read(max_bytes)
+    except FileNotFoundError:
+        return None, cursor, False
+    # 只返回以换行结尾的完整行，半行留到下次
+    complete = data.rfind(b'\n') + 1
+    if complete == 0 and len(data) == max_bytes:
+        complete = len(data)
+    lines = data[:complete].decode('utf-8', errors='replace').splitlines()
+    return lines, encode_cursor(stat, offset + complete), reset
+
+# 时间戳只在行首附近匹配：ISO 风格 "2025-03-12 10:23:45,123" 与 vLLM 风格 "INFO 03-12 10:23:45"
+TS_ISO = re.compile(rb'(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2}):(\d{2})(?:[.,](\d{1,6}))?')
+TS_SHORT = re.compile(rb'^(?:[A-Z]+\s+)?(\d{2})-(\d{2}) (\d{2}):(\d{2}):(\d{2})')
+LEVEL_RE = re.compile(rb'\b(DEBUG|INFO|WARNING|WARN|ERROR|CRITICAL|FATAL)\b')
+LEVELS = {b'DEBUG': 10, b'INFO': 20, b'WARN': 30, b'WARNING': 30, b'ERROR': 40, b'CRITICAL': 50, b'FATAL': 50}
+
+def parse_line_ts(line):
+    head = line[:64]
+    m = TS_ISO.search(head)
+    try:
+        if m:
+            year, month, day, hour, minute, second = (int(g) for g in m.groups()[:6])
+            frac = float(b'0.' + m.group(7)) if m.group(7) else 0.0
+        else:
+            m = TS_SHORT.match(head)
+            if not m:
+                return None
+            year = datetime.now().year
+            month, day, hour, minute, second = (int(g) for g in m.groups())
+            frac = 0.0
+        return datetime(year, month, day, hour, minute, second).timestamp() + frac
+    except ValueError:
+        return None
+
+def line_timestamps(lines):
+    """每行的时间戳（epoch 秒），续行沿用上一行；控制平面按它合并各节点的日志"""
+    result = []
+    ts = None
+    for line in lines:
+        line_ts = parse_line_ts(line.encode('utf-8', errors='replace'))
+        ts = line_ts if line_ts is not None else ts
+        result.append(ts)
+    return result
+
+def parse_line_level(line):
+    m = LEVEL_RE.search(line[:64])
+    return LEVELS[m.group(1)] if m else None
+
+def parse_query_time(value):
+    """支持 epoch 秒或 ISO 格式时间"""
+    if value in (None, ''):
         return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+class LogIndex:
+    """molink_log.txt 的稀疏索引：每 INDEX_EVERY 行记录 (字节偏移, 时间戳)
+
+    索引文件为定长头部 + '<qd' 定长记录，随日志增长只追加新记录；
+    日志被轮转或截断时整体重建。索引由后台线程（start）随日志增长更新，
+    查询只读取已建立索引的范围，不在请求中扫描日志。
+    """
+
+    HEADER = struct.Struct('<8sQQQQdI')
+    ENTRY = struct.Struct('<qd')
+    MAGIC = b'MLIDX1\0\0'
+
+    def __init__(self, log_path, index_path, every=INDEX_EVERY):
+        self.log_path = log_path
+        self.index_path = index_path
+        self.every = every
+        self.lock = threading.Lock()  # 保护已发布的索引，只在发布与读取时短暂持有
+        self.update_lock = threading.Lock()  # 同一时间只有一个线程扫描日志
+        self._stop = threading.Event()
+        self._thread = None
+        self._reset(None)
+        self._load()
+
+    def start(self, interval=INDEX_POLL_INTERVAL):
+        with self.lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='log-index', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.update()
+            except Exception as e:
+                app.logger.warning(f"更新日志索引失败: {str(e)}")
+            self._stop.wait(interval)
+
+    def _reset(self, stat):
+        self.dev = stat.st_dev if stat else 0
+        self.ino = stat.st_ino if stat else 0
+        self.scanned = 0
+        self.lines = 0
+        self.last_ts = float('-inf')
+        self.offsets = array('q')
+        self.timestamps = array('d')
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(self.HEADER.size)
+                magic, dev, ino, scanned, lines, last_ts, every = self.HEADER.unpack(header)
+                if magic != self.MAGIC or every != self.every:
+                    return
+                body = f.read()
+        except (OSError, struct.error):
+            return
+        body = body[:len(body) - len(body) % self.ENTRY.size]
+        for offset, ts in self.ENTRY.iter_unpack(body):
+            self.offsets.append(offset)
+            self.timestamps.append(ts)
+        self.dev, self.ino, self.scanned, self.lines, self.last_ts = dev, ino, scanned, lines, last_ts
+
+    def _save(self, new_entries, rewrite):
+        header = self.HEADER.pack(
+            self.MAGIC, self.dev, self.ino, self.scanned, self.lines, self.last_ts, self.every
+        )
+        mode = 'wb' if rewrite or not os.path.exists(self.index_path) else 'r+b'
+        with open(self.index_path, mode) as f:
+            f.write(header)
+            if rewrite or mode == 'wb':
+                entries = range(len(self.offsets))
+            else:
+                entries = range(len(self.offsets) - new_entries, len(self.offsets))
+                f.seek(self.HEADER.size + entries.start * self.ENTRY.size)
+            for i in entries:
+                f.write(self.ENTRY.pack(self.offsets[i], self.timestamps[i]))
+
+    def update(self, publish_bytes=INDEX_PUBLISH_BYTES):
+        """把索引追到日志末尾，只扫描上次之后新增的完整行
+
+        扫描时不持有 self.lock，每 publish_bytes 字节发布一次，首次扫描大文件时查询不会被阻塞。
+        """
+        with self.update_lock:
+            try:
+                f = open(self.log_path, 'rb')
+            except FileNotFoundError:
+                return False
+            with f:
+                stat = os.fstat(f.fileno())
+                rewrite = (stat.st_dev, stat.st_ino) != (self.dev, self.ino) or stat.st_size < self.scanned
+                if rewrite:
+                    with self.lock:
+                        self._reset(stat)
+                if stat.st_size == self.scanned and not rewrite:
+                    return True
+                f.seek(self.scanned)
+                offset, lines, last_ts = self.scanned, self.lines, self.last_ts
+                offsets, timestamps = array('q'), array('d')
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    ts = parse_line_ts(line)
+                    if ts is not None:
+                        last_ts = ts
+                    if lines % self.every == 0:
+                        offsets.append(offset)
+                        timestamps.append(last_ts)
+                    lines += 1
+                    offset += len(line)
+                    if offset - self.scanned >= publish_bytes:
+                        self._publish(offset, lines, last_ts, offsets, timestamps, rewrite)
+                        offsets, timestamps = array('q'), array('d')
+                        rewrite = False
+                self._publish(offset, lines, last_ts, offsets, timestamps, rewrite)
+            return True
+
+    def _publish(self, scanned, lines, last_ts, offsets, timestamps, rewrite):
+        with self.lock:
+            self.offsets.extend(offsets)
+            self.timestamps.extend(timestamps)
+            self.scanned, self.lines, self.last_ts = scanned, lines, last_ts
+        try:
+            # 只有扫描线程修改索引，写文件时不需要持有 self.lock
+            self._save(len(offsets), rewrite)
+        except OSError as e:
+            app.logger.warning(f"写入日志索引失败: {str(e)}")
+
+    def indexed(self):
+        """已建立索引的日志文件身份和字节数"""
+        with self.lock:
+            return self.dev, self.ino, self.scanned
+
+    def start_offset(self, start):
+        """二分定位包含 start 时刻的块的起始偏移"""
+        with self.lock:
+            if start is None or not self.offsets:
+                return 0
+            i = bisect.bisect_left(self.timestamps, start)
+            return self.offsets[max(i - 1, 0)]
+
+    def end_offset(self, end, limit_offset):
+        """第一个起始时间晚于 end 的块的偏移，之后的内容都晚于 end"""
+        with self.lock:
+            if end is None:
+                return limit_offset
+            i = bisect.bisect_right(self.timestamps, end)
+            return min(self.offsets[i], limit_offset) if i < len(self.offsets) else limit_offset
+
+    def query(self, start=None, end=None, min_level=None, contains=None, limit=QUERY_LIMIT):
+        """按时间范围、日志级别和子串过滤，按时间顺序逐行产出 (ts, level, line)
+
+        指定 start 时从 start 向后读取，返回最早的匹配行；否则从 end（缺省为末尾）向前读取，返回最近的匹配行。
+        只读取已建立索引的范围。没有时间戳或级别的续行（如异常堆栈）沿用上一行的时间戳和级别。
+        """
+        needle = contains.encode() if contains else None
+        with open(self.log_path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            dev, ino, limit_offset = self.indexed()
+            if (stat.st_dev, stat.st_ino) != (dev, ino):
+                # 日志刚被轮转，等后台线程重建索引
+                return
+            if start is None:
+                upper = self.end_offset(end, limit_offset)
+                yield from self._query_backward(f, upper, end, min_level, needle, limit)
+            else:
+                offset = self.start_offset(start)
+                yield from self._query_forward(f, offset, limit_offset, start, end, min_level, needle, limit)
+
+    def _query_forward(self, f, offset, limit_offset, start, end, min_level, needle, limit):
+        ts = None
+        level = None
+        emitted = 0
+        f.seek(offset)
+        for line in f:
+            if offset >= limit_offset:
+                break
+            offset += len(line)
+            line_ts = parse_line_ts(line)
+            if line_ts is not None:
+                ts = line_ts
+                level = parse_line_level(line)
+            if end is not None and ts is not None and ts > end:
+                break
+            if start is not None and (ts is None or ts < start):
+                continue
+            if min_level is not None and (level is None or level < min_level):
+                continue
+            if needle is not None and needle not in line:
+                continue
+            yield ts, level, line.decode('utf-8', errors='replace').rstrip()
+            emitted += 1
+            if emitted >= limit:
+                break
+
+    def _query_backward(self, f, upper, end, min_level, needle, limit):
+        matches = []  # 从新到旧
+        pending = []  # 已读到、尚未遇到其所属带时间戳行的续行（从新到旧）
+
+        def accept(line, ts, level):
+            if end is not None and ts is not None and ts > end:
+                return
+            if min_level is not None and (level is None or level < min_level):
+                return
+            if needle is not None and needle not in line:
+                return
+            matches.append((ts, level, line.decode('utf-8', errors='replace').rstrip()))
+
+        pos = upper
+        carry = b''
+        while pos > 0 and len(matches) < limit:
+            step = min(BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + carry
+            if pos + step == upper and data.endswith(b'\n'):
+                # upper 位于行尾，去掉最后一个换行符
+                data = data[:-1]
+            lines = data.split(b'\n')
+            # 第一段可能从上一块开始，留到下一轮
+            carry = lines.pop(0) if pos > 0 else b''
+            for line in reversed(lines):
+                line_ts = parse_line_ts(line)
+                if line_ts is None:
+                    pending.append(line)
+                    continue
+                level = parse_line_level(line)
+                for candidate in pending + [line]:
+                    accept(candidate, line_ts, level)
+                pending = []
+                if len(matches) >= limit:
+                    break
+        if pos == 0 and len(matches) < limit:
+            # 文件开头没有时间戳的行
+            for line in pending:
+                accept(line, None, None)
+        yield from reversed(matches[:limit])
+
+log_index = None
+log_index_lock = threading.Lock()
+
+def get_log_index():
+    global log_index
+    with log_index_lock:
+        if log_index is None:
+            log_index = LogIndex(LOG_FILE, INDEX_FILE)
+            log_index.start()
+    return log_index
+
+def request_params():
+    params = dict(request.args)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        params.update(body)
+    try:
+        n = max(0, min(int(params.get('n', 10)), MAX_LINES))
+    except (TypeError, ValueError):
+        n = 10
+    return n, params.get('cursor')
 
 @app.route('/molink_log', methods=['POST'])
 def handle_log_request():
-    # 读取日志文件
-    lines = get_last_n_lines(10)
-    
+    n, cursor = request_params()
+    if cursor:
+        # 增量模式：只返回上次游标之后的内容
+        lines, cursor, reset = read_since(cursor)
+    else:
+        lines, cursor = get_last_n_lines(n)
+        reset = False
+
     if lines is None:
         return jsonify({
             "status": "error",
             "message": "Log file not found"
         }), 404
-    
+
     return jsonify({
         "status": "success",
-        "lines": [line.strip() for line in lines]
+        "lines": [line.strip() for line in lines],
+        "ts": line_timestamps(lines),
+        "cursor": cursor,
+        "reset": reset
     })
 
+@app.route('/molink_log/follow', methods=['GET'])
+def follow_log():
+    """以 SSE 推送新增日志行，事件 id 为游标，断线后可用 Last-Event-ID 续传"""
+    n, cursor = request_params()
+    cursor = cursor or request.headers.get('Last-Event-ID')
+
+    def generate():
+        current = cursor
+        if not current:
+            lines, current = get_last_n_lines(n)
+            if lines:
+                yield sse_event(lines, current)
+            # 日志文件尚未创建时，从新文件开头读取
+            current = current or ''
+        last_sent = time.monotonic()
+        while True:
+            lines, current, reset = read_since(current)
+            if lines or reset:
+                yield sse_event(lines or [], current, reset)
+                last_sent = time.monotonic()
+            elif time.monotonic() - last_sent >= HEARTBEAT_INTERVAL:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            time.sleep(FOLLOW_INTERVAL)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route('/molink_log/query', methods=['GET', 'POST'])
+def query_log():
+    """按时间范围/级别/子串查询日志，以 NDJSON 流式返回
+
+    参数: start, end（epoch 秒或 ISO 时间）, level（最低级别，如 WARN）,
+    contains（子串）, limit（最多返回行数）
+    """
+    params = dict(request.args)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        params.update(body)
+    try:
+        start = parse_query_time(params.get('start'))
+        end = parse_query_time(params.get('end'))
+        limit = max(1, min(int(params.get('limit', QUERY_LIMIT)), MAX_LINES))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "Invalid query parameters"}), 400
+    min_level = None
+    if params.get('level'):
+        min_level = LEVELS.get(str(params['level']).upper().encode())
+        if min_level is None:
+            return jsonify({"status": "error", "message": "Invalid level"}), 400
+
+    index = get_log_index()
+    if not os.path.exists(LOG_FILE):
+        return jsonify({
+            "status": "error",
+            "message": "Log file not found"
+        }), 404
+
+    def generate():
+        for ts, level, line in index.query(start, end, min_level, params.get('contains'), limit):
+            yield json.dumps({"ts": ts, "level": level, "line": line}) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def sse_event(lines, cursor, reset=False):
+    payload = json.dumps({"lines": [line.strip() for line in lines], "reset": reset})
+    return f"id: {cursor}\ndata: {payload}\n\n"
+
 if __name__ == '__main__':
+    # 启动时开始建立索引，首次查询无需等待扫描
+    get_log_index()
     # 只监听本地回环地址
-    app.run(host='0.0.0.0', port=PORT)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=PORT, threaded=True)
@@ -0,0 +1,109 @@
+# molink_client.py
+# 控制平面 HTTP 客户端，molink_join_k8s.py 与 molink_quit_k8s.py 共用：
+#   - 整个命令使用同一个 keep-alive 会话，TLS 握手只做一次
+#   - 证书固定：提供控制平面证书的 SHA-256 指纹（控制平面上执行 serve.py --fingerprint）时校验证书，
+#     否则与以前一样不校验
+#   - 瞬时失败按带抖动的指数退避重试，遵守 Retry-After
+#   - 写操作携带 Idempotency-Key，同一操作的重试由控制平面去重
+import os
+import random
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+
+urllib3.disable_warnings()
+
+DEFAULT_PORT = 12000
+FINGERPRINT_ENV = 'MOLINK_CONTROL_PLANE_FINGERPRINT'
+# 控制平面拒绝时尚未处理请求（限流、排队已满），任何请求都可以重试
+REJECTED_STATUS = (429,)
+# 可能已经处理或处理了一半，只有带 Idempotency-Key 的请求和 GET 才重试
+TRANSIENT_STATUS = (409, 500, 502, 503, 504)
+
+def normalize_fingerprint(fingerprint):
+    if not fingerprint:
+        return None
+    return fingerprint.replace(':', '').strip().lower()
+
+def retry_after(response):
+    """Retry-After 头（秒），缺失或不是数字时返回 None"""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class PinnedAdapter(HTTPAdapter):
+    """只接受指定 SHA-256 指纹的证书（自签名证书无法通过 CA 校验）"""
+
+    def __init__(self, fingerprint, **kwargs):
+        self.fingerprint = fingerprint
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['assert_fingerprint'] = self.fingerprint
+        super().init_poolmanager(*args, **kwargs)
+
+class ControlPlaneClient:
+    def __init__(self, host, port=DEFAULT_PORT, fingerprint=None, timeout=10, retries=4, backoff=0.5,
+                 max_backoff=30):
+        self.base_url = f"https://{host}:{port}"
+        self.fingerprint = normalize_fingerprint(fingerprint or os.environ.get(FINGERPRINT_ENV))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        self.session.mount('https://', PinnedAdapter(self.fingerprint) if self.fingerprint else HTTPAdapter())
+
+    def _delay(self, attempt, response=None):
+        # full jitter：并发重试的节点错开，不会同时再次涌向控制平面
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        server_delay = retry_after(response) if response is not None else None
+        if server_delay is not None:
+            delay = min(server_delay, self.max_backoff) + random.uniform(0, self.backoff)
+        return delay
+
+    def request(self, method, route, json=None, idempotency_key=None, timeout=None, retries=None):
+        """发送请求，返回最后一次的响应；重试用尽后的网络错误照常抛出"""
+        retries = self.retries if retries is None else retries
+        headers = {'Idempotency-Key': idempotency_key} if idempotency_key else None
+        idempotent = method == 'GET' or idempotency_key is not None
+        attempt = 0
+        while True:
+            try:
+                # verify 需按请求传入：Session.verify 会被 REQUESTS_CA_BUNDLE 环境变量覆盖；
+                # 固定指纹时由 PinnedAdapter 校验证书
+                response = self.session.request(
+                    method, f"{self.base_url}/{route}", json=json, headers=headers,
+                    verify=False, timeout=timeout or self.timeout
+                )
+            except requests.exceptions.SSLError:
+                # 指纹不匹配不是瞬时错误
+                raise
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if not idempotent or attempt >= retries:
+                    raise
+                delay = self._delay(attempt)
+            else:
+                status = response.status_code
+                retryable = status in REJECTED_STATUS or (idempotent and status in TRANSIENT_STATUS)
+                if not retryable or attempt >= retries:
+                    return response
+                delay = self._delay(attempt, response)
+            attempt += 1
+            time.sleep(delay)
+
+    def post(self, route, payload, idempotent=True, **kwargs):
+        """每次调用是一个操作：生成一个 Idempotency-Key，所有重试共用"""
+        key = uuid.uuid4().hex if idempotent else None
+        return self.request('POST', route, json=payload, idempotency_key=key, **kwargs)
+
+    def get(self, route, **kwargs):
+        return self.request('GET', route, **kwargs)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,289 @@
+# molink_hwprobe.py
+# 节点硬件清单探测：CPU/内存/NUMA/GPU/拓扑/磁盘/网卡。
+# 各探测项并发执行，单项失败不影响其它项；全部成功时结果按 boot_id 缓存到磁盘。
+# proc_root/sys_root 可指向测试用的目录树，便于在没有GPU的机器上验证。
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+CACHE_FILE = os.path.expanduser("~/.cache/molink/hwinfo.json")
+SCHEMA_VERSION = 1
+NVIDIA_VENDOR = "0x10de"
+
+def read_text(path, default=None):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except OSError:
+        return default
+
+def parse_cpulist(text):
+    """'0-3,8-11' -> [0, 1, 2, 3, 8, 9, 10, 11]"""
+    cpus = []
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+def probe_cpu(proc_root, sys_root):
+    model = None
+    logical = 0
+    cores = set()
+    with open(os.path.join(proc_root, "cpuinfo"), "r") as f:
+        physical_id = core_id = None
+        for line in f:
+            key, _, value = line.partition(":")
+            key, value = key.strip(), value.strip()
+            if key == "processor":
+                logical += 1
+            elif key == "model name" and model is None:
+                model = value
+            elif key == "physical id":
+                physical_id = value
+            elif key == "core id":
+                core_id = value
+            elif not key and physical_id is not None and core_id is not None:
+                cores.add((physical_id, core_id))
+                physical_id = core_id = None
+        if physical_id is not None and core_id is not None:
+            cores.add((physical_id, core_id))
+    return {
+        "model": model,
+        "logical": logical,
+        # 部分虚拟机的 cpuinfo 不含 core id，此时物理核数按逻辑核计
+        "physical": len(cores) or logical,
+        "sockets": len({physical_id for physical_id, _ in cores}) or None,
+    }
+
+def probe_memory(proc_root, sys_root):
+    with open(os.path.join(proc_root, "meminfo"), "r") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return {"total_gb": round(int(line.split()[1]) / (1024 ** 2), 2)}
+    raise ValueError("MemTotal not found")
+
+def probe_numa(proc_root, sys_root):
+    nodes = []
+    for path in sorted(glob.glob(os.path.join(sys_root, "devices/system/node/node[0-9]*"))):
+        node = {"id": int(os.path.basename(path)[4:]), "cpus": parse_cpulist(read_text(os.path.join(path, "cpulist")))}
+        meminfo = read_text(os.path.join(path, "meminfo"), "")
+        for line in meminfo.splitlines():
+            if "MemTotal:" in line:
+                node["mem_gb"] = round(int(line.split()[-2]) / (1024 ** 2), 2)
+        nodes.append(node)
+    return nodes
+
+def pci_info(sys_root, bus_id):
+    """从 sysfs 读取 PCIe 链路与 NUMA 信息，bus_id 形如 0000:3b:00.0"""
+    path = os.path.join(sys_root, "bus/pci/devices", bus_id.lower())
+    numa = read_text(os.path.join(path, "numa_node"))
+    return {
+        "numa_node": int(numa) if numa not in (None, "-1") else None,
+        "pcie_link_speed": read_text(os.path.join(path, "current_link_speed")),
+        "pcie_link_width": read_text(os.path.join(path, "current_link_width")),
+    }
+
+def normalize_bus_id(bus_id):
+    # nvidia-smi 输出 00000000:3B:00.0，sysfs 使用 0000:3b:00.0
+    domain, _, rest = bus_id.partition(":")
+    return f"{domain[-4:]}:{rest}".lower()
+
+def probe_gpus(proc_root, sys_root):
+    gpus = []
+    if shutil.which("nvidia-smi"):
+        result = subprocess.run(
+            ["nvidia-smi", "--query-gpu=index,name,memory.total,pci.bus_id,uuid",
+             "--format=csv,noheader,nounits"],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=20, check=True
+        )
+        for line in result.stdout.strip().splitlines():
+            index, name, memory, bus_id, uuid = [field.strip() for field in line.split(",")]
+            gpu = {
+                "index": int(index),
+                "name": name,
+                "memory_mb": int(float(memory)),
+                "pci_bus_id": normalize_bus_id(bus_id),
+                "uuid": uuid,
+            }
+            gpu.update(pci_info(sys_root, gpu["pci_bus_id"]))
+            gpus.append(gpu)
+        return gpus
+    return probe_gpus_sysfs(proc_root, sys_root)
+
+def probe_gpus_sysfs(proc_root, sys_root):
+    """没有可用的 nvidia-smi 时扫描 PCI 设备，只能得到数量与位置"""
+    gpus = []
+    for path in sorted(glob.glob(os.path.join(sys_root, "bus/pci/devices/*"))):
+        if read_text(os.path.join(path, "vendor")) != NVIDIA_VENDOR:
+            continue
+        if not (read_text(os.path.join(path, "class")) or "").startswith("0x03"):
+            continue
+        gpu = {"index": len(gpus), "name": None, "memory_mb": None, "pci_bus_id": os.path.basename(path)}
+        gpu.update(pci_info(sys_root, gpu["pci_bus_id"]))
+        gpus.append(gpu)
+    return gpus
+
+def probe_gpu_topology(proc_root, sys_root):
+    """解析 `nvidia-smi topo -m`，返回 {"GPU0": {"GPU1": "NV12", ...}, ...}"""
+    if not shutil.which("nvidia-smi"):
+        return {}
+    result = subprocess.run(
+        ["nvidia-smi", "topo", "-m"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=20, check=True
+    )
+    lines = [line for line in result.stdout.splitlines() if line.strip()]
+    if not lines:
+        return {}
+    columns = [column for column in lines[0].split() if column.startswith("GPU")]
+    topology = {}
+    for line in lines[1:]:
+        fields = line.split()
+        if not fields or not fields[0].startswith("GPU"):
+            continue
+        links = dict(zip(columns, fields[1:1 + len(columns)]))
+        topology[fields[0]] = {peer: link for peer, link in links.items() if peer != fields[0]}
+    return topology
+
+def probe_disks(proc_root, sys_root):
+    disks = []
+    for path in sorted(glob.glob(os.path.join(sys_root, "block/*"))):
+        name = os.path.basename(path)
+        if name.startswith(("loop", "ram", "zram", "dm-", "sr")):
+            continue
+        sectors = read_text(os.path.join(path, "size"))
+        disks.append({
+            "name": name,
+            "size_gb": round(int(sectors) * 512 / (1000 ** 3), 1) if sectors else None,
+            "rotational": read_text(os.path.join(path, "queue/rotational")) == "1",
+        })
+    return disks
+
+def probe_nics(proc_root, sys_root):
+    nics = []
+    for path in sorted(glob.glob(os.path.join(sys_root, "class/net/*"))):
+        # 只统计物理网卡（有 device 链接）
+        if not os.path.exists(os.path.join(path, "device")):
+            continue
+        speed = read_text(os.path.join(path, "speed"))
+        nics.append({
+            "name": os.path.basename(path),
+            "speed_mbps": int(speed) if speed and speed.lstrip("-").isdigit() and int(speed) > 0 else None,
+            "operstate": read_text(os.path.join(path, "operstate")),
+            "mtu": int(read_text(os.path.join(path, "mtu"), "0")) or None,
+        })
+    return nics
+
+PROBES = {
+    "cpu": probe_cpu,
+    "memory": probe_memory,
+    "numa": probe_numa,
+    "gpus": probe_gpus,
+    "gpu_topology": probe_gpu_topology,
+    "disks": probe_disks,
+    "nics": probe_nics,
+}
+
+def fallback_cpu(proc_root, sys_root):
+    import psutil
+    return {"model": platform.processor() or None, "logical": psutil.cpu_count(),
+            "physical": psutil.cpu_count(logical=False), "sockets": None}
+
+def fallback_memory(proc_root, sys_root):
+    import psutil
+    return {"total_gb": round(psutil.virtual_memory().total / (1024 ** 3), 2)}
+
+FALLBACKS = {"cpu": fallback_cpu, "memory": fallback_memory, "gpus": probe_gpus_sysfs}
+
+def run_probes(proc_root="/proc", sys_root="/sys", probes=None):
+    """并发执行各探测项，失败时尝试 psutil 兜底，错误记录在 errors 中"""
+    probes = probes or PROBES
+    inventory = {"schema": SCHEMA_VERSION, "errors": {}}
+    with ThreadPoolExecutor(max_workers=len(probes)) as pool:
+        futures = {key: pool.submit(probe, proc_root, sys_root) for key, probe in probes.items()}
+        for key, future in futures.items():
+            try:
+                inventory[key] = future.result()
+                continue
+            except Exception as e:
+                inventory["errors"][key] = str(e)
+            if key in FALLBACKS:
+                try:
+                    inventory[key] = FALLBACKS[key](proc_root, sys_root)
+                except Exception as e:
+                    inventory["errors"][key] += f"; fallback: {e}"
+            inventory.setdefault(key, None)
+    return inventory
+
+def probe_inventory(proc_root="/proc", sys_root="/sys", cache_file=CACHE_FILE, refresh=False):
+    """返回硬件清单；同一次开机内直接读取磁盘缓存
+
+    有探测项失败（包括兜底成功的）时不写缓存，nvidia-smi 等的临时故障不会保留到下次开机。
+    """
+    boot_id = read_text(os.path.join(proc_root, "sys/kernel/random/boot_id"))
+    if cache_file and boot_id and not refresh:
+        try:
+            with open(cache_file, "r") as f:
+                cached = json.load(f)
+            if cached.get("boot_id") == boot_id and cached.get("schema") == SCHEMA_VERSION:
+                return cached
+        except (OSError, ValueError):
+            pass
+
+    inventory = run_probes(proc_root, sys_root)
+    inventory["boot_id"] = boot_id
+    if cache_file and boot_id and not inventory["errors"]:
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            tmp = f"{cache_file}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(inventory, f)
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass
+    return inventory
+
+def summarize(inventory):
+    """生成与 node 表对应的汇总字段（num_cpu, size_mem, num_gpu, gpu_type）
+
+    gpu_type 为数量最多的型号（数量相同时按名称），控制平面按它过滤节点；
+    混合GPU节点的全部型号放在 gpu_mix 中，如 "NVIDIA A100 x2, NVIDIA GeForce RTX 4090 x1"。
+    """
+    gpus = inventory.get("gpus") or []
+    names = sorted(Counter(gpu.get("name") or "unknown" for gpu in gpus).items(),
+                   key=lambda item: (-item[1], item[0]))
+    return {
+        "num_cpu": (inventory.get("cpu") or {}).get("physical"),
+        "size_mem": (inventory.get("memory") or {}).get("total_gb"),
+        "num_gpu": len(gpus),
+        "gpu_type": names[0][0] if names else None,
+        "gpu_mix": ", ".join(f"{name} x{count}" for name, count in names) if len(names) > 1 else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='MoLink节点硬件清单探测',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--proc-root', default='/proc', help='proc 文件系统根目录')
+    parser.add_argument('--sys-root', default='/sys', help='sys 文件系统根目录')
+    parser.add_argument('--refresh', action='store_true', help='忽略缓存重新探测')
+    parser.add_argument('--no-cache', action='store_true', help='不读写磁盘缓存')
+    args = parser.parse_args()
+
+    inventory = probe_inventory(
+        args.proc_root, args.sys_root,
+        cache_file=None if args.no_cache else CACHE_FILE, refresh=args.refresh
+    )
+    print(json.dumps({"summary": summarize(inventory), "inventory": inventory}, indent=2, ensure_ascii=False))
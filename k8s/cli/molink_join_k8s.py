@@ -1,15 +1,19 @@
 import argparse
-import requests
 import subprocess
 import json
 import socket
-import psutil
 import platform
-import GPUtil
 import os
-import urllib3
+import sys
+import time
+import shutil
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-urllib3.disable_warnings()
+from molink_hwprobe import probe_inventory, summarize
+
+# 与控制平面 Config.MaxBatchSize 一致
+BATCH_SIZE = 200
 
 def get_local_ip():
     try:
@@ -28,42 +32,124 @@ def get_system_info():
     system_info['name'] = platform.node()
     system_info['ip'] = get_local_ip()
 
-    
-    # 获取 CPU 核数
-    system_info['num_cpu'] = psutil.cpu_count(logical=False)
-    
-    # 获取主存大小
-    virtual_memory = psutil.virtual_memory()
-    system_info['size_mem'] = round(float(virtual_memory.total / (1024 ** 3)), 2)
-    
-    # 获取 GPU 卡数和 GPU 型号
-    gpus = GPUtil.getGPUs()
-    system_info['num_gpu'] = len(gpus)
-    system_info['gpu_type'] = gpus[0].name
+    # 完整硬件清单（CPU/内存/NUMA/各GPU/拓扑/磁盘/网卡），同一次开机内读取缓存
+    inventory = probe_inventory()
+    system_info.update(summarize(inventory))
+    system_info['inventory'] = inventory
     return system_info
 
-def join_cluster(args):
-    """执行加入集群流程"""
+def start_netprobe(control_plane, folder_path):
+    """在后台启动网络测量代理（molink_netprobe.py），输出写入 molink_log/netprobe.log"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "molink_netprobe.py")
+    log_file = open(os.path.join(folder_path, "netprobe.log"), "a")
+    subprocess.Popen(
+        [sys.executable, script, control_plane],
+        stdout=log_file,
+        stderr=subprocess.STDOUT,
+        stdin=subprocess.DEVNULL,
+        start_new_session=True
+    )
+    log_file.close()
+
+class PhaseTimer:
+    """用单调时钟记录各阶段耗时（秒），可在多个线程中使用"""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.monotonic() - start, 4)
+
+    def run(self, name, func, *args):
+        with self.phase(name):
+            return func(*args)
+
+def preflight_checks():
+    """本地预检，只返回警告，不阻断加入流程（kubeadm 自身也会检查）"""
+    warnings = []
+    if shutil.which('kubeadm') is None:
+        warnings.append("未找到 kubeadm 命令")
+    if hasattr(os, 'geteuid') and os.geteuid() != 0:
+        warnings.append("当前不是root用户")
+    try:
+        with open('/proc/swaps', 'r') as f:
+            if len(f.read().strip().splitlines()) > 1:
+                warnings.append("swap 未关闭")
+    except OSError:
+        pass
+    return warnings
+
+def setup_log_folder(control_plane):
+    folder_name = "molink_log"
+    control_plane_log = "control_plane.txt"
+    molink_log = "log.txt"
+    current_path = os.getcwd()
+    folder_path = os.path.join(current_path, folder_name)
+
+    # 检查目标文件夹是否存在，如果不存在则创建
+    os.makedirs(folder_path, exist_ok=True)
+
+    file_path = os.path.join(folder_path, control_plane_log)
+
+    with open(file_path, "w") as file:
+        file.write(f"control plane at: {control_plane}")
+
+    file_path = os.path.join(folder_path, molink_log)
+
+    with open(file_path, "w") as file:
+        file.write("")
+
+    return folder_path
+
+def join_cluster(args, client, failure):
+    """执行加入集群流程
+
+    硬件探测、本地预检与日志目录准备与 kubeadm join 并行执行；
+    各阶段耗时随节点信息一起上报控制平面。失败时在 failure 中记录阶段、错误与已有耗时。
+    """
+    import requests
+
+    timer = PhaseTimer()
+    failure["timings"] = timer.timings
+    stage = 'auth'
+    join_start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=3)
+    # 与认证、kubeadm join 无依赖的工作提前开始
+    probe_future = executor.submit(timer.run, 'hardware_probe', get_system_info)
+    preflight_future = executor.submit(timer.run, 'preflight', preflight_checks)
+
     # 认证请求
-    auth_url = f"https://{args.control_plane}:12000/k8s"
     auth_data = {
         "token": args.token,
         "hash": args.hash,
         "username": args.username,
-        "user_password": args.password
+        "user_password": args.password,
+        "node_name": platform.node()
     }
     
     try:
         # 发送认证请求
-        auth_resp = requests.post(auth_url, json=auth_data, verify=False, timeout=10)
-        auth_resp.raise_for_status()
-        auth_result = auth_resp.json()
+        with timer.phase('auth'):
+            auth_resp = client.post('k8s', auth_data)
+            auth_resp.raise_for_status()
+            auth_result = auth_resp.json()
         
         if auth_result.get('status') != '200 OK':
             print(f"认证失败: {auth_result.get('error', '未知错误')}")
+            failure["error"] = f"认证失败: {auth_result.get('error', '未知错误')}"
             return False
 
+        # 会话令牌用于后续 /k8s_complete，免去服务端再次查库和密码校验
+        session_token = auth_result.get('session_token')
+        failure["session_token"] = session_token
+
         print("认证成功，正在加入集群...")
+        folder_future = executor.submit(timer.run, 'log_setup', setup_log_folder, args.control_plane)
         
         # 执行kubeadm join
         cmd = [
@@ -71,105 +157,184 @@ def join_cluster(args):
             '--token', args.token,
             '--discovery-token-ca-cert-hash', args.hash
         ]
-        result = subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=300
-        )
+        stage = 'kubeadm_join'
+        with timer.phase('kubeadm_join'):
+            result = subprocess.run(
+                cmd,
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                timeout=300
+            )
         print("成功加入集群")
 
+        for warning in preflight_future.result():
+            print(f"预检警告: {warning}")
+
         # 收集硬件信息
-        hardware_info = get_system_info()
+        stage = 'hardware_probe'
+        hardware_info = probe_future.result()
         print("\n硬件信息收集完成:")
         for k, v in hardware_info.items():
-            print(f"{k:>12}: {v}")
+            if k != 'inventory':
+                print(f"{k:>12}: {v}")
 
-        # 发送完成通知
-        complete_url = f"https://{args.control_plane}:12000/k8s_complete"
+        folder_path = folder_future.result()
+        print(f"日志目录 '{folder_path}' 已就绪。")
+
+        # 发送完成通知；kubeadm join 已完成，瞬时失败只重试上报（Idempotency-Key 保证只登记一次）
+        stage = 'complete'
         complete_data = {
             "username": args.username,
             "hardware_info": hardware_info
         }
-        complete_resp = requests.post(
-            complete_url, 
-            json=complete_data, 
-            verify=False,
-            timeout=10
-        )
-        complete_resp.raise_for_status()
-        print("\n节点信息已成功上报")
-
-        folder_name = "molink_log"
-        control_plane_log = "control_plane.txt"
-        molink_log = "log.txt"
-        current_path = os.getcwd()
-        folder_path = os.path.join(current_path, folder_name)
-
-        # 检查目标文件夹是否存在，如果不存在则创建
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-            print(f"文件夹 '{folder_name}' 已创建。")
+        if session_token:
+            complete_data["session_token"] = session_token
         else:
-            print(f"文件夹 '{folder_name}' 已存在。")
-
-        file_path = os.path.join(folder_path, control_plane_log)
-
-        with open(file_path, "w") as file:
-            file.write(f"control plane at: {args.control_plane}")
-
-        print(f"文件 '{control_plane_log}' 已在文件夹 '{folder_name}' 中创建。")
-
-        file_path = os.path.join(folder_path, molink_log)
+            # 控制平面未签发会话令牌时，用户名密码同样需要校验
+            complete_data["user_password"] = args.password
+        with timer.phase('complete'):
+            # total 只统计到上报之前，complete 阶段本身无法随本次请求上报
+            complete_data["timings"] = dict(timer.timings, total=round(time.monotonic() - join_start, 4))
+            complete_resp = client.post('k8s_complete', complete_data)
+            complete_resp.raise_for_status()
+        print("\n节点信息已成功上报")
 
-        with open(file_path, "w") as file:
-            file.write("")
+        if session_token:
+            # 供 molink_quit_k8s.py 在令牌有效期内免密退出
+            file_path = os.path.join(folder_path, "session_token.txt")
+            with open(file_path, "w") as file:
+                file.write(session_token)
+            os.chmod(file_path, 0o600)
 
-        print(f"文件 '{molink_log}' 已在文件夹 '{folder_name}' 中创建。")
+        if not args.no_netprobe:
+            start_netprobe(args.control_plane, folder_path)
+            print("网络测量代理已在后台启动")
 
+        print("\n各阶段耗时:")
+        for name, seconds in timer.timings.items():
+            print(f"{name:>16}: {seconds:.2f}s")
         return True
 
     except requests.exceptions.RequestException as e:
         print(f"网络请求失败: {str(e)}")
+        failure["error"] = f"网络请求失败: {str(e)}"
     except subprocess.CalledProcessError as e:
         print(f"命令执行失败: {e.stderr}")
+        failure["error"] = f"命令执行失败: {e.stderr}"
     except Exception as e:
         print(f"发生未知错误: {str(e)}")
+        failure["error"] = f"发生未知错误: {str(e)}"
+    finally:
+        failure["stage"] = stage
+        executor.shutdown(wait=False)
     
     return False
 
-if __name__ == "__main__":
+def report_failure(client, args, failure):
+    """向控制平面 /k8s_fail 报告失败的阶段与错误；报告失败只打印提示，不影响退出码"""
+    import requests
+
+    failure_data = {
+        "username": args.username,
+        "hardware_info": get_system_info(),
+        "stage": failure.get("stage"),
+        "error": failure.get("error"),
+        "timings": failure.get("timings"),
+    }
+    if failure.get("session_token"):
+        failure_data["session_token"] = failure["session_token"]
+    try:
+        client.post('k8s_fail', failure_data).raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"向控制平面报告失败信息时出错: {str(e)}")
+
+def complete_batch(args, client):
+    """批量上报节点信息（例如整机架上线时），文件内容为节点记录列表:
+    [{"username": 可选, "hardware_info": {...}}, ...] 或直接是 hardware_info 列表
+
+    按 BATCH_SIZE 分批提交；记录中的 username 只有管理员账号可以指定为其他用户。
+    """
+    import requests
+
+    with open(args.complete_batch, "r") as f:
+        records = json.load(f)
+    if isinstance(records, dict):
+        records = records.get("nodes", [])
+    nodes = [
+        record if "hardware_info" in record else {"hardware_info": record}
+        for record in records
+    ]
+
+    registered = 0
+    ok = True
+    for start in range(0, len(nodes), BATCH_SIZE):
+        chunk = nodes[start:start + BATCH_SIZE]
+        batch_data = {"username": args.username, "user_password": args.password, "nodes": chunk}
+        try:
+            resp = client.post('k8s_complete_batch', batch_data, timeout=60)
+            result = resp.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"网络请求失败: {str(e)}")
+            return False
+        if "results" not in result:
+            print(f"批量上报失败: {result.get('error', resp.status_code)}")
+            return False
+
+        for item in result["results"]:
+            status = item.get("status")
+            detail = "" if status == "registered" else f" ({item.get('error', '未知错误')})"
+            print(f"{str(item.get('name')):>24}: {status}{detail}")
+        registered += result.get("registered", 0)
+        ok = ok and resp.status_code == 200
+    print(f"\n成功 {registered} 个，失败 {len(nodes) - registered} 个")
+    return ok
+
+def main(argv=None, prog=None):
     parser = argparse.ArgumentParser(
+        prog=prog,
         description='Kubernetes节点加入客户端',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     parser.add_argument('control_plane', help='控制平面地址（IP:端口）')
-    parser.add_argument('token', help='加入令牌')
-    parser.add_argument('hash', help='CA证书哈希值')
-    parser.add_argument('username', help='认证用户名')
-    parser.add_argument('password', help='认证密码')
+    parser.add_argument('token', nargs='?', help='加入令牌')
+    parser.add_argument('hash', nargs='?', help='CA证书哈希值')
+    parser.add_argument('username', nargs='?', help='认证用户名')
+    parser.add_argument('password', nargs='?', help='认证密码')
+    parser.add_argument('--complete-batch', metavar='FILE',
+                        help='不执行加入流程，批量上报文件中的节点硬件信息')
+    parser.add_argument('--batch-username', help='批量上报使用的用户名，缺省为 username 参数')
+    parser.add_argument('--batch-password', help='批量上报使用的密码，缺省为 password 参数')
+    parser.add_argument('--no-netprobe', action='store_true', help='加入后不启动网络测量代理')
+    parser.add_argument('--fingerprint',
+                        help='控制平面证书的 SHA-256 指纹（serve.py --fingerprint），缺省读取 MOLINK_CONTROL_PLANE_FINGERPRINT')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    # requests 较重，解析完参数再导入，--help 与参数错误不需要它
+    from molink_client import ControlPlaneClient
+    client = ControlPlaneClient(args.control_plane, fingerprint=args.fingerprint)
+
+    if args.complete_batch:
+        args.username = args.batch_username or args.username
+        args.password = args.batch_password or args.password
+        if not args.username or not args.password:
+            parser.error('批量上报需要提供 --batch-username 与 --batch-password')
+        return 0 if complete_batch(args, client) else 1
+    if not all([args.token, args.hash, args.username, args.password]):
+        parser.error('加入集群需要提供 token hash username password')
     
-    if not join_cluster(args):
-        hardware_info = get_system_info()
-        failure_url = f"https://{args.control_plane}:12000/k8s_fail"
-        failure_data = {
-            "username": args.username,
-            "hardware_info": hardware_info
-        }
-        failure_resp = requests.post(
-            failure_url, 
-            json=failure_data, 
-            verify=False,
-            timeout=10
-        )
+    failure = {}
+    if not join_cluster(args, client, failure):
+        report_failure(client, args, failure)
 
         print("\n节点加入流程失败，请检查：")
         print("1. 网络连接是否正常")
         print("2. 令牌和哈希值是否有效")
         print("3. 用户名密码是否正确")
         print("4. 是否具有root权限")
-        exit(1)
\ No newline at end of file
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,190 @@
+# molink_netprobe.py
+# 轻量网络测量代理：加入集群后常驻运行。
+# 1. 在 PROBE_PORT 上提供 TCP 测量服务（ping 回显 / 吞吐吸收），供其它节点测量本节点；
+# 2. 每轮向控制平面领取少量对端（默认最多 8 个），测量到各对端的 RTT 和吞吐、到控制平面的 RTT，批量上报。
+#    到控制平面的吞吐测量会让所有节点向控制平面上传数据，默认关闭（--control-plane-throughput-bytes）。
+import argparse
+import json
+import platform
+import random
+import socket
+import socketserver
+import statistics
+import struct
+import threading
+import time
+
+import requests
+import urllib3
+
+urllib3.disable_warnings()
+
+PROBE_PORT = 12002
+CONTROL_PLANE_PORT = 12000
+PING_COUNT = 5
+THROUGHPUT_BYTES = 4 * 1024 * 1024
+MAX_THROUGHPUT_BYTES = 64 * 1024 * 1024
+CHUNK = 64 * 1024
+
+class ProbeHandler(socketserver.BaseRequestHandler):
+    """协议: b'P' + 8字节 -> 回显8字节；b'T' + 8字节长度 + 数据 -> 读完后回复 b'K'"""
+
+    delay = 0.0
+
+    def handle(self):
+        conn = self.request
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn.settimeout(30)
+        try:
+            while True:
+                command = conn.recv(1)
+                if not command:
+                    return
+                if command == b'P':
+                    payload = recv_exact(conn, 8)
+                    if self.delay:
+                        # 在回环上模拟链路时延
+                        time.sleep(self.delay)
+                    conn.sendall(payload)
+                elif command == b'T':
+                    (length,) = struct.unpack('!Q', recv_exact(conn, 8))
+                    if length > MAX_THROUGHPUT_BYTES:
+                        return
+                    remaining = length
+                    while remaining:
+                        chunk = conn.recv(min(CHUNK, remaining))
+                        if not chunk:
+                            return
+                        remaining -= len(chunk)
+                    conn.sendall(b'K')
+                else:
+                    return
+        except (OSError, ValueError):
+            return
+
+class ProbeServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def recv_exact(conn, size):
+    data = b''
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ValueError("connection closed")
+        data += chunk
+    return data
+
+def start_server(port=PROBE_PORT, delay_ms=0.0, host='0.0.0.0'):
+    handler = type('DelayedProbeHandler', (ProbeHandler,), {'delay': delay_ms / 1000})
+    server = ProbeServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='netprobe-server', daemon=True).start()
+    return server
+
+def measure_peer(ip, port, ping_count=PING_COUNT, throughput_bytes=THROUGHPUT_BYTES, timeout=5):
+    """返回 {"rtt_ms", "mbps"}：RTT 取多次应用层 ping 的中位数，吞吐为发送固定字节数的速率"""
+    with socket.create_connection((ip, port), timeout=timeout) as conn:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        samples = []
+        for _ in range(ping_count):
+            payload = struct.pack('!d', time.time())
+            start = time.perf_counter()
+            conn.sendall(b'P' + payload)
+            recv_exact(conn, 8)
+            samples.append((time.perf_counter() - start) * 1000)
+        result = {"rtt_ms": round(statistics.median(samples), 3)}
+        if throughput_bytes:
+            block = b'\0' * CHUNK
+            start = time.perf_counter()
+            conn.sendall(b'T' + struct.pack('!Q', throughput_bytes))
+            remaining = throughput_bytes
+            while remaining:
+                size = min(CHUNK, remaining)
+                conn.sendall(block[:size])
+                remaining -= size
+            recv_exact(conn, 1)
+            elapsed = time.perf_counter() - start
+            result["mbps"] = round(throughput_bytes * 8 / elapsed / 1e6, 1)
+    return result
+
+def measure_control_plane(session, control_plane, throughput_bytes=0, timeout=10, port=CONTROL_PLANE_PORT):
+    """到控制平面：TCP 建连时间作为 RTT；throughput_bytes 非 0 时向 /netprobe/sink 上传数据测吞吐"""
+    samples = []
+    for _ in range(PING_COUNT):
+        start = time.perf_counter()
+        with socket.create_connection((control_plane, port), timeout=timeout):
+            samples.append((time.perf_counter() - start) * 1000)
+    result = {"rtt_ms": round(statistics.median(samples), 3)}
+    if throughput_bytes:
+        body = b'\0' * throughput_bytes
+        start = time.perf_counter()
+        resp = session.post(f"https://{control_plane}:{port}/netprobe/sink", data=body, verify=False, timeout=timeout)
+        resp.raise_for_status()
+        result["mbps"] = round(throughput_bytes * 8 / (time.perf_counter() - start) / 1e6, 1)
+    return result
+
+def run_round(session, args, node_name):
+    base = f"https://{args.control_plane}:{args.control_plane_port}"
+    measurements = []
+    try:
+        result = measure_control_plane(
+            session, args.control_plane, args.control_plane_throughput_bytes, port=args.control_plane_port
+        )
+        measurements.append(dict(peer="control-plane", **result))
+    except (OSError, requests.exceptions.RequestException) as e:
+        print(f"控制平面测量失败: {e}")
+
+    resp = session.get(f"{base}/netprobe/peers", params={"node": node_name, "k": args.peers}, verify=False, timeout=10)
+    resp.raise_for_status()
+    for peer in resp.json().get("peers", []):
+        try:
+            result = measure_peer(peer["ip"], peer.get("port", PROBE_PORT), throughput_bytes=args.throughput_bytes)
+            measurements.append(dict(peer=peer["name"], **result))
+        except (OSError, ValueError) as e:
+            print(f"测量 {peer['name']} 失败: {e}")
+
+    if measurements:
+        resp = session.post(
+            f"{base}/netprobe/report",
+            json={"node": node_name, "measurements": measurements},
+            verify=False,
+            timeout=10
+        )
+        resp.raise_for_status()
+    return measurements
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='MoLink节点网络测量代理',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('control_plane', help='控制平面地址（IP）')
+    parser.add_argument('--control-plane-port', type=int, default=CONTROL_PLANE_PORT, help='控制平面端口')
+    parser.add_argument('--node-name', default=platform.node(), help='本节点名称')
+    parser.add_argument('--port', type=int, default=PROBE_PORT, help='本地测量服务端口')
+    parser.add_argument('--interval', type=float, default=60, help='测量周期（秒）')
+    parser.add_argument('--peers', type=int, default=8, help='每轮最多测量的对端数')
+    parser.add_argument('--throughput-bytes', type=int, default=THROUGHPUT_BYTES, help='到对端的吞吐测量数据量，0 表示只测 RTT')
+    parser.add_argument('--control-plane-throughput-bytes', type=int, default=0,
+                        help='到控制平面的吞吐测量数据量，0 表示只测 RTT；每个节点每轮都会上传这么多数据')
+    parser.add_argument('--simulate-delay-ms', type=float, default=0.0, help='测量服务回复前的人为延迟（测试用）')
+    parser.add_argument('--once', action='store_true', help='只测量一轮并打印结果')
+    args = parser.parse_args()
+    for name in ('throughput_bytes', 'control_plane_throughput_bytes'):
+        if not 0 <= getattr(args, name) <= MAX_THROUGHPUT_BYTES:
+            parser.error(f"--{name.replace('_', '-')} 需在 0 到 {MAX_THROUGHPUT_BYTES} 之间")
+
+    start_server(args.port, args.simulate_delay_ms)
+    session = requests.Session()
+    while True:
+        try:
+            measurements = run_round(session, args, args.node_name)
+            if args.once:
+                print(json.dumps(measurements, indent=2, ensure_ascii=False))
+                break
+        except requests.exceptions.RequestException as e:
+            print(f"上报失败: {e}")
+            if args.once:
+                exit(1)
+        # 加入随机抖动，避免全体节点同时测量
+        time.sleep(args.interval * random.uniform(0.8, 1.2))
@@ -0,0 +1,341 @@
+# molink_prefetch.py
+# 并行、可断点续传、按内容寻址缓存的镜像预取工具，替代 env.sh 中串行的 pull_images。
+# 只依赖标准库，可在安装 Python 依赖之前运行。
+import argparse
+import ftplib
+import hashlib
+import http.client
+import json
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_BASE_URL = "ftp://10.202.210.104:12001/ftp_share"
+DEFAULT_CACHE_DIR = "/var/cache/molink/images"
+DEFAULT_MANIFEST = {
+    "archives": [
+        {"name": "cni.tar"},
+        {"name": "node.tar"},
+        {"name": "molink-release-0.9.tar"},
+    ],
+    "images": [
+        "registry.aliyuncs.com/google_containers/pause:3.9",
+        "registry.aliyuncs.com/google_containers/kube-proxy:v1.28.15",
+        "quay.io/prometheus/node-exporter:v1.8.2",
+        "nvcr.io/nvidia/k8s/dcgm-exporter:3.3.5-3.4.0-ubuntu22.04",
+        "nvcr.io/nvidia/k8s-device-plugin:v0.17.0",
+    ],
+}
+CHUNK_SIZE = 1024 * 1024
+RETRIES = 5
+
+print_lock = threading.Lock()
+
+def log(message):
+    with print_lock:
+        print(message, flush=True)
+
+class DigestMismatch(Exception):
+    pass
+
+def load_manifest(path, base_url):
+    """清单格式: {"base_url": ..., "archives": [{"name", "sha256"}], "images": [...]}"""
+    manifest = dict(DEFAULT_MANIFEST)
+    if path:
+        with open(path, "r") as f:
+            manifest.update(json.load(f))
+    manifest["base_url"] = (base_url or manifest.get("base_url") or DEFAULT_BASE_URL).rstrip("/")
+    return manifest
+
+def fetch_small(url, timeout=10):
+    """读取小文件（如 <name>.sha256），失败返回 None"""
+    try:
+        parsed = urllib.parse.urlparse(url)
+        if parsed.scheme == "ftp":
+            lines = []
+            with ftp_connect(parsed, timeout) as ftp:
+                ftp.retrlines(f"RETR {ftp_path(parsed)}", lines.append)
+            return "\n".join(lines)
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            return resp.read().decode()
+    except (OSError, ftplib.Error, urllib.error.URLError):
+        return None
+
+def remote_stat(url, timeout=10):
+    """远端文件的大小和修改时间，用于判断未提供摘要的归档是否已重新发布；服务端不支持时返回 None"""
+    parsed = urllib.parse.urlparse(url)
+    try:
+        if parsed.scheme == "ftp":
+            with ftp_connect(parsed, timeout) as ftp:
+                size = ftp.size(ftp_path(parsed))
+                mtime = ftp.voidcmd(f"MDTM {ftp_path(parsed)}").split()[-1]
+        else:
+            with urllib.request.urlopen(urllib.request.Request(url, method="HEAD"), timeout=timeout) as resp:
+                size = resp.headers.get("Content-Length")
+                mtime = resp.headers.get("Last-Modified")
+        if size is None or not mtime:
+            return None
+        return {"size": int(size), "mtime": mtime}
+    except (OSError, ValueError, EOFError, ftplib.Error, urllib.error.URLError):
+        return None
+
+def ftp_connect(parsed, timeout):
+    ftp = ftplib.FTP(timeout=timeout)
+    ftp.connect(parsed.hostname, parsed.port or 21)
+    ftp.login(urllib.parse.unquote(parsed.username or "anonymous"), urllib.parse.unquote(parsed.password or ""))
+    ftp.voidcmd("TYPE I")
+    return ftp
+
+def ftp_path(parsed):
+    # 与 curl 一致：URL 中的路径相对于登录目录
+    return urllib.parse.unquote(parsed.path.lstrip("/"))
+
+def download_ftp(parsed, part_path, timeout):
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    with ftp_connect(parsed, timeout) as ftp:
+        total = ftp.size(ftp_path(parsed))
+        if total is not None and offset > total:
+            offset = 0
+        if total is not None and offset == total:
+            return
+        with open(part_path, "ab" if offset else "wb") as f:
+            ftp.retrbinary(f"RETR {ftp_path(parsed)}", f.write, blocksize=CHUNK_SIZE, rest=offset or None)
+
+def download_http(url, part_path, timeout):
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    req = urllib.request.Request(url)
+    if offset:
+        req.add_header("Range", f"bytes={offset}-")
+    try:
+        resp = urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416:
+            # 已经下载完整
+            return
+        raise
+    with resp:
+        # 服务端不支持 Range 时返回 200，需要从头开始
+        mode = "ab" if offset and resp.status == 206 else "wb"
+        length = resp.headers.get("Content-Length")
+        with open(part_path, mode) as f:
+            start = f.tell()
+            shutil.copyfileobj(resp, f, CHUNK_SIZE)
+            received = f.tell() - start
+        # 连接提前关闭时 http.client 不报错，按中断处理，保留 .part 续传
+        if length is not None and received < int(length):
+            raise EOFError(f"连接提前关闭: 收到 {received}/{length} 字节")
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ImageCache:
+    """按 sha256 寻址的本地缓存：blobs/sha256/<digest>，refs/<name> 记录最近一次的摘要
+
+    refs/<name> 同时记录下载时远端的大小和修改时间，未提供摘要的归档据此判断是否需要重新下载。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs", "sha256")
+        self.ref_dir = os.path.join(root, "refs")
+        self.partial_dir = os.path.join(root, "partial")
+        for path in (self.blob_dir, self.ref_dir, self.partial_dir):
+            os.makedirs(path, exist_ok=True)
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest)
+
+    def read_ref(self, name):
+        try:
+            with open(os.path.join(self.ref_dir, name), "r") as f:
+                text = f.read().strip()
+        except OSError:
+            return None
+        try:
+            ref = json.loads(text)
+        except ValueError:
+            # 旧格式只有摘要
+            return {"digest": text}
+        return ref if isinstance(ref, dict) and ref.get("digest") else None
+
+    def lookup(self, name, digest=None, remote=None):
+        """清单给出摘要时按摘要查找；否则按上次记录的引用查找，远端大小或修改时间变化时视为未命中"""
+        if digest is None:
+            ref = self.read_ref(name)
+            if ref is None:
+                return None
+            if remote is not None and (ref.get("size"), ref.get("mtime")) != (remote["size"], remote["mtime"]):
+                return None
+            digest = ref["digest"]
+        path = self.blob_path(digest)
+        return path if os.path.exists(path) else None
+
+    def partial_path(self, name):
+        return os.path.join(self.partial_dir, name + ".part")
+
+    def prepare_partial(self, name, remote):
+        """远端文件与未完成的下载不是同一版本时丢弃 .part，避免把两个版本拼在一起"""
+        part_path = self.partial_path(name)
+        meta_path = part_path + ".meta"
+        if remote is None:
+            return part_path
+        try:
+            with open(meta_path, "r") as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+        if previous != remote and os.path.exists(part_path):
+            os.unlink(part_path)
+        with open(meta_path, "w") as f:
+            json.dump(remote, f)
+        return part_path
+
+    def commit(self, name, part_path, expected=None, remote=None):
+        digest = sha256_file(part_path)
+        if expected and digest != expected:
+            os.unlink(part_path)
+            raise DigestMismatch(f"{name}: sha256 {digest} != {expected}")
+        os.replace(part_path, self.blob_path(digest))
+        if os.path.exists(part_path + ".meta"):
+            os.unlink(part_path + ".meta")
+        ref = {"digest": digest}
+        if remote is not None:
+            ref.update(remote)
+        ref_tmp = os.path.join(self.ref_dir, f".{name}.tmp")
+        with open(ref_tmp, "w") as f:
+            json.dump(ref, f)
+        os.replace(ref_tmp, os.path.join(self.ref_dir, name))
+        return self.blob_path(digest)
+
+def fetch_archive(cache, base_url, archive, timeout, refresh):
+    """下载单个归档（断点续传 + 摘要校验），缓存命中则直接返回"""
+    name = archive["name"]
+    url = f"{base_url}/{name}"
+    expected = archive.get("sha256")
+    if expected is None:
+        text = fetch_small(url + ".sha256", timeout)
+        expected = text.split()[0].lower() if text and text.split() else None
+    remote = None
+    if expected is None:
+        log(f"警告: {name} 未提供 sha256，无法校验完整性")
+        # 没有摘要时按远端大小和修改时间判断缓存是否过期；取不到时沿用上次下载的版本
+        remote = remote_stat(url, timeout)
+    if not refresh or expected:
+        cached = cache.lookup(name, expected, remote)
+        if cached:
+            log(f"缓存命中: {name}")
+            return cached
+
+    parsed = urllib.parse.urlparse(url)
+    part_path = cache.prepare_partial(name, remote)
+    for attempt in range(1, RETRIES + 1):
+        try:
+            log(f"正在下载: {name}" + (f"（第{attempt}次）" if attempt > 1 else ""))
+            if parsed.scheme == "ftp":
+                download_ftp(parsed, part_path, timeout)
+            else:
+                download_http(url, part_path, timeout)
+            return cache.commit(name, part_path, expected, remote)
+        except DigestMismatch as e:
+            log(f"校验失败，重新下载: {e}")
+        except (OSError, EOFError, ftplib.Error, urllib.error.URLError, http.client.HTTPException) as e:
+            # 保留 .part 文件，下次从断点继续
+            log(f"下载中断: {name}: {e}")
+        time.sleep(min(2 ** attempt, 30))
+    raise RuntimeError(f"下载失败: {name}")
+
+def run_ctr(args, dry_run):
+    cmd = ["ctr", "-n", "k8s.io", "images"] + args
+    if dry_run:
+        log("[dry-run] " + " ".join(cmd))
+        return
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+def ctr_error(e):
+    """ctr 失败的原因：非零退出时取 stderr，ctr 不存在或无法执行时取 OSError"""
+    if isinstance(e, subprocess.CalledProcessError):
+        return (e.stderr or "").strip() or f"exit status {e.returncode}"
+    return str(e)
+
+def import_worker(import_queue, errors, dry_run):
+    """串行导入：下载完成一个就导入一个，与其余归档的下载并行"""
+    while True:
+        item = import_queue.get()
+        if item is None:
+            return
+        name, path = item
+        try:
+            log(f"正在导入: {name}")
+            run_ctr(["import", path], dry_run)
+            log(f"导入完成: {name}")
+        except (subprocess.CalledProcessError, OSError) as e:
+            errors.append(f"镜像导入失败: {name}: {ctr_error(e)}")
+
+def prefetch(manifest, cache_dir, jobs=3, pull_jobs=3, timeout=30, refresh=False, dry_run=False):
+    cache = ImageCache(cache_dir)
+    errors = []
+    import_queue = queue.Queue()
+    importer = threading.Thread(target=import_worker, args=(import_queue, errors, dry_run), daemon=True)
+    importer.start()
+
+    def fetch_and_queue(archive):
+        try:
+            import_queue.put((archive["name"], fetch_archive(cache, manifest["base_url"], archive, timeout, refresh)))
+        except Exception as e:
+            errors.append(str(e))
+
+    def pull(image):
+        try:
+            log(f"正在拉取: {image}")
+            run_ctr(["pull", image], dry_run)
+            log(f"拉取完成: {image}")
+        except (subprocess.CalledProcessError, OSError) as e:
+            errors.append(f"镜像拉取失败: {image}: {ctr_error(e)}")
+
+    with ThreadPoolExecutor(max_workers=pull_jobs) as pull_pool:
+        pull_futures = [pull_pool.submit(pull, image) for image in manifest.get("images", [])]
+        with ThreadPoolExecutor(max_workers=jobs) as download_pool:
+            list(download_pool.map(fetch_and_queue, manifest.get("archives", [])))
+        import_queue.put(None)
+        for future in pull_futures:
+            future.result()
+    importer.join()
+    return errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='MoLink镜像预取工具',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--manifest', help='镜像清单(JSON)，缺省使用内置清单')
+    parser.add_argument('--base-url', help=f'归档下载地址，缺省为 {DEFAULT_BASE_URL}')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='本地内容寻址缓存目录')
+    parser.add_argument('--jobs', type=int, default=3, help='并行下载数')
+    parser.add_argument('--pull-jobs', type=int, default=3, help='并行拉取的镜像数')
+    parser.add_argument('--timeout', type=int, default=30, help='网络超时（秒）')
+    parser.add_argument('--refresh', action='store_true', help='未提供摘要的归档也重新下载')
+    parser.add_argument('--dry-run', action='store_true', help='只下载，不调用ctr')
+    args = parser.parse_args()
+
+    manifest = load_manifest(args.manifest, args.base_url)
+    errors = prefetch(
+        manifest, args.cache_dir, jobs=args.jobs, pull_jobs=args.pull_jobs,
+        timeout=args.timeout, refresh=args.refresh, dry_run=args.dry_run
+    )
+    if errors:
+        for error in errors:
+            print(error, file=sys.stderr)
+        sys.exit(1)
+    print("镜像处理完成")
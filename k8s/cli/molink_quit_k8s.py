@@ -1,22 +1,53 @@
 # node_remove.py
 import argparse
-import requests
 import subprocess
 import platform
 import re
 import json
-import urllib3
-
-urllib3.disable_warnings()
+import os
+import sys
+import time
+import base64
 
 def get_node_name():
     """获取当前节点名称（需与k8s集群注册名称一致）"""
     return platform.node().strip()
 
-def remove_from_cluster(args):
+def load_session_token(path=os.path.join("molink_log", "session_token.txt")):
+    """读取加入集群时保存的会话令牌，已过期则返回None"""
+    try:
+        with open(path, "r") as f:
+            token = f.read().strip()
+        body = token.split(".")[0]
+        payload = json.loads(base64.urlsafe_b64decode(body + "=" * (-len(body) % 4)))
+        if payload.get("exp", 0) > time.time():
+            return token
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def wait_for_job(client, job_id, timeout, interval=2):
+    """轮询节点移除任务直到结束，返回最终的任务状态"""
+    deadline = time.monotonic() + timeout
+    last_state = None
+    while True:
+        response = client.get(f"k8s_jobs/{job_id}")
+        response.raise_for_status()
+        job = response.json()
+        if job.get("state") != last_state:
+            last_state = job.get("state")
+            print(f"删除任务状态: {last_state}")
+        if last_state in ("succeeded", "failed"):
+            return job
+        if time.monotonic() > deadline:
+            job["state"] = "timeout"
+            return job
+        time.sleep(interval)
+
+def remove_from_cluster(args, client):
     """执行退出集群流程"""
-    # 构造请求URL
-    delete_url = f"https://{args.master}:12000/k8s_delete"
+    import requests
+
 
     # 获取节点名称
     node_name = get_node_name()
@@ -28,23 +59,31 @@ def remove_from_cluster(args):
         "username": args.username,
         "user_password": args.password
     }
+    session_token = load_session_token()
+    if session_token:
+        payload["session_token"] = session_token
 
-    print(delete_url, node_name, args.username, args.password)
+    print(f"{client.base_url}/k8s_delete", node_name, args.username)
     
 
     try:
-        # 发送删除请求
-        response = requests.post(
-            delete_url,
-            json=payload,
-            verify=False,  # 生产环境应使用有效证书
-            timeout=10
-        )
+        # 发送删除请求（带 Idempotency-Key，超时重试不会重复提交）
+        response = client.post('k8s_delete', payload)
         response.raise_for_status()
         
         # 处理响应
         result = response.json()
-        if response.status_code == 200:
+        if response.status_code == 202:
+            # 控制平面异步执行 cordon/drain/delete，轮询任务结果
+            print(result.get("message"))
+            job = wait_for_job(client, result["job_id"], args.timeout)
+            for step in job.get("steps", []):
+                print(" -", step.get("message"))
+            if job.get("state") != "succeeded":
+                print("删除失败:", job.get("error") or job.get("state"))
+                return False
+            result["message"] = f"节点 {node_name} 删除成功"
+        if response.status_code in (200, 202):
             print("\n[1/2] 集群删除成功:", result.get("message"))
             print("正在执行本地清理...")
             
@@ -66,7 +105,7 @@ def remove_from_cluster(args):
 
     except requests.exceptions.RequestException as e:
         print(f"\n请求失败: {str(e)}")
-        if hasattr(e, 'response') and e.response.text:
+        if getattr(e, 'response', None) is not None and e.response.text:
             print("服务端响应:", e.response.text)
     except subprocess.CalledProcessError as e:
         print(f"\n清理失败: {e.stderr}")
@@ -75,8 +114,9 @@ def remove_from_cluster(args):
     
     return False
 
-if __name__ == "__main__":
+def main(argv=None, prog=None):
     parser = argparse.ArgumentParser(
+        prog=prog,
         description='Kubernetes节点退出工具',
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
@@ -86,17 +126,26 @@ if __name__ == "__main__":
     )
     parser.add_argument('username', help='认证用户名')
     parser.add_argument('password', help='认证密码')
+    parser.add_argument('--timeout', type=int, default=600, help='等待控制平面删除任务完成的最长时间（秒）')
+    parser.add_argument('--fingerprint',
+                        help='控制平面证书的 SHA-256 指纹（serve.py --fingerprint），缺省读取 MOLINK_CONTROL_PLANE_FINGERPRINT')
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    # requests 较重，解析完参数再导入，--help 与参数错误不需要它
+    from molink_client import ControlPlaneClient
+    client = ControlPlaneClient(args.master, fingerprint=args.fingerprint)
     
     print(f"正在从集群 {args.master}:6443 退出节点...")
-    if remove_from_cluster(args):
+    if remove_from_cluster(args, client):
         print("\n操作成功完成！请手动：")
         print("1. 检查网络配置清理")
         print("2. 删除残留的kubeconfig文件")
-    else:
-        print("\n退出流程失败，请检查：")
-        print(f"1. 节点名称是否正确（当前名称：{get_node_name()}）")
-        print("2. 网络连接是否正常")
-        print("3. 认证信息是否正确")
-        exit(1)
\ No newline at end of file
+        return 0
+    print("\n退出流程失败，请检查：")
+    print(f"1. 节点名称是否正确（当前名称：{get_node_name()}）")
+    print("2. 网络连接是否正常")
+    print("3. 认证信息是否正确")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
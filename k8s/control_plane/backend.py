@@ -1,6 +1,4 @@
-from flask import Flask, request, jsonify
-import mysql.connector
-from mysql.connector import errorcode
+from flask import Flask, request, jsonify, g
 import subprocess
 import json
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -8,69 +6,772 @@ import time
 import re
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait
+import hmac
+import hashlib
+import base64
+import threading
+import bisect
+import random
+import uuid
+import math
+import functools
+from collections import deque, OrderedDict
+from array import array
+import tempfile
+import atexit
+from datetime import datetime
 from pathlib import Path
 
+from planner import plan_pipeline, PlanError
+from metrics import LatencyHistogram, Registry, CONTENT_TYPE
+from storage import open_storage, migrate, schema_version, DatabaseError, PoolTimeout, SCHEMA_VERSION
+from kube_informer import KubeClient, NodeInformer, NODE_NOT_READY
+
 class Config:
     ListenAddr = "0.0.0.0:12000"
     Kubeconfig = "/root/.kube/config"
-    DbType = "mysql"
+    DbType = "mysql"  # mysql | sqlite
+    SqlitePath = "/var/lib/molink/dkube.db"  # DbType = "sqlite" 时使用
     DbHost = "127.0.0.1"
     DbPort = 3306
     DbName = "dkube"
     DbUser = "test"
     DbPwd = "zju123123"
     LogMode = True
-    MaxIdleConns = 10
-    MaxOpenConns = 100
-    MaxLifeTime = 30  # seconds
+    MaxIdleConns = 10  # 连接池保持的空闲连接数
+    MaxOpenConns = 100  # 连接数上限，用满后借用方排队等待
+    MaxLifeTime = 30  # seconds，连接存活超过该时间后关闭重建
+    DbPoolTimeout = 5  # seconds，连接池满时借用连接的最长等待时间，超时返回 503
+    DbPingAfterIdle = 5  # seconds，空闲超过该时间的连接借出前先 ping
     AdminUser = "admin"
     AdminPwd = "123456"
+    TokenCacheTTL = 30  # seconds
+    SessionTTL = 600  # seconds
+    MaxSubprocesses = 16  # 异步模式下 kubeadm/kubectl 的并发上限
+    RequestDeadline = 35  # seconds，异步模式下单个请求的截止时间
+    InformerEnabled = True  # 通过 list/watch 同步节点状态到 node.status
+    InformerBatchInterval = 2  # seconds，节点状态变化合并写回数据库的周期
+    MaxBatchSize = 200  # /k8s_complete_batch、/k8s_delete_batch 单次最多处理的节点数
+    HttpSdEnabled = True  # 是否提供 Prometheus http_sd 接口 /sd/<type>
+    MetricsSelfScrape = True  # 把本服务的 /metrics 加入服务发现，由 Prometheus 抓取
+    MetricsSelfTarget = "127.0.0.1"  # Prometheus 与控制平面部署在同一台机器
+    LogServicePort = 12000  # 节点上 molink_cli_k8s.py 日志服务的端口
+    LogFanoutWorkers = 32
+    LogFanoutTimeout = 3  # seconds，单个节点的超时
+    LogFanoutDeadline = 5  # seconds，整个聚合请求的截止时间
+    NodeSnapshotMaxAge = 60  # seconds，快照的最长使用时间（兜底感知库外修改）
+    NodesPageLimit = 1000
+    NetProbePort = 12002  # 节点上 molink_netprobe.py 的测量端口
+    NetProbePeers = 8  # 每个节点每轮测量的对端数量上限
+    NetProbeMaxReport = 256  # 单次上报的最大测量条数
+    NetProbeMaxNodes = 2048  # 测量矩阵容纳的节点数上限（含控制平面）
+    NetProbeSinkMaxBytes = 64 * 1024 * 1024  # /netprobe/sink 接收的请求体上限，与 molink_netprobe.MAX_THROUGHPUT_BYTES 一致
+    # 准入控制：路由 -> (并发上限, 排队上限)，并发上限应小于数据库连接池大小
+    AdmissionLimits = {
+        'k8s': (8, 200),
+        'k8s_complete': (8, 500),
+        'k8s_complete_batch': (2, 20),
+        'k8s_delete': (4, 100),
+        'k8s_delete_batch': (2, 20),
+        'k8s_fail': (2, 50),
+    }
+    AdmissionQueueTimeout = 8  # seconds，排队超过该时间直接拒绝（客户端超时为 10s）
+    RateLimitPerIP = (5, 20)  # (每秒令牌数, 桶容量)
+    RateLimitPerUser = (50, 500)  # 按会话令牌中的用户限流；同一用户可能同时上线整个实验室的节点
+    RateLimitMaxKeys = 100000
+    IdempotencyTTL = 3600  # seconds，按 Idempotency-Key 保存响应的时间
+    IdempotencyMaxKeys = 100000
+    JoinFailureMaxError = 4000  # /k8s_fail 保存的错误信息最大长度
+    RemovalWorkers = 4  # 节点移除任务的并发数
+    RemovalRetries = 3
+    DrainTimeout = 120  # seconds
+    # serve.py 的生产模式：gunicorn gthread 工作进程，证书首次启动时生成并缓存
+    TlsCertFile = "/var/lib/molink/tls/server.crt"
+    TlsKeyFile = "/var/lib/molink/tls/server.key"
+    ServeWorkers = 1  # 移除任务、限流与节点缓存按进程保存，多进程时各自独立
+    ServeThreads = 64
+    ServeKeepAlive = 75  # seconds，空闲 keep-alive 连接的保持时间
+    ServeGracefulTimeout = 60  # seconds，重载时等待进行中的请求和移除任务
+    # 多进程/多实例部署时必须通过环境变量共享同一个密钥
+    SessionSecret = os.environ.get('MOLINK_SESSION_SECRET', '').encode() or os.urandom(32)
 
 app = Flask(__name__)
 
-# MySQL连接池配置
-db_pool = None
+# 进程内指标，由 /metrics 以 Prometheus 文本格式输出
+metrics_registry = Registry()
+request_latency = metrics_registry.histogram(
+    'molink_http_request_duration_seconds', 'HTTP request latency by route', ('route', 'method', 'status')
+)
+db_pool_wait = metrics_registry.histogram(
+    'molink_db_pool_wait_seconds', 'Time spent checking out a database connection'
+)
+db_query_latency = metrics_registry.histogram(
+    'molink_db_query_duration_seconds', 'Database statement latency by statement type', ('statement',)
+)
+subprocess_latency = metrics_registry.histogram(
+    'molink_subprocess_duration_seconds', 'kubeadm/kubectl subprocess duration', ('command', 'result'),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+sd_write_latency = metrics_registry.histogram(
+    'molink_sd_write_duration_seconds', 'Prometheus file-SD write duration', ('type',)
+)
+token_validations = metrics_registry.counter(
+    'molink_token_validations_total', 'Token validations by kind and result', ('kind', 'result')
+)
+join_failures = metrics_registry.counter(
+    'molink_join_failures_total', 'Failed joins reported through /k8s_fail by stage', ('stage',)
+)
+
+# 存储后端（MySQL 连接池或 SQLite），首次使用时创建
+db_storage = None
+db_storage_lock = threading.Lock()
+
+_statement_types = {}
+
+def statement_type(operation):
+    """SQL 语句类型（SELECT/INSERT/...），SQL 都是常量字符串，结果按语句缓存"""
+    kind = _statement_types.get(operation)
+    if kind is None:
+        words = str(operation).split(None, 1)
+        kind = words[0].upper() if words else 'UNKNOWN'
+        if len(_statement_types) < 1024:
+            _statement_types[operation] = kind
+    return kind
+
+class TimedCursor:
+    """为 execute/executemany 计时，其余属性透传给原游标"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            db_query_latency.labels(statement_type(operation)).observe(time.perf_counter() - start)
+
+    def executemany(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, *args, **kwargs)
+        finally:
+            db_query_latency.labels(statement_type(operation)).observe(time.perf_counter() - start)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+class TimedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            return self._conn.commit()
+        finally:
+            db_query_latency.labels('COMMIT').observe(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
 
 def get_db_connection():
-    global db_pool
-    if not db_pool:
-        db_pool = mysql.connector.pooling.MySQLConnectionPool(
-            pool_name="k8s_pool",
-            pool_size=Config.MaxIdleConns,
-            host=Config.DbHost,
-            port=Config.DbPort,
-            user=Config.DbUser,
-            password=Config.DbPwd,
-            database=Config.DbName,
-            pool_reset_session=True
+    global db_storage
+    if db_storage is None:
+        with db_storage_lock:
+            if db_storage is None:
+                db_storage = open_storage(Config)
+    start = time.perf_counter()
+    conn = db_storage.connect()
+    db_pool_wait.observe(time.perf_counter() - start)
+    return TimedConnection(conn)
+
+def check_schema_version():
+    """启动时检查表结构版本，落后时提示执行 --migrate（SQLite 已在打开时自动升级）"""
+    try:
+        conn = get_db_connection()
+        try:
+            version = schema_version(conn)
+        finally:
+            conn.close()
+    except DatabaseError as err:
+        app.logger.error(f"无法读取表结构版本: {err}")
+        return
+    if version < SCHEMA_VERSION:
+        app.logger.warning(
+            f"数据库表结构版本 {version} 低于 {SCHEMA_VERSION}，请执行 python backend.py --migrate"
         )
-    return db_pool.get_connection()
 
-def validate_kubeadm_token(token):
+def run_subprocess(cmd, **kwargs):
+    """subprocess.run 的计时封装，按命令前两段（如 "kubectl drain"）统计耗时"""
+    command = ' '.join(cmd[:2])
+    start = time.perf_counter()
+    result = 'error'
     try:
-        result = subprocess.run(
+        completed = subprocess.run(cmd, **kwargs)
+        result = 'ok' if completed.returncode == 0 else 'error'
+        return completed
+    except subprocess.TimeoutExpired:
+        result = 'timeout'
+        raise
+    finally:
+        subprocess_latency.labels(command, result).observe(time.perf_counter() - start)
+
+def parse_kubeadm_tokens(output):
+    """解析 `kubeadm token list -o json` 的输出，返回 {token_id: (token, expires)}
+
+    kubeadm 会连续输出多个 JSON 对象（不是数组），这里逐个 raw_decode，
+    expires 为空表示永不过期，记为 None。
+    """
+    decoder = json.JSONDecoder()
+    index = {}
+    pos = 0
+    output = output.strip()
+    while pos < len(output):
+        obj, end = decoder.raw_decode(output, pos)
+        pos = end
+        while pos < len(output) and output[pos] in ' \t\r\n,':
+            pos += 1
+        token = obj.get('token')
+        if not token:
+            continue
+        expires = obj.get('expires')
+        if expires:
+            expires = datetime.fromisoformat(expires.replace('Z', '+00:00')).timestamp()
+        else:
+            expires = None
+        index[token.split('.', 1)[0]] = (token, expires)
+    return index
+
+class KubeadmTokenCache:
+    """kubeadm bootstrap token 的进程内索引
+
+    后台线程每 ttl 秒刷新一次；校验时未命中会触发一次按需刷新，
+    并发的未命中请求共享同一次刷新（single-flight），热路径上不启动子进程。
+    """
+
+    def __init__(self, ttl=30, min_refresh_interval=1.0, timeout=10):
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._tokens = {}
+        self._generation = 0
+        self._last_refresh = 0.0
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.refresh_seconds_total = 0.0
+        self.last_refresh_seconds = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='kubeadm-token-cache', daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.ttl)
+
+    def _load(self):
+        result = run_subprocess(
             ['kubeadm', 'token', 'list', '-o', 'json'],
             stdout=subprocess.PIPE,
-            check=True
+            check=True,
+            timeout=self.timeout
         )
-        output = result.stdout.decode().strip()
-        # 替换多个JSON对象之间的换行符为逗号，并包裹成数组
-        processed_output = output.replace('}\n{', '}, {')
-        processed_output = f'[{processed_output}]'
-        # 解析为JSON数组
-        tokens = json.loads(processed_output)
-        tokens = [token['token'] for token in tokens]
-        return any(t == token for t in tokens)
-    except Exception as e:
-        app.logger.error(f"Token validation failed: {str(e)}")
+        return parse_kubeadm_tokens(result.stdout.decode())
+
+    def refresh(self, generation=None):
+        """刷新索引；generation 不为 None 时，若等锁期间已被其他线程刷新则直接返回"""
+        with self._refresh_lock:
+            if generation is not None:
+                if self._generation != generation:
+                    return
+                if time.monotonic() - self._last_refresh < self.min_refresh_interval:
+                    return
+            start = time.monotonic()
+            try:
+                tokens = self._load()
+            except Exception as e:
+                # 刷新失败时保留旧索引继续服务
+                app.logger.error(f"Token refresh failed: {str(e)}")
+                with self._stats_lock:
+                    self.refresh_failures += 1
+                return
+            finally:
+                self._last_refresh = time.monotonic()
+            elapsed = self._last_refresh - start
+            self._tokens = tokens
+            self._generation += 1
+            with self._stats_lock:
+                self.refreshes += 1
+                self.refresh_seconds_total += elapsed
+                self.last_refresh_seconds = elapsed
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def _lookup(self, token):
+        entry = self._tokens.get(token.split('.', 1)[0])
+        if entry is None:
+            return False
+        value, expires = entry
+        if expires is not None and expires <= time.time():
+            return False
+        return hmac.compare_digest(value, token)
+
+    def lookup(self, token, count=True):
+        """只查内存索引，不触发刷新"""
+        if not isinstance(token, str) or not token:
+            return False
+        self.start()
+        found = self._lookup(token)
+        if count:
+            with self._stats_lock:
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+        return found
+
+    def validate(self, token):
+        generation = self._generation
+        if self.lookup(token):
+            return True
+        if not isinstance(token, str) or not token:
+            return False
+        self.refresh(generation=generation)
+        return self._lookup(token)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "tokens": len(self._tokens),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "refresh_failures": self.refresh_failures,
+                "refresh_seconds_total": round(self.refresh_seconds_total, 6),
+                "last_refresh_seconds": round(self.last_refresh_seconds, 6),
+            }
+
+token_cache = KubeadmTokenCache(ttl=Config.TokenCacheTTL)
+
+def validate_kubeadm_token(token):
+    valid = token_cache.validate(token)
+    token_validations.labels('kubeadm', 'ok' if valid else 'failure').inc()
+    return valid
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def issue_session_token(username, user_id, node_name):
+    """签发短期会话令牌：base64(payload).base64(HMAC-SHA256)"""
+    payload = {
+        "u": username,
+        "uid": user_id,
+        "node": node_name,
+        "exp": int(time.time()) + Config.SessionTTL,
+    }
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode())
+    sig = hmac.new(Config.SessionSecret, body.encode(), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(sig)}"
+
+def verify_session_token(token):
+    """校验会话令牌，成功返回 payload，失败或过期返回 None（不访问数据库）"""
+    payload = _verify_session_token(token)
+    token_validations.labels('session', 'failure' if payload is None else 'ok').inc()
+    return payload
+
+def _verify_session_token(token):
+    if not isinstance(token, str) or token.count('.') != 1:
+        return None
+    body, sig = token.split('.')
+    try:
+        expected = hmac.new(Config.SessionSecret, body.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(sig)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+def is_password_hash(stored):
+    return isinstance(stored, str) and stored.startswith(('pbkdf2:', 'scrypt:'))
+
+def verify_user_password(stored, provided):
+    """数据库中存的是预计算哈希时只做一次 KDF；兼容旧的明文记录（常数时间比较）"""
+    if stored is None or provided is None:
         return False
+    if is_password_hash(stored):
+        return check_password_hash(stored, provided)
+    return hmac.compare_digest(str(stored).encode(), str(provided).encode())
+
+def session_matches_node(session, node_name):
+    """令牌只对签发时声明的节点有效；没有节点声明的令牌不匹配任何节点"""
+    node = session.get('node')
+    if not isinstance(node, str) or not node or not isinstance(node_name, str):
+        return False
+    return node_name.lower() == node.lower()
+
+def hash_stored_passwords():
+    """把 users 表中的明文密码一次性替换为预计算哈希"""
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        cursor.execute("SELECT id, password FROM users")
+        rows = [row for row in cursor.fetchall() if not is_password_hash(row['password'])]
+        for row in rows:
+            cursor.execute(
+                "UPDATE users SET password = %s WHERE id = %s",
+                (generate_password_hash(row['password']), row['id'])
+            )
+        conn.commit()
+        return len(rows)
+    finally:
+        cursor.close()
+        conn.close()
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = float(burst)
+        self.updated = now
+
+class RateLimiter:
+    """按 key（用户名/来源IP）的令牌桶限流，长时间不活跃的 key 按 LRU 淘汰"""
+
+    def __init__(self, rate, burst, max_keys=Config.RateLimitMaxKeys):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def acquire(self, key):
+        """成功返回 0，否则返回建议的重试等待秒数"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.burst, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0
+            self.limited += 1
+            return max(1, math.ceil((1 - bucket.tokens) / self.rate))
+
+    def __len__(self):
+        return len(self._buckets)
+
+class AdmissionController:
+    """路由级并发上限 + 有界 FIFO 排队
+
+    空闲时直接放行；并发已满时进入队列按到达顺序放行；队列已满立即拒绝。
+    释放时把名额直接交给队首请求，保证先到先得。
+    """
+
+    def __init__(self, name, concurrency, queue_size, queue_timeout):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.in_flight = 0
+        self.max_queue_depth = 0
+        self.admitted = 0
+        self.shed = 0
+        self.timeouts = 0
+        self.service_seconds = 0.1  # 服务时间的指数加权平均
+        self.wait_histogram = LatencyHistogram((0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8))
+
+    def retry_after(self):
+        depth = len(self._waiters) + 1
+        return max(1, math.ceil(self.service_seconds * depth / self.concurrency))
+
+    def acquire(self):
+        """返回 True 表示获得名额，False 表示被拒绝（队列已满或排队超时）"""
+        with self._lock:
+            if self.in_flight < self.concurrency and not self._waiters:
+                self.in_flight += 1
+                self.admitted += 1
+                self.wait_histogram.observe(0)
+                return True
+            if len(self._waiters) >= self.queue_size:
+                self.shed += 1
+                return False
+            waiter = threading.Event()
+            self._waiters.append(waiter)
+            self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        start = time.monotonic()
+        waiter.wait(self.queue_timeout)
+        with self._lock:
+            # 名额在锁内移交，这里的判断不会与 release 竞争
+            if not waiter.is_set():
+                self._waiters.remove(waiter)
+                self.timeouts += 1
+                return False
+            self.admitted += 1
+        self.wait_histogram.observe(time.monotonic() - start)
+        return True
+
+    def release(self, service_seconds):
+        with self._lock:
+            self.service_seconds = 0.9 * self.service_seconds + 0.1 * service_seconds
+            if self._waiters:
+                self._waiters.popleft().set()
+            else:
+                self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "queue_depth": len(self._waiters),
+                "queue_limit": self.queue_size,
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "timeouts": self.timeouts,
+                "service_seconds": round(self.service_seconds, 4),
+            }
+        stats["wait_seconds"] = self.wait_histogram.snapshot()
+        stats["wait_p95"] = self.wait_histogram.quantile(0.95)
+        return stats
+
+admission_controllers = {
+    name: AdmissionController(name, concurrency, queue_size, Config.AdmissionQueueTimeout)
+    for name, (concurrency, queue_size) in Config.AdmissionLimits.items()
+}
+ip_rate_limiter = RateLimiter(*Config.RateLimitPerIP)
+user_rate_limiter = RateLimiter(*Config.RateLimitPerUser)
+
+@app.errorhandler(PoolTimeout)
+def database_busy(err):
+    app.logger.warning(f"Database pool exhausted: {err}")
+    response = jsonify({"error": "Database busy", "retry_after": 1})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+def too_many_requests(retry_after, reason):
+    response = jsonify({"error": "Too many requests", "reason": reason, "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def request_session(data):
+    """请求体中会话令牌的校验结果；缓存在 g 上，限流与路由处理共用，同一请求只校验（计数）一次"""
+    if not isinstance(data, dict) or 'session_token' not in data:
+        return None
+    if 'session' not in g:
+        g.session = verify_session_token(data['session_token'])
+    return g.session
+
+def failure_user(data, session):
+    """失败记录中的用户名：优先取已验证的会话；否则记录请求中声明的用户名，仅供排查，不作为身份"""
+    if session is not None:
+        return session.get('u')
+    username = data.get('username')
+    return username if isinstance(username, str) else None
+
+def admission_control(route):
+    """按来源IP和用户限流，再按路由并发上限排队"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            retry_after = ip_rate_limiter.acquire(request.remote_addr)
+            if retry_after:
+                return too_many_requests(retry_after, "ip rate limit")
+            # 请求体中的 username 未经校验，按用户限流只认已验证的会话令牌，避免冒用他人的额度
+            session = request_session(request.get_json(silent=True))
+            user = session.get('u') if session is not None else None
+            if isinstance(user, str):
+                retry_after = user_rate_limiter.acquire(user)
+                if retry_after:
+                    return too_many_requests(retry_after, "user rate limit")
+
+            controller = admission_controllers[route]
+            if not controller.acquire():
+                return too_many_requests(controller.retry_after(), "queue full")
+            start = time.monotonic()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                controller.release(time.monotonic() - start)
+        return wrapper
+    return decorator
+
+class IdempotencyCache:
+    """按 (路由, Idempotency-Key) 保存已完成请求的响应，客户端重试时直接重放
+
+    同一个键的请求仍在处理时，重试等待其完成；5xx 与 429 响应不保存，重试会重新执行。
+    """
+
+    def __init__(self, ttl, max_keys):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.replays = 0
+        self.conflicts = 0
+        self.in_progress = 0
+
+    def begin(self, key, digest):
+        """返回 (条目, 是否由本请求执行)"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            entry = self._entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = {"digest": digest, "done": threading.Event(), "response": None, "expires": now + self.ttl}
+            self._entries[key] = entry
+            return entry, True
+
+    def finish(self, key, entry, response):
+        with self._lock:
+            if response is None:
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+            else:
+                entry["response"] = response
+                entry["expires"] = time.monotonic() + self.ttl
+        entry["done"].set()
+
+    def _prune(self, now):
+        # 调用方需持有 self._lock；处理中的条目不淘汰
+        for key, entry in list(self._entries.items()):
+            if len(self._entries) <= self.max_keys and entry["expires"] > now:
+                break
+            if entry["done"].is_set():
+                del self._entries[key]
+
+    def count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def __len__(self):
+        return len(self._entries)
+
+idempotency_cache = IdempotencyCache(Config.IdempotencyTTL, Config.IdempotencyMaxKeys)
+
+def idempotent(route):
+    """带 Idempotency-Key 请求头的重试只执行一次，之后重放第一次的响应；放在 admission_control 之外，重放不占用并发名额"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = request.headers.get('Idempotency-Key')
+            if not key:
+                return func(*args, **kwargs)
+            if len(key) > 128:
+                return jsonify({"error": "Idempotency-Key too long"}), 400
+            cache_key = f"{route}:{key}"
+            digest = hashlib.sha256(request.get_data()).digest()
+            entry, owner = idempotency_cache.begin(cache_key, digest)
+            if not owner:
+                if entry["digest"] != digest:
+                    idempotency_cache.count('conflicts')
+                    return jsonify({"error": "Idempotency-Key reused with a different request"}), 422
+                if not entry["done"].wait(Config.AdmissionQueueTimeout) or entry["response"] is None:
+                    # 第一次请求仍在处理或以 5xx 结束，稍后重试
+                    idempotency_cache.count('in_progress')
+                    response = jsonify({"error": "Request with this Idempotency-Key is in progress", "retry_after": 1})
+                    response.status_code = 409
+                    response.headers['Retry-After'] = '1'
+                    return response
+                idempotency_cache.count('replays')
+                status, body, content_type = entry["response"]
+                response = app.response_class(body, status=status, content_type=content_type)
+                response.headers['Idempotent-Replayed'] = 'true'
+                return response
+            response = None
+            try:
+                response = app.make_response(func(*args, **kwargs))
+                return response
+            finally:
+                if response is not None and response.status_code < 500 and response.status_code != 429:
+                    idempotency_cache.finish(
+                        cache_key, entry, (response.status_code, response.get_data(), response.content_type)
+                    )
+                else:
+                    idempotency_cache.finish(cache_key, entry, None)
+        return wrapper
+    return decorator
+
+@app.route('/admission', methods=['GET'])
+def admission_stats():
+    """各路由的并发、排队深度、等待时间与拒绝次数"""
+    return jsonify({
+        "routes": {name: controller.stats() for name, controller in admission_controllers.items()},
+        "rate_limits": {
+            "ip": {"keys": len(ip_rate_limiter), "limited": ip_rate_limiter.limited},
+            "user": {"keys": len(user_rate_limiter), "limited": user_rate_limiter.limited},
+        },
+        "idempotency": {
+            "keys": len(idempotency_cache),
+            "replays": idempotency_cache.replays,
+            "conflicts": idempotency_cache.conflicts,
+            "in_progress": idempotency_cache.in_progress,
+        }
+    }), 200
 
 @app.route('/k8s', methods=['POST'])
+@admission_control('k8s')
 def k8s_join():
     data = request.json
-    required_fields = ['token', 'hash', 'username', 'user_password']
-    if not all(field in data for field in required_fields):
+    required_fields = ['token', 'hash', 'username', 'user_password', 'node_name']
+    if not data or not all(field in data for field in required_fields):
         return jsonify({"error": "Missing required fields"}), 400
+    # 会话令牌绑定到节点名，只能用于该节点的 /k8s_complete 与 /k8s_delete
+    if not isinstance(data['node_name'], str) or not data['node_name'].strip():
+        return jsonify({"error": "Invalid node_name"}), 400
 
     # 验证token有效性
     if not validate_kubeadm_token(data['token']):
@@ -83,7 +784,7 @@ def k8s_join():
         cursor = conn.cursor(dictionary=True)
         # 验证用户凭证
         cursor.execute("""
-            SELECT password
+            SELECT id, password
             FROM users
             WHERE username = %s
         """, (data['username'],))
@@ -91,12 +792,18 @@ def k8s_join():
 
         if not user:
             return jsonify({"error": "User not found"}), 401
-        if not check_password_hash(generate_password_hash(user['password']), data['user_password']):
+        if not verify_user_password(user['password'], data['user_password']):
             return jsonify({"error": "Invalid password"}), 401
 
-        return jsonify({"status": "200 OK"}), 200
+        # 签发会话令牌，后续 /k8s_complete 与 /k8s_delete 无需再查库
+        session_token = issue_session_token(data['username'], user['id'], data['node_name'].strip())
+        return jsonify({
+            "status": "200 OK",
+            "session_token": session_token,
+            "expires_in": Config.SessionTTL
+        }), 200
 
-    except mysql.connector.Error as err:
+    except DatabaseError as err:
         app.logger.error(f"Database error: {err}")
         return jsonify({"error": "Database error"}), 500
     finally:
@@ -104,43 +811,169 @@ def k8s_join():
             cursor.close()
             conn.close()
 
+JOIN_PHASE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180, 240, 300, 600)
+MAX_JOIN_PHASES = 16
+join_phase_histograms = {}
+join_phase_lock = threading.Lock()
+
+def record_join_timings(timings):
+    """记录节点上报的各阶段耗时，忽略格式不正确的条目"""
+    if not isinstance(timings, dict):
+        return
+    for phase, seconds in list(timings.items())[:MAX_JOIN_PHASES]:
+        if not isinstance(phase, str) or len(phase) > 32:
+            continue
+        if not isinstance(seconds, (int, float)) or not 0 <= seconds <= 3600:
+            continue
+        histogram = join_phase_histograms.get(phase)
+        if histogram is None:
+            with join_phase_lock:
+                if len(join_phase_histograms) >= 4 * MAX_JOIN_PHASES:
+                    continue
+                histogram = join_phase_histograms.setdefault(phase, LatencyHistogram(JOIN_PHASE_BUCKETS))
+        histogram.observe(float(seconds))
+
+@app.route('/join_stats', methods=['GET'])
+def join_stats():
+    """加入流程各阶段的耗时分布"""
+    phases = {}
+    for phase, histogram in sorted(join_phase_histograms.items()):
+        stats = histogram.snapshot()
+        stats.update({
+            "p50": histogram.quantile(0.5),
+            "p95": histogram.quantile(0.95),
+            "p99": histogram.quantile(0.99),
+        })
+        phases[phase] = stats
+    return jsonify({"phases": phases}), 200
+
+# 按节点名 upsert（node.name 唯一索引，见 storage.MIGRATIONS）：重新加入的节点原地更新硬件信息。
+# 已属于其他用户的节点不会被更新（调用方先用 node_owners 检查并返回 409，这里防止检查与写入之间的竞争）；
+# MySQL 的 ON DUPLICATE KEY UPDATE 不支持 WHERE，逐列判断，user_id 放在最后赋值。
+NODE_UPSERT_SQL = {
+    'mysql': """
+        INSERT INTO node (name, ip, type, status, user_id, num_cpu, size_mem, num_gpu, gpu_type, hw_info)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            ip = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(ip), ip),
+            type = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(type), type),
+            status = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(status), status),
+            num_cpu = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(num_cpu), num_cpu),
+            size_mem = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(size_mem), size_mem),
+            num_gpu = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(num_gpu), num_gpu),
+            gpu_type = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(gpu_type), gpu_type),
+            hw_info = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(hw_info), hw_info),
+            user_id = IF(user_id IS NULL OR user_id = VALUES(user_id), VALUES(user_id), user_id)
+    """,
+    'sqlite': """
+        INSERT INTO node (name, ip, type, status, user_id, num_cpu, size_mem, num_gpu, gpu_type, hw_info)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT(name) DO UPDATE SET
+            ip = excluded.ip, type = excluded.type, status = excluded.status, user_id = excluded.user_id,
+            num_cpu = excluded.num_cpu, size_mem = excluded.size_mem, num_gpu = excluded.num_gpu,
+            gpu_type = excluded.gpu_type, hw_info = excluded.hw_info
+        WHERE node.user_id IS NULL OR node.user_id = excluded.user_id
+    """,
+}
+
+def previous_node_ips(cursor, names):
+    """重新加入前的节点IP，用于IP变化时清理旧的服务发现目标"""
+    names = [name for name in names if name]
+    if not names:
+        return {}
+    placeholders = ', '.join(['%s'] * len(names))
+    cursor.execute(f"SELECT name, ip FROM node WHERE name IN ({placeholders})", tuple(names))
+    return {name.lower(): ip for name, ip in cursor.fetchall()}
+
+def node_owners(cursor, names):
+    """已登记节点的所属用户 {小写节点名: user_id}"""
+    names = [name for name in names if name]
+    if not names:
+        return {}
+    placeholders = ', '.join(['%s'] * len(names))
+    cursor.execute(f"SELECT name, user_id FROM node WHERE name IN ({placeholders})", tuple(names))
+    return {name.lower(): user_id for name, user_id in cursor.fetchall()}
+
+def owned_by_other(owners, name, user_id):
+    """节点已由其他用户登记：重新加入只能由原用户完成，不能借同名登记接管节点"""
+    owner = owners.get((name or '').lower())
+    return owner is not None and owner != user_id
+
+def stale_ips(previous, hardware_infos):
+    stale = []
+    for hardware_info in hardware_infos:
+        old_ip = previous.get((hardware_info.get('name') or '').lower())
+        if old_ip and old_ip != hardware_info.get('ip'):
+            stale.append(old_ip)
+    return stale
+
+def node_row(hardware_info, user_id):
+    # hw_info 保存 molink_hwprobe 上报的完整硬件清单（JSON）
+    inventory = hardware_info.get('inventory')
+    return (
+        hardware_info.get('name'),
+        hardware_info.get('ip'),
+        0,
+        node_informer.status_of(hardware_info.get('name') or ''),
+        user_id,
+        hardware_info.get('num_cpu'),
+        hardware_info.get('size_mem'),
+        hardware_info.get('num_gpu'),
+        hardware_info.get('gpu_type'),
+        json.dumps(inventory) if inventory is not None else None,
+    )
+
 @app.route('/k8s_complete', methods=['POST'])
+@idempotent('k8s_complete')
+@admission_control('k8s_complete')
 def join_complete():
     data = request.json
-    if not data or 'username' not in data or 'hardware_info' not in data:
+    if not isinstance(data, dict) or not isinstance(data.get('hardware_info'), dict):
         return jsonify({"error": "Invalid request"}), 400
 
+    session = None
+    if 'session_token' in data:
+        session = request_session(data)
+        if session is None:
+            return jsonify({"error": "Invalid session token"}), 401
+        if not session_matches_node(session, data['hardware_info'].get('name')):
+            return jsonify({"error": "Session token does not match node"}), 401
+    elif not isinstance(data.get('username'), str) or not isinstance(data.get('user_password'), str):
+        # 没有会话令牌时必须提供用户名密码，仅凭用户名不能登记节点
+        return jsonify({"error": "Session token or username and user_password required"}), 401
+    else:
+        error = check_user_credentials(data['username'], data['user_password'])
+        if error is not None:
+            return error
+
     conn = None
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            """SELECT id from users where username = %s""", (data['username'],)
-        )
-        user_id_result = cursor.fetchone()
-        if not user_id_result:
-            return jsonify({"error": "User not found"}), 500
-        user_id = user_id_result[0]
-        cursor.execute("""
-            INSERT INTO node (name, ip, type, status, user_id, num_cpu, size_mem, num_gpu, gpu_type)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """, (
-            data['hardware_info'].get('name'),
-            data['hardware_info'].get('ip'),
-            0,
-            0,
-            user_id,
-            data['hardware_info'].get('num_cpu'),
-            data['hardware_info'].get('size_mem'),
-            data['hardware_info'].get('num_gpu'),
-            data['hardware_info'].get('gpu_type'),
-        ))
+        if session is not None:
+            user_id = session['uid']
+        else:
+            cursor.execute(
+                """SELECT id from users where username = %s""", (data['username'],)
+            )
+            user_id_result = cursor.fetchone()
+            if not user_id_result:
+                return jsonify({"error": "User not found"}), 500
+            user_id = user_id_result[0]
+        owners = node_owners(cursor, [data['hardware_info'].get('name')])
+        if owned_by_other(owners, data['hardware_info'].get('name'), user_id):
+            return jsonify({"error": "Node is registered by another user"}), 409
+        previous = previous_node_ips(cursor, [data['hardware_info'].get('name')])
+        cursor.execute(NODE_UPSERT_SQL[Config.DbType], node_row(data['hardware_info'], user_id))
         conn.commit()
+        node_snapshot.invalidate()
+        record_join_timings(data.get('timings'))
+        remove_service_discovery(stale_ips(previous, [data['hardware_info']]))
         update_service_discovery(data['hardware_info'].get('ip'), 'node_exporters')
         update_service_discovery(data['hardware_info'].get('ip'), 'dcgm')
         return jsonify({"status": "Node registered"}), 200
 
-    except mysql.connector.Error as err:
+    except DatabaseError as err:
         app.logger.error(f"Database error: {err}")
         return jsonify({"error": "Failed to save node info"}), 500
     finally:
@@ -148,22 +981,384 @@ def join_complete():
             cursor.close()
             conn.close()
 
-@app.route('/k8s_delete', methods=['POST'])
-def k8s_delete():
+@app.route('/k8s_complete_batch', methods=['POST'])
+@idempotent('k8s_complete_batch')
+@admission_control('k8s_complete_batch')
+def join_complete_batch():
+    """批量登记节点：一次查询解析用户名，单个事务 executemany 插入，服务发现文件每批只写一次
+
+    请求体: {"username", "user_password", "nodes": [{"username": 可选, "hardware_info": {...}}, ...]}
+    需要校验用户名密码；节点登记在该用户名下，只有管理员（Config.AdminUser）可以为其他用户登记。
+    返回每个节点的登记结果，部分失败时状态码为 207。
+    """
     data = request.json
-    required_fields = ['node_name', 'username', 'user_password']
+    if not data or not isinstance(data.get('nodes'), list) or not data['nodes']:
+        return jsonify({"error": "Invalid request"}), 400
+    if not isinstance(data.get('username'), str) or not isinstance(data.get('user_password'), str):
+        return jsonify({"error": "Missing required fields: username, user_password"}), 400
+    if len(data['nodes']) > Config.MaxBatchSize:
+        return jsonify({"error": f"Batch too large (max {Config.MaxBatchSize})"}), 413
 
-    # 参数校验
-    if not all(field in data for field in required_fields):
-        return jsonify({"error": "缺少必要参数: node_name, username, user_password"}), 400
+    error = check_user_credentials(data['username'], data['user_password'])
+    if error is not None:
+        return error
+    operator = data['username'] == Config.AdminUser
 
-    node_name = data['node_name']
-    # k8s requires all letters to be lower
-    node_name_lower = node_name.lower()
-    username = data['username']
-    password = data['user_password']
+    results = []
+    pending = []
+    for index, record in enumerate(data['nodes']):
+        record = record if isinstance(record, dict) else {}
+        hardware_info = record.get('hardware_info')
+        username = record.get('username', data['username'])
+        name = hardware_info.get('name') if isinstance(hardware_info, dict) else None
+        results.append({"index": index, "name": name})
+        if not name or not isinstance(username, str) or not hardware_info.get('ip'):
+            results[index].update({"status": "error", "error": "Invalid request"})
+            continue
+        if username != data['username'] and not operator:
+            results[index].update({"status": "error", "error": "Username does not match credentials"})
+            continue
+        pending.append((index, username, hardware_info))
 
-    # 验证用户凭证
+    conn = None
+    try:
+        if pending:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            usernames = sorted({username for _, username, _ in pending})
+            placeholders = ', '.join(['%s'] * len(usernames))
+            cursor.execute(
+                f"SELECT id, username FROM users WHERE username IN ({placeholders})",
+                tuple(usernames)
+            )
+            user_ids = {username: user_id for user_id, username in cursor.fetchall()}
+
+            owners = node_owners(cursor, [hardware_info.get('name') for _, _, hardware_info in pending])
+            rows = []
+            registered = []
+            for index, username, hardware_info in pending:
+                if username not in user_ids:
+                    results[index].update({"status": "error", "error": "User not found"})
+                    continue
+                if owned_by_other(owners, hardware_info.get('name'), user_ids[username]):
+                    results[index].update({"status": "error", "error": "Node is registered by another user"})
+                    continue
+                rows.append(node_row(hardware_info, user_ids[username]))
+                registered.append((index, hardware_info))
+
+            previous = {}
+            if rows:
+                try:
+                    previous = previous_node_ips(cursor, [hardware_info.get('name') for _, hardware_info in registered])
+                    cursor.executemany(NODE_UPSERT_SQL[Config.DbType], rows)
+                    conn.commit()
+                    node_snapshot.invalidate()
+                except DatabaseError as err:
+                    conn.rollback()
+                    app.logger.error(f"Database error: {err}")
+                    for index, _ in registered:
+                        results[index].update({"status": "error", "error": "Failed to save node info"})
+                    registered = []
+
+            for index, _ in registered:
+                results[index]["status"] = "registered"
+                record_join_timings(data['nodes'][index].get('timings'))
+            remove_service_discovery(stale_ips(previous, [hardware_info for _, hardware_info in registered]))
+            ips = [hardware_info.get('ip') for _, hardware_info in registered]
+            if ips:
+                update_service_discovery(ips, 'node_exporters')
+                update_service_discovery(ips, 'dcgm')
+
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Failed to save node info", "results": results}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    failed = sum(1 for result in results if result.get('status') != 'registered')
+    return jsonify({
+        "status": "Nodes registered" if not failed else "Partially registered",
+        "registered": len(results) - failed,
+        "failed": failed,
+        "results": results
+    }), 200 if not failed else 207
+
+JOIN_FAILURE_INSERT_SQL = """
+    INSERT INTO join_failure (node_name, ip, username, stage, error, timings, hw_info, reported_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+def join_failure_row(data, username):
+    """/k8s_fail 的记录；stage 为失败的阶段（auth、kubeadm_join、complete 等）"""
+    hardware_info = data.get('hardware_info') if isinstance(data.get('hardware_info'), dict) else {}
+    inventory = hardware_info.get('inventory')
+    timings = data.get('timings')
+    return (
+        str(hardware_info.get('name') or '')[:255] or None,
+        str(hardware_info.get('ip') or '')[:64] or None,
+        str(username)[:64] if username else None,
+        str(data.get('stage') or 'unknown')[:64],
+        str(data.get('error') or '')[:Config.JoinFailureMaxError],
+        json.dumps(timings) if isinstance(timings, dict) else None,
+        json.dumps(inventory) if inventory is not None else None,
+        time.time(),
+    )
+
+@app.route('/k8s_fail', methods=['POST'])
+@idempotent('k8s_fail')
+@admission_control('k8s_fail')
+def join_fail():
+    """记录失败的加入，供排查；不校验密码（认证失败的加入同样需要记录），用户名以会话令牌为准"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get('hardware_info'), dict):
+        return jsonify({"error": "Invalid request"}), 400
+
+    row = join_failure_row(data, failure_user(data, request_session(data)))
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(JOIN_FAILURE_INSERT_SQL, row)
+        conn.commit()
+        failure_id = cursor.lastrowid
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Failed to record join failure"}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+    join_failures.labels(row[3]).inc()
+    app.logger.warning(f"Join failed: node={row[0]} ip={row[1]} stage={row[3]} error={row[4][:200]}")
+    return jsonify({"status": "Failure recorded", "id": failure_id}), 200
+
+@app.route('/k8s_failures', methods=['GET'])
+def list_join_failures():
+    """最近的加入失败记录，参数: node, limit（默认 50，最多 500）"""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "invalid limit"}), 400
+    node = request.args.get('node')
+    sql = "SELECT id, node_name, ip, username, stage, error, timings, reported_at FROM join_failure"
+    params = ()
+    if node:
+        sql += " WHERE node_name = %s"
+        params = (node,)
+    sql += " ORDER BY reported_at DESC LIMIT %s"
+    conn = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(sql, params + (limit,))
+        failures = cursor.fetchall()
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+    for failure in failures:
+        if isinstance(failure.get('timings'), str):
+            failure['timings'] = json.loads(failure['timings'])
+    return jsonify({"failures": failures}), 200
+
+class RemovalJobs:
+    """节点移除后台任务：cordon -> drain（带截止时间）-> delete node -> 删除数据库记录
+
+    有界线程池执行，瞬时失败按指数退避重试；同一节点同时只有一个进行中的任务。
+    """
+
+    ACTIVE = ('queued', 'cordoning', 'draining', 'deleting', 'cleaning', 'retrying')
+
+    def __init__(self, workers, retries, drain_timeout, max_jobs=10000, keep_seconds=3600):
+        self.retries = retries
+        self.drain_timeout = drain_timeout
+        self.max_jobs = max_jobs
+        self.keep_seconds = keep_seconds
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='node-removal')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._active = {}
+
+    def submit(self, node_name, requested_by=None):
+        with self._lock:
+            # kubectl 使用小写节点名，大小写不同的请求视为同一节点
+            job_id = self._active.get(node_name.lower())
+            if job_id is not None:
+                job = self._jobs[job_id]
+                return dict(job, steps=list(job["steps"]))
+            self._prune()
+            now = time.time()
+            job = {
+                "id": uuid.uuid4().hex,
+                "node": node_name,
+                "state": "queued",
+                "attempts": 0,
+                "requested_by": requested_by,
+                "created": now,
+                "updated": now,
+                "steps": [],
+                "error": None,
+            }
+            self._jobs[job["id"]] = job
+            self._active[node_name.lower()] = job["id"]
+            # 提交前复制：工作线程随即开始更新任务
+            submitted = dict(job, steps=[])
+        self._pool.submit(self._run, job["id"])
+        return submitted
+
+    def active(self):
+        return len(self._active)
+
+    def wait_idle(self, timeout):
+        """等待进行中的任务结束，超时返回 False"""
+        deadline = time.monotonic() + timeout
+        while self._active:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return None if job is None else dict(job, steps=list(job["steps"]))
+
+    def _prune(self):
+        # 调用方需持有 self._lock
+        cutoff = time.time() - self.keep_seconds
+        for job_id, job in list(self._jobs.items()):
+            if len(self._jobs) <= self.max_jobs and job["updated"] >= cutoff:
+                break
+            if job["state"] not in self.ACTIVE:
+                del self._jobs[job_id]
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs[job_id]
+            step = fields.pop('step', None)
+            if step:
+                job["steps"].append({"time": time.time(), "message": step})
+            job.update(fields, updated=time.time())
+            if job["state"] not in self.ACTIVE:
+                self._active.pop(job["node"].lower(), None)
+
+    def _kubectl(self, args, timeout):
+        return run_subprocess(
+            ['kubectl'] + args,
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout
+        ).stdout.strip()
+
+    @staticmethod
+    def _not_found(err):
+        return isinstance(err, subprocess.CalledProcessError) and 'notfound' in (err.stderr or '').replace(' ', '').lower()
+
+    def _remove(self, job_id, node_name, done):
+        """done 记录已完成的步骤，重试时跳过"""
+        node_name_lower = node_name.lower()
+        if 'cordon' not in done and node_informer.exists(node_name) is False:
+            # 本地缓存已确认节点不在集群中，无需调用 kubectl
+            done.update(('cordon', 'drain', 'delete'))
+            self._update(job_id, step="节点不存在于集群中")
+        if 'cordon' not in done:
+            self._update(job_id, state='cordoning')
+            try:
+                self._kubectl(['cordon', node_name_lower], timeout=30)
+                self._update(job_id, step="节点已设置为不可调度")
+            except subprocess.CalledProcessError as e:
+                if not self._not_found(e):
+                    raise
+                done.update(('drain', 'delete'))
+                self._update(job_id, step="节点不存在于集群中")
+            done.add('cordon')
+
+        if 'drain' not in done:
+            self._update(job_id, state='draining')
+            try:
+                self._kubectl([
+                    'drain', node_name_lower, '--ignore-daemonsets', '--delete-emptydir-data',
+                    f'--timeout={self.drain_timeout}s'
+                ], timeout=self.drain_timeout + 30)
+                self._update(job_id, step="节点已排空")
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+                # 超过排空截止时间后仍继续删除，节点即将执行 kubeadm reset
+                details = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else str(e)
+                self._update(job_id, step=f"排空未在截止时间内完成，继续删除: {details}")
+            done.add('drain')
+
+        if 'delete' not in done:
+            self._update(job_id, state='deleting')
+            output = self._kubectl(['delete', 'node', node_name_lower, '--ignore-not-found=true'], timeout=30)
+            self._update(job_id, step=output or "节点已从集群删除")
+            done.add('delete')
+
+        self._update(job_id, state='cleaning')
+        db_conn = get_db_connection()
+        db_cursor = db_conn.cursor()
+        try:
+            # 先取出节点IP，用于清理服务发现目标
+            db_cursor.execute("""
+                SELECT ip
+                FROM node
+                WHERE name = %s
+            """, (node_name,))
+            node_ips = [row[0] for row in db_cursor.fetchall() if row[0]]
+
+            db_cursor.execute("""
+                DELETE FROM node
+                WHERE name = %s
+            """, (node_name,))
+            deleted_rows = db_cursor.rowcount
+            db_conn.commit()
+        finally:
+            db_cursor.close()
+            db_conn.close()
+        node_snapshot.invalidate()
+        remove_service_discovery(node_ips)
+        if deleted_rows == 0:
+            app.logger.warning(f"数据库未找到节点记录: {node_name}")
+            self._update(job_id, step="节点数据库记录不存在")
+        else:
+            self._update(job_id, step="节点数据库记录已删除")
+
+    def _run(self, job_id):
+        node_name = self.get(job_id)["node"]
+        done = set()
+        for attempt in range(1, self.retries + 2):
+            self._update(job_id, attempts=attempt)
+            try:
+                self._remove(job_id, node_name, done)
+                self._update(job_id, state='succeeded', error=None)
+                return
+            except (subprocess.CalledProcessError, subprocess.TimeoutExpired) + DatabaseError as e:
+                error = e.stderr.strip() if isinstance(e, subprocess.CalledProcessError) and e.stderr else str(e)
+                app.logger.error(f"节点删除失败({node_name}, 第{attempt}次): {error}")
+                if attempt > self.retries:
+                    self._update(job_id, state='failed', error=error)
+                    return
+                self._update(job_id, state='retrying', error=error, step=f"第{attempt}次尝试失败: {error}")
+                time.sleep(min(2 ** attempt, 30))
+            except Exception as e:
+                app.logger.error(f"系统错误: {str(e)}")
+                self._update(job_id, state='failed', error=str(e))
+                return
+
+removal_jobs = RemovalJobs(
+    workers=Config.RemovalWorkers,
+    retries=Config.RemovalRetries,
+    drain_timeout=Config.DrainTimeout
+)
+
+def check_user_credentials(username, password):
+    """校验用户名密码，成功返回 None，失败返回错误响应"""
     conn = None
     try:
         conn = get_db_connection()
@@ -179,10 +1374,11 @@ def k8s_delete():
 
         if not user:
             return jsonify({"error": "用户不存在"}), 401
-        if not check_password_hash(generate_password_hash(user['password']), data['user_password']):
+        if not verify_user_password(user['password'], password):
             return jsonify({"error": "密码错误"}), 401
+        return None
 
-    except mysql.connector.Error as err:
+    except DatabaseError as err:
         app.logger.error(f"数据库错误: {err}")
         return jsonify({"error": "数据库错误"}), 500
     finally:
@@ -190,147 +1386,955 @@ def k8s_delete():
             cursor.close()
             conn.close()
 
-    # 执行节点删除操作
+@app.route('/k8s_delete', methods=['POST'])
+@idempotent('k8s_delete')
+@admission_control('k8s_delete')
+def k8s_delete():
+    """提交节点移除任务，立即返回任务ID，进度通过 /k8s_jobs/<job_id> 查询"""
+    data = request.json
+    required_fields = ['node_name', 'username', 'user_password']
+
+    # 优先使用会话令牌，校验通过则跳过数据库查询与密码哈希
+    session = None
+    if data and 'session_token' in data and 'node_name' in data:
+        session = request_session(data)
+        if session is not None and not session_matches_node(session, data['node_name']):
+            session = None
+
+    # 参数校验
+    if session is None and not all(field in data for field in required_fields):
+        return jsonify({"error": "缺少必要参数: node_name, username, user_password"}), 400
+
+    node_name = data['node_name']
+
+    # 验证用户凭证
+    if session is None:
+        error = check_user_credentials(data['username'], data['user_password'])
+        if error is not None:
+            return error
+
+    # 安全验证节点名称格式（k8s requires all letters to be lower）
+    if not re.match(r'^[a-z0-9-]+$', node_name.lower()):
+        return jsonify({"error": "无效的节点名称"}), 400
+
+    job = removal_jobs.submit(node_name, session['u'] if session else data['username'])
+    return jsonify({
+        "status": "202 Accepted",
+        "message": f"节点 {node_name} 的删除任务已提交",
+        "job_id": job["id"],
+        "job": job
+    }), 202
+
+@app.route('/k8s_delete_batch', methods=['POST'])
+@idempotent('k8s_delete_batch')
+@admission_control('k8s_delete_batch')
+def k8s_delete_batch():
+    """批量提交节点移除任务: {"node_names": [...], "username", "user_password"}"""
+    data = request.json
+    if not data or not isinstance(data.get('node_names'), list) or not data['node_names']:
+        return jsonify({"error": "缺少必要参数: node_names, username, user_password"}), 400
+    if not all(field in data for field in ('username', 'user_password')):
+        return jsonify({"error": "缺少必要参数: node_names, username, user_password"}), 400
+    if len(data['node_names']) > Config.MaxBatchSize:
+        return jsonify({"error": f"Batch too large (max {Config.MaxBatchSize})"}), 413
+
+    error = check_user_credentials(data['username'], data['user_password'])
+    if error is not None:
+        return error
+
+    jobs = {}
+    for node_name in data['node_names']:
+        if not isinstance(node_name, str) or not re.match(r'^[a-z0-9-]+$', node_name.lower()):
+            jobs[str(node_name)] = {"error": "无效的节点名称"}
+            continue
+        job = removal_jobs.submit(node_name, data['username'])
+        jobs[node_name] = {"job_id": job["id"], "state": job["state"]}
+    return jsonify({"status": "202 Accepted", "jobs": jobs}), 202
+
+@app.route('/k8s_jobs/<job_id>', methods=['GET'])
+def k8s_job_status(job_id):
+    job = removal_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在"}), 404
+    return jsonify(job), 200
+
+class NodeSnapshot:
+    """node 表的内存快照，供调度脚本轮询
+
+    节点登记/删除时失效，下次读取时重建（并发读取只重建一次）；
+    按节点名排序并建立 gpu_type、status 二级索引，用于过滤与 keyset 分页。
+    """
+
+    FIELDS = ('name', 'ip', 'type', 'status', 'user_id', 'owner',
+              'num_cpu', 'size_mem', 'num_gpu', 'gpu_type', 'hw_info')
+    DEFAULT_FIELDS = FIELDS[:-1]
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # (nodes, names, by_gpu_type, by_status)，整体替换保证读取到一致的版本
+        self._data = ({}, [], {}, {})
+        self._stale = True
+        self.version = 0
+        self.built_at = 0.0
+        self.build_seconds = 0.0
+        self.invalidated_at = None
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._stale = True
+            self.invalidations += 1
+            if self.invalidated_at is None:
+                self.invalidated_at = time.time()
+
+    def _build(self):
+        start = time.monotonic()
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        try:
+            cursor.execute("""
+                SELECT n.name, n.ip, n.type, n.status, n.user_id, u.username AS owner,
+                       n.num_cpu, n.size_mem, n.num_gpu, n.gpu_type, n.hw_info
+                FROM node n
+                LEFT JOIN users u ON u.id = n.user_id
+            """)
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+            conn.close()
+
+        nodes = {}
+        for row in rows:
+            if isinstance(row.get('hw_info'), (str, bytes)):
+                try:
+                    row['hw_info'] = json.loads(row['hw_info'])
+                except ValueError:
+                    row['hw_info'] = None
+            # 同名节点以最后一条记录为准
+            nodes[row['name']] = row
+        names = sorted(name for name in nodes if name is not None)
+        by_gpu_type = {}
+        by_status = {}
+        for name in names:
+            by_gpu_type.setdefault(nodes[name]['gpu_type'], []).append(name)
+            by_status.setdefault(nodes[name]['status'], []).append(name)
+        self._data = (nodes, names, by_gpu_type, by_status)
+        self.version += 1
+        self.built_at = time.time()
+        self.build_seconds = time.monotonic() - start
+
+    def _ensure_fresh(self):
+        with self._lock:
+            if not self._stale and time.time() - self.built_at < self.max_age:
+                return self._data
+            self._stale = False
+            invalidated_at = self.invalidated_at
+            self.invalidated_at = None
+            try:
+                self._build()
+            except Exception:
+                self._stale = True
+                self.invalidated_at = invalidated_at
+                raise
+            return self._data
+
+    def stats(self):
+        return {
+            "version": self.version,
+            "nodes": len(self._data[1]),
+            "built_at": self.built_at,
+            "age_seconds": round(time.time() - self.built_at, 3) if self.built_at else None,
+            "build_seconds": round(self.build_seconds, 6),
+            "stale": self._stale,
+            "stale_seconds": round(time.time() - self.invalidated_at, 3) if self.invalidated_at else 0,
+            "invalidations": self.invalidations,
+        }
+
+    def query(self, gpu_type=None, min_gpus=None, min_mem=None, status=None,
+              owner=None, after=None, limit=100, fields=None):
+        """返回 (nodes, next_cursor)，next_cursor 为本页最后一个节点名"""
+        nodes, names, by_gpu_type, by_status = self._ensure_fresh()
+        # 先用二级索引缩小候选集
+        if gpu_type is not None:
+            candidates = by_gpu_type.get(gpu_type, [])
+        elif status is not None:
+            candidates = by_status.get(status, [])
+        else:
+            candidates = names
+        start = bisect.bisect_right(candidates, after) if after is not None else 0
+
+        fields = fields or self.DEFAULT_FIELDS
+        page = []
+        for name in candidates[start:]:
+            node = nodes[name]
+            if status is not None and node['status'] != status:
+                continue
+            if min_gpus is not None and (node['num_gpu'] or 0) < min_gpus:
+                continue
+            if min_mem is not None and (node['size_mem'] or 0) < min_mem:
+                continue
+            if owner is not None and node['owner'] != owner:
+                continue
+            page.append({field: node.get(field) for field in fields})
+            if len(page) >= limit:
+                return page, name
+        return page, None
+
+    def registered(self):
+        """返回 (版本号, 当前登记的节点名集合)，集合为只读视图"""
+        nodes = self._ensure_fresh()[0]
+        return self.version, nodes.keys()
+
+node_snapshot = NodeSnapshot(max_age=Config.NodeSnapshotMaxAge)
+
+def write_node_status(changes):
+    """informer 的批量回调：{name: summary|None} 写回 node.status"""
+    rows = [(summary['status'] if summary else NODE_NOT_READY, name) for name, summary in changes.items()]
+    conn = get_db_connection()
+    cursor = conn.cursor()
     try:
-        # 安全验证节点名称格式
-        if not re.match(r'^[a-z0-9-]+$', node_name_lower):
-            return jsonify({"error": "无效的节点名称"}), 400
-
-        # 执行kubectl delete node
-        cmd = [
-            'kubectl', 'delete', 'node', node_name_lower,
-            '--ignore-not-found=true'
-        ]
-        result = subprocess.run(
-            cmd,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            timeout=30
+        cursor.executemany("""
+            UPDATE node
+            SET status = %s
+            WHERE name = %s
+        """, rows)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    node_snapshot.invalidate()
+
+node_informer = NodeInformer(
+    lambda: KubeClient.from_kubeconfig(Config.Kubeconfig),
+    on_change=write_node_status,
+    batch_interval=Config.InformerBatchInterval,
+    logger=app.logger
+)
+
+@app.route('/k8s_nodes/<node_name>', methods=['GET'])
+def k8s_node(node_name):
+    """从 informer 缓存返回节点在集群中的状态，不调用 kubectl"""
+    if not node_informer.synced:
+        return jsonify({"error": "节点状态尚未同步"}), 503
+    node = node_informer.get(node_name)
+    if node is None:
+        return jsonify({"error": "节点不存在于集群中"}), 404
+    return jsonify(node), 200
+
+@app.route('/informer', methods=['GET'])
+def informer_stats():
+    return jsonify(node_informer.stats()), 200
+
+@app.route('/db_pool', methods=['GET'])
+def db_pool_stats():
+    return jsonify(db_storage.stats() if db_storage else {}), 200
+
+@app.route('/nodes', methods=['GET'])
+def list_nodes():
+    """节点查询接口，数据来自内存快照，不访问数据库
+
+    参数: gpu_type, min_gpus, min_mem, status, owner, after（上一页返回的 next）,
+    limit, fields（逗号分隔的字段列表）
+    """
+    args = request.args
+    try:
+        min_gpus = int(args['min_gpus']) if 'min_gpus' in args else None
+        min_mem = float(args['min_mem']) if 'min_mem' in args else None
+        status = int(args['status']) if 'status' in args else None
+        limit = max(1, min(int(args.get('limit', 100)), Config.NodesPageLimit))
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters"}), 400
+    fields = [field for field in args.get('fields', '').split(',') if field] or None
+    if fields and not set(fields) <= set(NodeSnapshot.FIELDS):
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(set(fields) - set(NodeSnapshot.FIELDS)))}"}), 400
+
+    try:
+        nodes, next_cursor = node_snapshot.query(
+            gpu_type=args.get('gpu_type'),
+            min_gpus=min_gpus,
+            min_mem=min_mem,
+            status=status,
+            owner=args.get('owner'),
+            after=args.get('after'),
+            limit=limit,
+            fields=fields,
         )
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
 
-        # 删除数据库记录
-        db_conn = None
-        try:
-            db_conn = get_db_connection()
-            db_cursor = db_conn.cursor()
+    return jsonify({
+        "nodes": nodes,
+        "next": next_cursor,
+        "snapshot": node_snapshot.stats()
+    }), 200
 
-            # 执行删除操作
-            db_cursor.execute("""
-                DELETE FROM node
-                WHERE name = %s
-            """, (node_name,))
-            deleted_rows = db_cursor.rowcount
+@app.route('/plan', methods=['POST'])
+def plan():
+    """根据模型描述与已登记节点计算流水线层划分（见 planner.py）
 
-            db_conn.commit()
+    请求体: {"model": {...}, "gpu_type": 可选, "owner": 可选, "status": 可选, "nodes": 可选节点名列表}
+    """
+    data = request.json
+    if not data or not isinstance(data.get('model'), dict):
+        return jsonify({"error": "Invalid request"}), 400
+    names = data.get('nodes')
+    if names is not None and (not isinstance(names, list) or not all(isinstance(name, str) for name in names)):
+        return jsonify({"error": "nodes must be a list of node names"}), 400
+
+    try:
+        nodes = []
+        after = None
+        while True:
+            page, after = node_snapshot.query(
+                gpu_type=data.get('gpu_type'),
+                status=data.get('status'),
+                owner=data.get('owner'),
+                after=after,
+                limit=Config.NodesPageLimit,
+                fields=('name', 'ip', 'num_gpu', 'gpu_type', 'hw_info'),
+            )
+            nodes.extend(page)
+            if after is None:
+                break
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    if names:
+        wanted = set(names)
+        nodes = [node for node in nodes if node['name'] in wanted]
+
+    try:
+        return jsonify(plan_pipeline(data['model'], nodes)), 200
+    except PlanError as e:
+        return jsonify({"error": str(e)}), 422
+
+class NetMatrix:
+    """节点间 RTT/带宽的 N×N 矩阵，按节点下标存放在定长数组中（容量不足时倍增，不超过 max_nodes）
 
-            # 处理删除结果
-            if deleted_rows == 0:
-                app.logger.warning(f"数据库未找到节点记录: {node_name}")
-                db_message = "节点数据库记录不存在"
+    新测量值以指数加权平均合并，同时记录测量时间用于计算数据年龄。
+    只接受已登记的节点（以及控制平面）；节点删除后其行列被清空，下标留给新节点复用。
+    """
+
+    CONTROL_PLANE = 'control-plane'
+    ALPHA = 0.3
+
+    def __init__(self, capacity=64, max_nodes=Config.NetProbeMaxNodes):
+        self._lock = threading.Lock()
+        self._index = {}
+        self._names = []
+        self._free = []
+        self._pruned_version = None
+        self.max_nodes = max_nodes
+        self._alloc(min(capacity, max_nodes))
+
+    def _alloc(self, capacity):
+        old = getattr(self, '_capacity', 0)
+        rtt = array('f', [float('nan')]) * (capacity * capacity)
+        mbps = array('f', [float('nan')]) * (capacity * capacity)
+        measured = array('d', [0.0]) * (capacity * capacity)
+        for i in range(old):
+            src, dst = i * old, i * capacity
+            rtt[dst:dst + old] = self._rtt[src:src + old]
+            mbps[dst:dst + old] = self._mbps[src:src + old]
+            measured[dst:dst + old] = self._measured[src:src + old]
+        self._capacity = capacity
+        self._rtt, self._mbps, self._measured = rtt, mbps, measured
+
+    def _clear(self, index):
+        # 调用方需持有 self._lock；清空该下标所在的行与列
+        capacity = self._capacity
+        row = index * capacity
+        self._rtt[row:row + capacity] = array('f', [float('nan')]) * capacity
+        self._mbps[row:row + capacity] = array('f', [float('nan')]) * capacity
+        self._measured[row:row + capacity] = array('d', [0.0]) * capacity
+        for cell in range(index, capacity * capacity, capacity):
+            self._rtt[cell] = self._mbps[cell] = float('nan')
+            self._measured[cell] = 0.0
+
+    def _prune(self, registered):
+        # 调用方需持有 self._lock
+        for name in [name for name in self._names if name != self.CONTROL_PLANE and name not in registered]:
+            index = self._index.pop(name)
+            self._names.remove(name)
+            self._clear(index)
+            self._free.append(index)
+
+    def prune(self, version, registered):
+        """移除已不在 node 表中的节点；节点快照版本未变时不做任何事"""
+        with self._lock:
+            if version != self._pruned_version:
+                self._prune(registered)
+                self._pruned_version = version
+
+    def _slot(self, name, registered):
+        # 调用方需持有 self._lock；矩阵已满时返回 None
+        index = self._index.get(name)
+        if index is not None:
+            return index
+        if not self._free and len(self._names) >= self._capacity:
+            if self._capacity < self.max_nodes:
+                self._alloc(min(self._capacity * 2, self.max_nodes))
             else:
-                db_message = "节点数据库记录已删除"
-
-        except mysql.connector.Error as err:
-            app.logger.error(f"数据库删除失败: {err}")
-            return jsonify({
-                "error": "节点集群记录已删除，但数据库操作失败",
-                "details": str(err)
-            }), 500
-        finally:
-            if db_conn and db_conn.is_connected():
-                db_cursor.close()
-                db_conn.close()
-
-        # 构造响应
-        output = result.stdout.strip()
-        if "deleted" in output:
-            return jsonify({
-                "status": "200 OK",
-                "message": f"节点 {node_name} 删除成功",
-                "details": {
-                    "kubernetes": output,
-                    "database": db_message
-                }
-            }), 200
+                self._prune(registered)
+        if self._free:
+            index = self._free.pop()
+        elif len(self._names) < self._capacity:
+            index = len(self._names)
         else:
-            return jsonify({
-                "status": "404 Not Found",
-                "message": f"节点 {node_name} 不存在于集群中",
-                "details": {
-                    "database": db_message
-                }
-            }), 404
-
-    except subprocess.CalledProcessError as e:
-        error_msg = e.stderr.strip() or "未知错误"
-        app.logger.error(f"节点删除失败: {error_msg}")
-        return jsonify({
-            "error": "节点删除失败",
-            "details": error_msg
-        }), 500
+            return None
+        self._index[name] = index
+        self._names.append(name)
+        return index
 
-    except Exception as e:
-        app.logger.error(f"系统错误: {str(e)}")
-        return jsonify({
-            "error": "系统内部错误",
-            "details": str(e)
-        }), 500
-
-def update_service_discovery(new_ip: str, type:str, prometheus_url: str = "http://localhost:9999"):
-
-    if type == 'node_exporters':
-        json_path = '~/prometheus/prometheus-3.2.1.linux-amd64/node_exporters.json'
-    if type == 'dcgm':
-        json_path = '~/prometheus/prometheus-3.2.1.linux-amd64/dcgm.json'
-    json_file = Path(json_path).absolute()
-    json_file.parent.mkdir(parents=True, exist_ok=True)
-    
-    # 初始化默认数据结构
-    data = [{"targets": []}]
-    
+    @staticmethod
+    def _valid(item):
+        if not isinstance(item, dict) or not isinstance(item.get('peer'), str):
+            return False
+        for key in ('rtt_ms', 'mbps'):
+            value = item.get(key)
+            if value is None:
+                continue
+            # bool 是 int 的子类，不接受 true/false 作为测量值
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return False
+            if not math.isfinite(value) or value < 0:
+                return False
+        return True
+
+    def update(self, src, measurements, registered, now=None):
+        """合并 src 上报的测量值，返回接受的条数；src 与 peer 需在 registered 中（peer 也可以是控制平面）"""
+        now = now or time.time()
+        accepted = 0
+        if not isinstance(src, str) or src == self.CONTROL_PLANE or src not in registered:
+            return 0
+        with self._lock:
+            i = self._slot(src, registered)
+            if i is None:
+                return 0
+            for item in measurements:
+                if not self._valid(item):
+                    continue
+                peer = item['peer']
+                if peer == src or (peer != self.CONTROL_PLANE and peer not in registered):
+                    continue
+                j = self._slot(peer, registered)
+                if j is None:
+                    continue
+                cell = i * self._capacity + j
+                for values, key in ((self._rtt, 'rtt_ms'), (self._mbps, 'mbps')):
+                    value = item.get(key)
+                    if value is None:
+                        continue
+                    old = values[cell]
+                    values[cell] = value if old != old else (1 - self.ALPHA) * old + self.ALPHA * value
+                self._measured[cell] = now
+                accepted += 1
+        return accepted
+
+    def age(self, src, dst, now=None):
+        with self._lock:
+            i, j = self._index.get(src), self._index.get(dst)
+            if i is None or j is None or not self._measured[i * self._capacity + j]:
+                return None
+            return (now or time.time()) - self._measured[i * self._capacity + j]
+
+    def sample_peers(self, src, candidates, k):
+        """优先选择从未测量或测量最旧的对端，保证每轮的测量量为 O(N*k)"""
+        now = time.time()
+        scored = []
+        for peer in candidates:
+            if peer == src:
+                continue
+            age = self.age(src, peer, now)
+            scored.append((float('inf') if age is None else age, random.random(), peer))
+        scored.sort(reverse=True)
+        return [peer for _, _, peer in scored[:k]]
+
+    def snapshot(self, names=None, max_age=None):
+        now = time.time()
+        with self._lock:
+            names = [name for name in (names or self._names) if name in self._index]
+            rows = {"rtt_ms": [], "mbps": [], "age_s": []}
+            for src in names:
+                i = self._index[src]
+                rtt_row, mbps_row, age_row = [], [], []
+                for dst in names:
+                    cell = i * self._capacity + self._index[dst]
+                    measured = self._measured[cell]
+                    age = now - measured if measured else None
+                    if age is None or (max_age is not None and age > max_age):
+                        rtt_row.append(None)
+                        mbps_row.append(None)
+                        age_row.append(None)
+                        continue
+                    rtt, mbps = self._rtt[cell], self._mbps[cell]
+                    rtt_row.append(None if rtt != rtt else round(rtt, 3))
+                    mbps_row.append(None if mbps != mbps else round(mbps, 1))
+                    age_row.append(round(age, 1))
+                rows["rtt_ms"].append(rtt_row)
+                rows["mbps"].append(mbps_row)
+                rows["age_s"].append(age_row)
+        return dict(nodes=names, **rows)
+
+net_matrix = NetMatrix()
+
+@app.route('/netprobe/peers', methods=['GET'])
+def netprobe_peers():
+    """为节点挑选本轮要测量的对端"""
+    node = request.args.get('node')
+    if not node:
+        return jsonify({"error": "Invalid request"}), 400
+    try:
+        k = max(0, min(int(request.args.get('k', Config.NetProbePeers)), Config.NetProbePeers))
+        nodes, after = [], None
+        while True:
+            page, after = node_snapshot.query(after=after, limit=Config.NodesPageLimit, fields=('name', 'ip'))
+            nodes.extend(page)
+            if after is None:
+                break
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters"}), 400
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    ips = {item['name']: item['ip'] for item in nodes if item['ip']}
+    peers = net_matrix.sample_peers(node, list(ips), k)
+    return jsonify({
+        "peers": [{"name": peer, "ip": ips[peer], "port": Config.NetProbePort} for peer in peers]
+    }), 200
+
+@app.route('/netprobe/report', methods=['POST'])
+def netprobe_report():
+    """批量上报测量结果: {"node": name, "measurements": [{"peer", "rtt_ms", "mbps"}, ...]}"""
+    data = request.json
+    if (not isinstance(data, dict) or not isinstance(data.get('node'), str) or not data['node']
+            or not isinstance(data.get('measurements'), list)):
+        return jsonify({"error": "Invalid request"}), 400
+    try:
+        version, registered = node_snapshot.registered()
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    if data['node'] not in registered:
+        return jsonify({"error": "Unknown node"}), 404
+    net_matrix.prune(version, registered)
+    accepted = net_matrix.update(data['node'], data['measurements'][:Config.NetProbeMaxReport], registered)
+    return jsonify({"status": "ok", "accepted": accepted}), 200
+
+@app.route('/netprobe/matrix', methods=['GET'])
+def netprobe_matrix():
+    """查询矩阵，可选 nodes（逗号分隔）与 max_age（秒，更旧的测量视为缺失）"""
+    names = [name for name in request.args.get('nodes', '').split(',') if name] or None
+    try:
+        max_age = float(request.args['max_age']) if 'max_age' in request.args else None
+    except ValueError:
+        return jsonify({"error": "Invalid query parameters"}), 400
+    try:
+        net_matrix.prune(*node_snapshot.registered())
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    return jsonify(net_matrix.snapshot(names, max_age)), 200
+
+@app.route('/netprobe/sink', methods=['POST'])
+def netprobe_sink():
+    """吞吐测量：读取并丢弃请求体，必须声明 Content-Length 且不超过 NetProbeSinkMaxBytes"""
+    length = request.content_length
+    if length is None or length > Config.NetProbeSinkMaxBytes:
+        return jsonify({"error": "Payload too large"}), 413
+    received = 0
+    while received < length:
+        chunk = request.stream.read(min(64 * 1024, length - received))
+        if not chunk:
+            break
+        received += len(chunk)
+    return jsonify({"received": received}), 200
+
+# 集群日志聚合：有界线程池 + 长连接池并发查询各节点的日志服务
+log_fanout_pool = ThreadPoolExecutor(max_workers=Config.LogFanoutWorkers, thread_name_prefix='log-fanout')
+log_session = requests.Session()
+log_session.mount('http://', HTTPAdapter(
+    pool_connections=Config.LogFanoutWorkers, pool_maxsize=Config.LogFanoutWorkers, max_retries=0
+))
+
+def read_body(resp, deadline):
+    """读取响应体，超过截止时间即放弃；requests 的读超时只限制单次读取，慢速节点可能一直占用工作线程"""
+    chunks = []
+    with resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(64 * 1024):
+            if time.monotonic() > deadline:
+                raise requests.exceptions.Timeout("log fan-out deadline exceeded")
+            chunks.append(chunk)
+    return b''.join(chunks)
+
+def fetch_node_log(ip, params, deadline):
+    """返回 [(ts, line)]；时间戳由节点解析（续行沿用上一行），控制平面不再逐行解析"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise requests.exceptions.Timeout("log fan-out deadline exceeded")
+    base = f"http://{ip}:{Config.LogServicePort}"
+    timeout = (min(1.0, remaining), min(Config.LogFanoutTimeout, remaining))
+    if any(key in params for key in ('start', 'end', 'level', 'contains')):
+        resp = log_session.get(f"{base}/molink_log/query", params=params, timeout=timeout, stream=True)
+        return [
+            (item.get('ts'), item.get('line', ''))
+            for item in map(json.loads, read_body(resp, deadline).splitlines()) if item
+        ]
+    resp = log_session.post(f"{base}/molink_log", json={"n": params.get('n', 10)}, timeout=timeout, stream=True)
+    result = json.loads(read_body(resp, deadline))
+    lines = result.get('lines', [])
+    timestamps = result.get('ts')
+    if not isinstance(timestamps, list) or len(timestamps) != len(lines):
+        # 旧版本节点不返回时间戳，这些行排在最前
+        timestamps = [None] * len(lines)
+    return list(zip(timestamps, lines))
+
+@app.route('/k8s_logs', methods=['GET', 'POST'])
+def cluster_logs():
+    """并发拉取所有已注册节点的日志，按时间戳合并并标注节点
+
+    参数: n（每个节点最后n行）或 start/end/level/contains（透传给节点的 /molink_log/query），
+    nodes（可选，节点名列表）。慢节点或失联节点不会阻塞整体响应，其状态单独返回。
+    """
+    params = dict(request.args)
+    body = request.get_json(silent=True)
+    if isinstance(body, dict):
+        params.update(body)
+    names = params.pop('nodes', None)
+    if isinstance(names, str):
+        names = [name for name in names.split(',') if name]
+    elif names is not None and (not isinstance(names, list) or not all(isinstance(name, str) for name in names)):
+        return jsonify({"error": "nodes must be a list of node names or a comma-separated string"}), 400
+
+    conn = None
     try:
-        # 读取现有文件内容
-        if json_file.exists():
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-                if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        if names:
+            placeholders = ', '.join(['%s'] * len(names))
+            cursor.execute(f"SELECT name, ip FROM node WHERE name IN ({placeholders})", tuple(names))
+        else:
+            cursor.execute("SELECT name, ip FROM node")
+        nodes = {name: ip for name, ip in cursor.fetchall() if ip}
+    except DatabaseError as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+    # 截止时间同时传给每个拉取任务：超时后仍在运行的任务也会尽快结束，不会继续占用线程池
+    deadline = time.monotonic() + Config.LogFanoutDeadline
+    futures = {log_fanout_pool.submit(fetch_node_log, ip, params, deadline): name for name, ip in nodes.items()}
+    done, _ = wait(futures, timeout=Config.LogFanoutDeadline)
+
+    node_status = {}
+    merged = []
+    for future, name in futures.items():
+        status = {"ip": nodes[name]}
+        if future not in done:
+            future.cancel()
+            status.update({"status": "timeout"})
+        elif future.exception() is not None:
+            status.update({"status": "error", "error": str(future.exception())})
+        else:
+            lines = future.result()
+            status.update({"status": "ok", "lines": len(lines)})
+            merged.extend((ts, name, line) for ts, line in lines)
+        node_status[name] = status
+
+    # 无时间戳的行排在最前，同一时间戳内保持节点内原有顺序
+    merged.sort(key=lambda item: (item[0] is not None, item[0] or 0, item[1]))
+    failed = sum(1 for status in node_status.values() if status['status'] != 'ok')
+    return jsonify({
+        "status": "success" if not failed else "partial",
+        "nodes": node_status,
+        "lines": [{"node": name, "ts": ts, "line": line} for ts, name, line in merged]
+    }), 200
+
+class ServiceDiscoveryRegistry:
+    """Prometheus 服务发现目标的进程内注册表
+
+    启动后只读取一次配置文件，按 target 建立索引；增删操作只修改内存，
+    由后台线程把一段时间内的变更合并成一次原子写（临时文件 + os.replace）。
+    """
+
+    def __init__(self, type, json_path, port, debounce=0.5, labels=None):
+        self.type = type
+        self.json_file = Path(json_path).expanduser().absolute()
+        self.port = port
+        self.debounce = debounce
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._groups = None
+        self._index = {}
+        self._version = 0
+        self._written_version = 0
+        self._snapshot = None
+        self._thread = None
+
+    def _load(self):
+        # 调用方需持有 self._lock
+        if self._groups is not None:
+            return
+        groups = [{"targets": []}]
+        try:
+            if self.json_file.exists():
+                with open(self.json_file, 'r') as f:
+                    groups = json.load(f)
+                if not isinstance(groups, list) or not all(isinstance(item, dict) for item in groups):
                     raise ValueError("Invalid JSON structure")
-    except (json.JSONDecodeError, ValueError) as e:
-        print(f"配置文件 {json_path} 格式错误，将创建新文件。错误详情: {str(e)}")
-        data = [{"targets": []}]
-
-    # 构造完整目标地址
-    if type == 'node_exporters':
-        new_target = f"{new_ip.strip()}:9100"
-    if type == 'dcgm':
-        new_target = f"{new_ip.strip()}:9400"
-    
-    # 检查是否已存在重复项
-    existing_targets = set()
-    for group in data:
-        if "targets" in group and isinstance(group["targets"], list):
-            existing_targets.update(group["targets"])
-    
-    if new_target in existing_targets:
-        print(f"目标 {new_target} 已存在，无需重复添加")
-        return
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"配置文件 {self.json_file} 格式错误，将创建新文件。错误详情: {str(e)}")
+            groups = [{"targets": []}]
+        if not groups:
+            groups = [{"targets": []}]
+        if self.labels:
+            groups[0].setdefault("labels", dict(self.labels))
+        for group in groups:
+            if not isinstance(group.get("targets"), list):
+                group["targets"] = []
+            for target in group["targets"]:
+                self._index.setdefault(target, group)
+        self._groups = groups
 
-    # 添加新目标到第一个目标组（兼容多组结构）
-    if data and "targets" in data[0]:
-        data[0]["targets"].append(new_target)
-    else:
-        data = [{"targets": [new_target]}]
+    def _start(self):
+        # 调用方需持有 self._lock
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f'sd-writer-{self.type}', daemon=True
+            )
+            self._thread.start()
+
+    def _changed(self):
+        self._version += 1
+        self._snapshot = None
+        self._start()
+        self._dirty.set()
+
+    def target(self, ip):
+        return f"{ip.strip()}:{self.port}"
+
+    def add(self, ips):
+        added = []
+        with self._lock:
+            self._load()
+            for ip in ips:
+                new_target = self.target(ip)
+                if new_target in self._index:
+                    continue
+                # 添加新目标到第一个目标组（兼容多组结构）
+                self._groups[0]["targets"].append(new_target)
+                self._index[new_target] = self._groups[0]
+                added.append(new_target)
+            if added:
+                self._changed()
+        return added
+
+    def remove(self, ips):
+        removed = []
+        with self._lock:
+            self._load()
+            for ip in ips:
+                old_target = self.target(ip)
+                group = self._index.pop(old_target, None)
+                if group is None:
+                    continue
+                group["targets"].remove(old_target)
+                removed.append(old_target)
+            if removed:
+                self._changed()
+        return removed
+
+    def snapshot(self):
+        """返回 (etag, body)，内容不变时复用同一份序列化结果"""
+        with self._lock:
+            self._load()
+            if self._snapshot is None:
+                body = json.dumps(self._groups, separators=(',', ':')).encode()
+                etag = f'"{self._version}-{hashlib.sha1(body).hexdigest()[:16]}"'
+                self._snapshot = (etag, body)
+            return self._snapshot
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if self._groups is None or self._written_version == self._version:
+                    return
+                version = self._version
+                body = json.dumps(self._groups, indent=2)
+            start = time.perf_counter()
+            self.json_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=self.json_file.parent, prefix=f".{self.json_file.name}."
+            )
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    f.write(body)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.chmod(tmp_path, 0o644)
+                # Prometheus 只会看到旧文件或完整的新文件
+                os.replace(tmp_path, self.json_file)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            finally:
+                sd_write_latency.labels(self.type).observe(time.perf_counter() - start)
+            self._written_version = version
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            time.sleep(self.debounce)
+            self._dirty.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                app.logger.error(f"写入服务发现文件失败 {self.json_file}: {str(e)}")
+                self._dirty.set()
+
+service_discovery = {
+    'node_exporters': ServiceDiscoveryRegistry(
+        'node_exporters', '~/prometheus/prometheus-3.2.1.linux-amd64/node_exporters.json', 9100
+    ),
+    'dcgm': ServiceDiscoveryRegistry(
+        'dcgm', '~/prometheus/prometheus-3.2.1.linux-amd64/dcgm.json', 9400
+    ),
+    # 控制平面自身的 /metrics；证书持久保存在 Config.TlsCertFile，抓取任务用 tls_config.ca_file 指向它校验
+    'molink_backend': ServiceDiscoveryRegistry(
+        'molink_backend', '~/prometheus/prometheus-3.2.1.linux-amd64/molink_backend.json',
+        int(Config.ListenAddr.split(':')[1]), labels={"__scheme__": "https"}
+    ),
+}
+
+def flush_service_discovery():
+    for registry in service_discovery.values():
+        registry.flush()
+
+atexit.register(flush_service_discovery)
+
+def update_service_discovery(new_ips, type:str, prometheus_url: str = "http://localhost:9999"):
+    """把一个或一批 IP 加入 Prometheus 服务发现，文件由后台线程合并写入"""
+    if isinstance(new_ips, str):
+        new_ips = [new_ips]
+    added = service_discovery[type].add(new_ips)
+    if added:
+        print(f"成功添加目标 {', '.join(added)} 到 {service_discovery[type].json_file}")
+
+def remove_service_discovery(ips):
+    """从所有服务发现配置中移除节点"""
+    if isinstance(ips, str):
+        ips = [ips]
+    for registry in service_discovery.values():
+        removed = registry.remove(ips)
+        if removed:
+            print(f"已从 {registry.json_file} 移除目标 {', '.join(removed)}")
+
+@app.route('/sd/<type>', methods=['GET'])
+def http_service_discovery(type):
+    """Prometheus http_sd 接口，直接返回内存中的注册表，支持 ETag/304"""
+    if not Config.HttpSdEnabled or type not in service_discovery:
+        return jsonify({"error": "Not found"}), 404
+    etag, body = service_discovery[type].snapshot()
+    if etag in request.headers.get('If-None-Match', ''):
+        return app.response_class(status=304, headers={"ETag": etag})
+    return app.response_class(body, mimetype='application/json', headers={"ETag": etag})
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_latency.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
+def admission_gauges():
+    for name, controller in admission_controllers.items():
+        yield (name, 'in_flight'), controller.in_flight
+        yield (name, 'queued'), len(controller._waiters)
+
+metrics_registry.callback(
+    'molink_admission_requests', 'Requests in flight and queued per route', ('route', 'state'), admission_gauges
+)
+metrics_registry.callback(
+    'molink_admission_rejections_total', 'Requests shed or timed out in the admission queue', ('route', 'reason'),
+    lambda: [((name, reason), getattr(controller, reason))
+             for name, controller in admission_controllers.items() for reason in ('shed', 'timeouts')],
+    type='counter'
+)
+metrics_registry.callback(
+    'molink_token_cache_lookups_total', 'kubeadm token cache lookups and refreshes', ('result',),
+    lambda: [((field,), value) for field, value in token_cache.stats().items()
+             if field in ('hits', 'misses', 'refreshes', 'refresh_failures')],
+    type='counter'
+)
+metrics_registry.callback(
+    'molink_node_informer', 'Node informer cache state', ('field',),
+    lambda: [((field,), float(value)) for field, value in node_informer.stats().items()
+             if field in ('synced', 'nodes', 'ready', 'pending')]
+)
+metrics_registry.callback(
+    'molink_node_informer_events_total', 'Node informer list/watch activity', ('kind',),
+    lambda: [((field,), value) for field, value in node_informer.stats().items()
+             if field in ('lists', 'watches', 'events', 'reconnects', 'flushes', 'flush_failures')],
+    type='counter'
+)
+metrics_registry.callback(
+    'molink_db_pool_connections', 'Database pool connections by state', ('state',),
+    lambda: [((field,), value) for field, value in (db_storage.stats() if db_storage else {}).items()
+             if field in ('open', 'idle', 'in_use', 'waiting', 'max_open', 'utilization')]
+)
+metrics_registry.callback(
+    'molink_db_pool_events_total', 'Database pool checkouts, waits, timeouts and connection churn', ('event',),
+    lambda: [((field,), value) for field, value in (db_storage.stats() if db_storage else {}).items()
+             if field in ('checkouts', 'waits', 'timeouts', 'created', 'recycled', 'discarded', 'connect_failures')],
+    type='counter'
+)
+metrics_registry.callback(
+    'molink_removal_jobs', 'Node removal jobs in progress', (), lambda: [((), removal_jobs.active())]
+)
 
-    # 写入更新后的文件
-    with open(json_file, 'w') as f:
-        json.dump(data, f, indent=2)
-    print(f"成功添加目标 {new_target} 到 {json_file}")
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return app.response_class(metrics_registry.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='MoLink control plane')
+    parser.add_argument('--hash-passwords', action='store_true',
+                        help='将 users 表中的明文密码替换为预计算哈希后退出')
+    parser.add_argument('--migrate', action='store_true',
+                        help='把数据库表结构升级到当前版本后退出')
+    args = parser.parse_args()
+    if args.migrate:
+        applied = migrate(open_storage(Config), log=print)
+        print(f"schema version {SCHEMA_VERSION}" + ("" if applied else " (already up to date)"))
+        raise SystemExit(0)
+    check_schema_version()
+    if args.hash_passwords:
+        print(f"已更新 {hash_stored_passwords()} 条用户密码")
+        raise SystemExit(0)
+    if Config.InformerEnabled:
+        node_informer.start()
+    if Config.MetricsSelfScrape:
+        update_service_discovery(Config.MetricsSelfTarget, 'molink_backend')
+    # 开发用的 Werkzeug 服务器；生产部署使用 serve.py
+    from serve import ensure_certificate, server_ssl_context
     app.run(
         host=Config.ListenAddr.split(':')[0],
         port=int(Config.ListenAddr.split(':')[1]),
-        ssl_context='adhoc'
+        ssl_context=server_ssl_context(*ensure_certificate(Config.TlsCertFile, Config.TlsKeyFile)),
+        threaded=True
     )
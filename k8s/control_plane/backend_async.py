@@ -0,0 +1,183 @@
+# backend_async.py
+# 基于 asyncio 的控制平面服务模式，只提供 /k8s（以及 /metrics）：令牌校验与密码哈希不占用请求线程。
+# /k8s_complete、/k8s_fail、/k8s_delete 等其余路由的准入控制、幂等与删除任务都在 backend.py 中，
+# 由同时运行的 backend.py 提供（反向代理按路径转发），这里不再重复实现。
+# 依赖: quart, aiomysql, hypercorn
+# 运行: python backend_async.py --certfile cert.pem --keyfile key.pem
+import asyncio
+import functools
+import time
+
+import aiomysql
+from quart import Quart, request, jsonify, g
+
+from backend import (
+    Config,
+    token_cache,
+    issue_session_token,
+    verify_user_password,
+    metrics_registry,
+    request_latency,
+    subprocess_latency,
+    token_validations,
+)
+from metrics import CONTENT_TYPE
+
+app = Quart(__name__)
+
+# 在 before_serving 中初始化，保证绑定到服务所在的事件循环
+db_pool = None
+subprocess_slots = None
+
+@app.before_serving
+async def startup():
+    global db_pool, subprocess_slots
+    if Config.DbType != 'mysql':
+        raise RuntimeError("backend_async.py only supports Config.DbType = 'mysql'")
+    db_pool = await aiomysql.create_pool(
+        host=Config.DbHost,
+        port=Config.DbPort,
+        user=Config.DbUser,
+        password=Config.DbPwd,
+        db=Config.DbName,
+        minsize=Config.MaxIdleConns,
+        maxsize=Config.MaxOpenConns,
+        pool_recycle=Config.MaxLifeTime,
+        autocommit=False
+    )
+    subprocess_slots = asyncio.Semaphore(Config.MaxSubprocesses)
+    token_cache.start()
+
+@app.after_serving
+async def shutdown():
+    if db_pool is not None:
+        db_pool.close()
+        await db_pool.wait_closed()
+
+def with_deadline(seconds=None):
+    """为路由设置截止时间，超时返回 504 并取消仍在执行的协程"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await asyncio.wait_for(
+                    func(*args, **kwargs), seconds or Config.RequestDeadline
+                )
+            except asyncio.TimeoutError:
+                app.logger.error(f"Request deadline exceeded: {request.path}")
+                return jsonify({"error": "Request deadline exceeded"}), 504
+        return wrapper
+    return decorator
+
+@app.before_request
+async def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+async def observe_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_latency.labels(route, request.method, str(response.status_code)).observe(time.perf_counter() - start)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    return metrics_registry.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+async def run_command(cmd, timeout):
+    """在并发信号量内执行外部命令，超时则杀掉子进程"""
+    async with subprocess_slots:
+        start = time.perf_counter()
+        result = 'timeout'
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+            result = 'ok' if proc.returncode == 0 else 'error'
+        except BaseException:
+            # 超时或请求被取消时不留下孤儿进程
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        finally:
+            subprocess_latency.labels(' '.join(cmd[:2]), result).observe(time.perf_counter() - start)
+    return proc.returncode, stdout.decode().strip(), stderr.decode().strip()
+
+async def validate_kubeadm_token(token):
+    valid = await lookup_kubeadm_token(token)
+    token_validations.labels('kubeadm', 'ok' if valid else 'failure').inc()
+    return valid
+
+async def lookup_kubeadm_token(token):
+    generation = token_cache.generation
+    if token_cache.lookup(token):
+        return True
+    if not isinstance(token, str) or not token:
+        return False
+    # 未命中时在线程中刷新（single-flight），不阻塞事件循环
+    await asyncio.to_thread(token_cache.refresh, generation)
+    return token_cache.lookup(token, count=False)
+
+async def fetch_user(username):
+    async with db_pool.acquire() as conn:
+        async with conn.cursor(aiomysql.DictCursor) as cursor:
+            await cursor.execute("""
+                SELECT id, password
+                FROM users
+                WHERE username = %s
+            """, (username,))
+            return await cursor.fetchone()
+
+@app.route('/k8s', methods=['POST'])
+@with_deadline()
+async def k8s_join():
+    data = await request.get_json()
+    required_fields = ['token', 'hash', 'username', 'user_password', 'node_name']
+    if not data or not all(field in data for field in required_fields):
+        return jsonify({"error": "Missing required fields"}), 400
+    if not isinstance(data['node_name'], str) or not data['node_name'].strip():
+        return jsonify({"error": "Invalid node_name"}), 400
+
+    # 验证token有效性
+    if not await validate_kubeadm_token(data['token']):
+        return jsonify({"error": "Invalid token"}), 401
+
+    try:
+        user = await fetch_user(data['username'])
+    except aiomysql.Error as err:
+        app.logger.error(f"Database error: {err}")
+        return jsonify({"error": "Database error"}), 500
+
+    if not user:
+        return jsonify({"error": "User not found"}), 401
+    # 哈希校验是 CPU 密集操作，放到线程中执行
+    if not await asyncio.to_thread(verify_user_password, user['password'], data['user_password']):
+        return jsonify({"error": "Invalid password"}), 401
+
+    session_token = issue_session_token(data['username'], user['id'], data['node_name'].strip())
+    return jsonify({
+        "status": "200 OK",
+        "session_token": session_token,
+        "expires_in": Config.SessionTTL
+    }), 200
+
+if __name__ == '__main__':
+    import argparse
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config as HypercornConfig
+
+    parser = argparse.ArgumentParser(description='MoLink control plane (asyncio)')
+    parser.add_argument('--certfile', required=True, help='TLS 证书')
+    parser.add_argument('--keyfile', required=True, help='TLS 私钥')
+    args = parser.parse_args()
+
+    server_config = HypercornConfig()
+    server_config.bind = [Config.ListenAddr]
+    server_config.certfile = args.certfile
+    server_config.keyfile = args.keyfile
+    asyncio.run(serve(app, server_config))
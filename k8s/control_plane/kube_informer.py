@@ -0,0 +1,378 @@
+# kube_informer.py
+# 基于 list + watch 的 Kubernetes Node 本地缓存。
+# 启动时 list 一次，之后从返回的 resourceVersion 开始 watch；断线后从最后一个 resourceVersion 续传，
+# 只有在服务端返回 410 Gone（版本过旧）时才重新 list。
+# 节点状态变化通过 on_change 回调批量交给调用方（如写回 node 表）。
+# 依赖: requests, PyYAML
+import argparse
+import atexit
+import base64
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import requests
+import yaml
+
+# node.status 取值
+NODE_NOT_READY = 0
+NODE_READY = 1
+NODE_CORDONED = 2  # Ready 但已设置为不可调度（正在移除）
+
+GPU_RESOURCE = "nvidia.com/gpu"
+
+class ResourceExpired(Exception):
+    """watch 的 resourceVersion 已被压缩，需要重新 list"""
+
+def _materialize(data, suffix):
+    """kubeconfig 中的 *-data 字段写入临时文件，供 requests 使用"""
+    fd, path = tempfile.mkstemp(prefix="molink-kube-", suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(base64.b64decode(data))
+    atexit.register(lambda: os.path.exists(path) and os.unlink(path))
+    return path
+
+def _named(items, name):
+    for item in items or []:
+        if item.get("name") == name:
+            return item
+    raise ValueError(f"kubeconfig: '{name}' not found")
+
+def load_kubeconfig(path, context=None):
+    """解析 kubeconfig，返回 (server, requests.Session)"""
+    with open(path, "r") as f:
+        config = yaml.safe_load(f) or {}
+    context = _named(config.get("contexts"), context or config.get("current-context"))["context"]
+    cluster = _named(config.get("clusters"), context["cluster"])["cluster"]
+    user = _named(config.get("users"), context["user"]).get("user") or {}
+    base = os.path.dirname(os.path.abspath(path))
+
+    session = requests.Session()
+    if cluster.get("insecure-skip-tls-verify"):
+        session.verify = False
+    elif cluster.get("certificate-authority-data"):
+        session.verify = _materialize(cluster["certificate-authority-data"], ".crt")
+    elif cluster.get("certificate-authority"):
+        session.verify = os.path.join(base, cluster["certificate-authority"])
+
+    if user.get("client-certificate-data"):
+        session.cert = (_materialize(user["client-certificate-data"], ".crt"),
+                        _materialize(user["client-key-data"], ".key"))
+    elif user.get("client-certificate"):
+        session.cert = (os.path.join(base, user["client-certificate"]),
+                        os.path.join(base, user["client-key"]))
+    token = user.get("token")
+    if not token and user.get("tokenFile"):
+        with open(os.path.join(base, user["tokenFile"]), "r") as f:
+            token = f.read().strip()
+    if token:
+        session.headers["Authorization"] = f"Bearer {token}"
+    return cluster["server"].rstrip("/"), session
+
+class KubeClient:
+    """只实现 Node 的 list 与 watch"""
+
+    def __init__(self, server, session=None, timeout=10):
+        self.server = server.rstrip("/")
+        self.session = session or requests.Session()
+        self.timeout = timeout
+
+    @classmethod
+    def from_kubeconfig(cls, path, context=None):
+        return cls(*load_kubeconfig(path, context))
+
+    def list_nodes(self, limit=500):
+        """分页 list，返回 (items, resourceVersion)"""
+        items = []
+        params = {"limit": limit}
+        while True:
+            resp = self.session.get(f"{self.server}/api/v1/nodes", params=params, timeout=self.timeout)
+            resp.raise_for_status()
+            body = resp.json()
+            items.extend(body.get("items") or [])
+            metadata = body.get("metadata") or {}
+            if not metadata.get("continue"):
+                return items, metadata.get("resourceVersion")
+            params["continue"] = metadata["continue"]
+
+    def watch_nodes(self, resource_version, timeout_seconds=300):
+        """逐个产出 watch 事件 (type, object)；服务端在 timeout_seconds 后正常结束"""
+        params = {
+            "watch": "true",
+            "allowWatchBookmarks": "true",
+            "timeoutSeconds": timeout_seconds,
+        }
+        if resource_version:
+            params["resourceVersion"] = resource_version
+        with self.session.get(f"{self.server}/api/v1/nodes", params=params, stream=True,
+                              timeout=(self.timeout, timeout_seconds + 30)) as resp:
+            if resp.status_code == 410:
+                raise ResourceExpired()
+            resp.raise_for_status()
+            for line in resp.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                obj = event.get("object") or {}
+                if event.get("type") == "ERROR":
+                    if obj.get("code") == 410:
+                        raise ResourceExpired()
+                    raise requests.exceptions.RequestException(obj.get("message") or "watch error")
+                yield event.get("type"), obj
+
+def summarize_node(obj):
+    """从 Node 对象中提取缓存字段"""
+    metadata = obj.get("metadata") or {}
+    status = obj.get("status") or {}
+    conditions = {c.get("type"): c.get("status") for c in status.get("conditions") or []}
+    ready = conditions.get("Ready") == "True"
+    unschedulable = bool((obj.get("spec") or {}).get("unschedulable"))
+    addresses = {a.get("type"): a.get("address") for a in status.get("addresses") or []}
+    try:
+        gpus = int((status.get("allocatable") or {}).get(GPU_RESOURCE, 0))
+    except (TypeError, ValueError):
+        gpus = 0
+    if not ready:
+        code = NODE_NOT_READY
+    elif unschedulable:
+        code = NODE_CORDONED
+    else:
+        code = NODE_READY
+    return {
+        "name": metadata.get("name"),
+        "ready": ready,
+        "unschedulable": unschedulable,
+        "conditions": conditions,
+        "allocatable_gpus": gpus,
+        "internal_ip": addresses.get("InternalIP"),
+        "status": code,
+        "resource_version": metadata.get("resourceVersion"),
+    }
+
+class NodeInformer:
+    """Node 的本地缓存
+
+    只有 status（Ready/NotReady/Cordoned）变化时才记入待写回集合，kubelet 心跳引起的
+    MODIFIED 事件只更新缓存；待写回集合每 batch_interval 秒交给 on_change 一次。
+    未完成首次同步前，exists/is_ready 返回 None，调用方应回退到 kubectl。
+    """
+
+    def __init__(self, client_factory, on_change=None, batch_interval=2.0,
+                 watch_timeout=300, max_backoff=30, logger=None):
+        self.client_factory = client_factory
+        self.on_change = on_change
+        self.batch_interval = batch_interval
+        self.watch_timeout = watch_timeout
+        self.max_backoff = max_backoff
+        self.logger = logger
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._synced = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self.resource_version = None
+        self.lists = 0
+        self.watches = 0
+        self.events = 0
+        self.reconnects = 0
+        self.flushes = 0
+        self.flush_failures = 0
+        self.last_event = None
+        self.last_error = None
+
+    def start(self):
+        if self._threads:
+            return
+        with self._start_lock:
+            if self._threads:
+                return
+            self._threads = [
+                threading.Thread(target=self._run, name='node-informer', daemon=True),
+                threading.Thread(target=self._flush_loop, name='node-informer-flush', daemon=True),
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.flush()
+
+    def wait_synced(self, timeout=None):
+        return self._synced.wait(timeout)
+
+    @property
+    def synced(self):
+        return self._synced.is_set()
+
+    def get(self, name):
+        return self._nodes.get(name.lower())
+
+    def exists(self, name):
+        if not self.synced:
+            return None
+        return name.lower() in self._nodes
+
+    def is_ready(self, name):
+        if not self.synced:
+            return None
+        node = self.get(name)
+        return bool(node and node["ready"])
+
+    def status_of(self, name, default=NODE_NOT_READY):
+        node = self.get(name)
+        return node["status"] if node else default
+
+    def nodes(self):
+        return dict(self._nodes)
+
+    def _log(self, message, exc_info=False):
+        if self.logger is not None:
+            self.logger.warning(message, exc_info=exc_info)
+
+    def _apply(self, name, summary):
+        """更新缓存；status 变化时记入待写回集合（summary 为 None 表示节点已删除）"""
+        with self._lock:
+            previous = self._nodes.get(name)
+            if summary is None:
+                self._nodes.pop(name, None)
+            else:
+                self._nodes[name] = summary
+        old = previous["status"] if previous else None
+        new = summary["status"] if summary else None
+        if old != new:
+            with self._pending_lock:
+                self._pending[name] = summary
+
+    def _relist(self, client):
+        items, resource_version = client.list_nodes()
+        fresh = {}
+        for obj in items:
+            summary = summarize_node(obj)
+            if summary["name"]:
+                fresh[summary["name"]] = summary
+        for name in set(self._nodes) - set(fresh):
+            self._apply(name, None)
+        for name, summary in fresh.items():
+            self._apply(name, summary)
+        self.resource_version = resource_version
+        self.lists += 1
+        self._synced.set()
+
+    def _run(self):
+        client = None
+        backoff = 1
+        while not self._stop.is_set():
+            try:
+                if client is None:
+                    client = self.client_factory()
+                if not self.synced or self.resource_version is None:
+                    self._relist(client)
+                self.watches += 1
+                for event_type, obj in client.watch_nodes(self.resource_version, self.watch_timeout):
+                    if self._stop.is_set():
+                        return
+                    self.events += 1
+                    self.last_event = time.time()
+                    resource_version = (obj.get("metadata") or {}).get("resourceVersion")
+                    if event_type in ("ADDED", "MODIFIED"):
+                        summary = summarize_node(obj)
+                        self._apply(summary["name"], summary)
+                    elif event_type == "DELETED":
+                        self._apply((obj.get("metadata") or {}).get("name"), None)
+                    # BOOKMARK 只推进 resourceVersion
+                    if resource_version:
+                        self.resource_version = resource_version
+                backoff = 1
+            except ResourceExpired:
+                self._log("node watch: resourceVersion expired, relisting")
+                self.resource_version = None
+            except Exception as e:
+                # 任何异常都不能结束监听线程，否则 node.status 会停止更新
+                self.reconnects += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                if isinstance(e, (requests.exceptions.RequestException, OSError, ValueError, KeyError, yaml.YAMLError)):
+                    # 网络错误、响应截断或 kubeconfig 错误：从最后的 resourceVersion 续传，不重新 list
+                    self._log(f"node watch failed: {self.last_error}")
+                else:
+                    # 意料之外的异常（如格式异常的事件）：记录堆栈，退避后重新 list，跳过无法处理的事件
+                    self._log(f"node watch failed: {self.last_error}", exc_info=True)
+                    self.resource_version = None
+                self._stop.wait(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.batch_interval):
+            self.flush()
+
+    def flush(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        if not pending or self.on_change is None:
+            return
+        try:
+            self.on_change(pending)
+            self.flushes += 1
+        except Exception as e:
+            self.flush_failures += 1
+            self.last_error = str(e)
+            self._log(f"node status flush failed: {e}")
+            # 放回待写回集合，较新的变化优先
+            with self._pending_lock:
+                for name, summary in pending.items():
+                    self._pending.setdefault(name, summary)
+
+    def stats(self):
+        nodes = self._nodes
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "synced": self.synced,
+            "nodes": len(nodes),
+            "ready": sum(1 for node in nodes.values() if node["ready"]),
+            "resource_version": self.resource_version,
+            "lists": self.lists,
+            "watches": self.watches,
+            "events": self.events,
+            "reconnects": self.reconnects,
+            "pending": pending,
+            "flushes": self.flushes,
+            "flush_failures": self.flush_failures,
+            "last_event": self.last_event,
+            "last_error": self.last_error,
+        }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='MoLink节点状态监听（打印状态变化）',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--kubeconfig', default=os.path.expanduser('~/.kube/config'), help='kubeconfig 路径')
+    parser.add_argument('--server', help='直接指定 API server 地址（如本地假服务），忽略 kubeconfig')
+    parser.add_argument('--context', help='kubeconfig 上下文，缺省为 current-context')
+    parser.add_argument('--batch-interval', type=float, default=2.0, help='状态变化的合并周期（秒）')
+    args = parser.parse_args()
+
+    def factory():
+        if args.server:
+            return KubeClient(args.server)
+        return KubeClient.from_kubeconfig(args.kubeconfig, args.context)
+
+    def show(changes):
+        for name, summary in sorted(changes.items()):
+            print(json.dumps({"node": name, "status": summary and summary["status"], "summary": summary},
+                             ensure_ascii=False), flush=True)
+
+    informer = NodeInformer(factory, on_change=show, batch_interval=args.batch_interval)
+    informer.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(informer.stats(), ensure_ascii=False), flush=True)
+    except KeyboardInterrupt:
+        informer.stop()
@@ -0,0 +1,188 @@
+# metrics.py
+# 进程内指标聚合与 Prometheus 文本格式（0.0.4）输出。
+# 直方图使用固定桶，observe 只做一次二分查找和一次加锁累加；
+# 带标签的子指标在首次使用时创建并缓存，之后的查找只是一次字典访问。
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class LatencyHistogram:
+    """固定桶的耗时直方图（秒），observe 为 O(log 桶数)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q):
+        """按桶上界估算分位数，落在最后一个桶之外时返回 None"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            cumulative = []
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                cumulative.append([bound, seen])
+            return {"buckets": cumulative, "count": self.count, "sum": round(self.sum, 4)}
+
+    def samples(self):
+        """返回 (累计桶计数, count, sum)，最后一个桶为 +Inf"""
+        with self._lock:
+            counts = list(self.counts)
+            count, total = self.count, self.sum
+        cumulative = []
+        seen = 0
+        for value in counts:
+            seen += value
+            cumulative.append(seen)
+        return cumulative, count, total
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class Family:
+    """同名指标按标签值分组；无标签时可直接调用 observe/inc"""
+
+    def __init__(self, name, help, type, labelnames, factory):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.factory = factory
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: expected labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self.factory())
+        return child
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    @contextmanager
+    def time(self, *values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*values).observe(time.perf_counter() - start)
+
+    def children(self):
+        with self._lock:
+            return sorted(self._children.items(), key=lambda item: item[0])
+
+    def render(self, lines):
+        for values, child in self.children():
+            if self.type == 'counter':
+                lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(child.value)}')
+                continue
+            cumulative, count, total = child.samples()
+            for bound, seen in zip(child.buckets + (float('inf'),), cumulative):
+                le = f'le="{_number(float(bound))}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, values, le)} {seen}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, values)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, values)} {count}')
+
+class CallbackMetric:
+    """抓取时才计算的指标，fn 返回 [(标签值元组, 数值)]；用于导出已有对象内部的计数"""
+
+    def __init__(self, name, help, type, labelnames, fn):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self, lines):
+        for values, value in self.fn():
+            if value is None:
+                continue
+            lines.append(f'{self.name}{_labels(self.labelnames, values)} {_number(float(value))}')
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._names = set()
+
+    def _register(self, metric):
+        if metric.name in self._names:
+            raise ValueError(f"duplicate metric {metric.name}")
+        self._names.add(metric.name)
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Family(name, help, 'counter', labelnames, Counter))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        buckets = tuple(buckets)
+        return self._register(Family(name, help, 'histogram', labelnames, lambda: LatencyHistogram(buckets)))
+
+    def callback(self, name, help, labelnames, fn, type='gauge'):
+        return self._register(CallbackMetric(name, help, type, labelnames, fn))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            try:
+                metric.render(lines)
+            except Exception as e:
+                # 单个回调失败不影响其余指标
+                lines.append(f'# {metric.name} unavailable: {_escape(e)}')
+        return '\n'.join(lines) + '\n'
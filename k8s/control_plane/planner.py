@@ -0,0 +1,288 @@
+# planner.py
+# 异构节点上的流水线层划分：在显存约束下，选择节点与每个节点承载的层数，使最慢的一段流水线耗时最小。
+#
+# 模型描述（JSON）:
+#   num_layers              层数（不超过 MAX_LAYERS）
+#   layer_weight_gb         每层权重大小 (GB)
+#   kv_cache_per_layer_gb   目标 batch 下每层 KV cache 大小 (GB)，
+#                           或给出 kv_bytes_per_token_per_layer 与 max_seq_len 由此计算
+#   batch_size              目标 batch 大小
+#   flops_per_layer_token   每层每 token 的计算量 (GFLOPs)，缺省按 fp16 权重估算为 2 * 参数量
+#   memory_utilization      可用于模型的显存比例，缺省 0.9
+#   stage_overhead_ms       每段流水线的固定开销（段间激活传输等），缺省 2
+#
+# 每层耗时取计算耗时与读取权重/KV 的显存带宽耗时中的较大者（decode 阶段通常受带宽限制）。
+import argparse
+import heapq
+import json
+import math
+import time
+
+# 常见GPU的 fp16 tensor 算力 (TFLOPS)、显存 (GB) 与显存带宽 (GB/s)，按型号名子串匹配（越具体的越靠前）
+GPU_SPECS = [
+    ("h100", 989.0, 80, 3350),
+    ("a100", 312.0, 80, 2039),
+    ("l40", 181.0, 48, 864),
+    ("a6000", 154.8, 48, 768),
+    ("a10", 125.0, 24, 600),
+    ("v100", 125.0, 32, 900),
+    ("t4", 65.0, 16, 320),
+    ("4090", 165.2, 24, 1008),
+    ("4080", 97.5, 16, 717),
+    ("4070", 58.3, 12, 504),
+    ("3090", 71.0, 24, 936),
+    ("3080", 59.5, 10, 760),
+    ("3070", 40.6, 8, 448),
+    ("2080 ti", 53.8, 11, 616),
+]
+DEFAULT_TFLOPS = 30.0
+DEFAULT_BANDWIDTH = 400.0
+COMPUTE_EFFICIENCY = 0.5
+MAX_LAYERS = 4096
+
+class PlanError(Exception):
+    pass
+
+def gpu_spec(name):
+    lowered = (name or "").lower()
+    for key, tflops, memory_gb, bandwidth in GPU_SPECS:
+        if key in lowered:
+            return tflops, memory_gb, bandwidth
+    return DEFAULT_TFLOPS, None, DEFAULT_BANDWIDTH
+
+def node_capacity(node):
+    """返回 (总算力 TFLOPS, 总显存 GB, 总显存带宽 GB/s)，节点内多卡按张量并行累加
+
+    优先使用 hw_info 中每块GPU的信息，否则按 gpu_type 与 num_gpu 估算。
+    """
+    gpus = ((node.get('hw_info') or {}).get('gpus')) or []
+    if gpus:
+        tflops = memory_gb = bandwidth = 0.0
+        for gpu in gpus:
+            spec_tflops, spec_memory, spec_bandwidth = gpu_spec(gpu.get('name') or node.get('gpu_type'))
+            tflops += spec_tflops
+            bandwidth += spec_bandwidth
+            if gpu.get('memory_mb'):
+                memory_gb += gpu['memory_mb'] / 1024
+            elif spec_memory:
+                memory_gb += spec_memory
+        return tflops, memory_gb, bandwidth
+    num_gpu = node.get('num_gpu') or 0
+    spec_tflops, spec_memory, spec_bandwidth = gpu_spec(node.get('gpu_type'))
+    return spec_tflops * num_gpu, (spec_memory or 0) * num_gpu, spec_bandwidth * num_gpu
+
+def _number(model, key, default=None, cast=float):
+    value = model.get(key, default)
+    if value is None:
+        raise PlanError(f"model requires {key}")
+    # bool 是 int 的子类，不接受 true/false 作为数值
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise PlanError(f"{key} must be a number")
+    try:
+        number = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise PlanError(f"{key} must be a number")
+    if not math.isfinite(number):
+        raise PlanError(f"{key} must be finite")
+    return number
+
+def parse_model(model):
+    """校验模型描述，任何字段不合法都抛出 PlanError
+
+    返回 {num_layers, batch_size, layer_mem_gb（每层显存 GB）, ms_per_tflops（单位算力下每层的计算耗时 ms）,
+    mem_util, overhead_ms}
+    """
+    if not isinstance(model, dict):
+        raise PlanError("model must be an object")
+    num_layers = _number(model, 'num_layers', cast=int)
+    weight_gb = _number(model, 'layer_weight_gb')
+    batch_size = _number(model, 'batch_size', 1, cast=int)
+    if num_layers <= 0 or weight_gb <= 0 or batch_size <= 0:
+        raise PlanError("num_layers, layer_weight_gb and batch_size must be positive")
+    if num_layers > MAX_LAYERS:
+        raise PlanError(f"num_layers must not exceed {MAX_LAYERS}")
+    if 'kv_cache_per_layer_gb' in model:
+        kv_gb = _number(model, 'kv_cache_per_layer_gb')
+    else:
+        kv_gb = (_number(model, 'kv_bytes_per_token_per_layer', 0)
+                 * _number(model, 'max_seq_len', 0, cast=int) * batch_size / 1024 ** 3)
+    # fp16 权重每个参数 2 字节，每 token 计算量约为 2 * 参数量
+    gflops = _number(model, 'flops_per_layer_token', weight_gb * 1024 ** 3 / 1e9)
+    mem_util = _number(model, 'memory_utilization', 0.9)
+    overhead_ms = _number(model, 'stage_overhead_ms', 2)
+    if kv_gb < 0 or gflops <= 0 or overhead_ms < 0:
+        raise PlanError("kv cache and stage overhead must be non-negative, flops_per_layer_token positive")
+    if not 0 < mem_util <= 1:
+        raise PlanError("memory_utilization must be in (0, 1]")
+    ms_per_tflops = batch_size * gflops * 1e9 / (1e12 * COMPUTE_EFFICIENCY) * 1000
+    if not math.isfinite(ms_per_tflops) or not math.isfinite(weight_gb + kv_gb):
+        raise PlanError("model costs overflow")
+    return {
+        "num_layers": num_layers,
+        "batch_size": batch_size,
+        "layer_mem_gb": weight_gb + kv_gb,
+        "ms_per_tflops": ms_per_tflops,
+        "mem_util": mem_util,
+        "overhead_ms": overhead_ms,
+    }
+
+def plan_pipeline(model, nodes):
+    """计算使瓶颈段耗时最小的流水线划分
+
+    对瓶颈时间 T 二分：节点 i 在 T 内最多承载 min(显存上限, (T - 开销) / 每层耗时) 层，
+    容量之和不少于总层数即可行。最优的 T 一定是某个节点承载 k 层的耗时，二分收敛后
+    取其上方最近的这类取值。确定 T 后选用容量最大的若干节点，再从当前最慢的段依次削减多余层数。
+    复杂度 O(N * log(N) + N * 二分次数)，与层数无关。
+    """
+    start = time.monotonic()
+    params = parse_model(model)
+    num_layers = params["num_layers"]
+    layer_mem_gb = params["layer_mem_gb"]
+    ms_per_tflops = params["ms_per_tflops"]
+    mem_util = params["mem_util"]
+    overhead_ms = params["overhead_ms"]
+
+    candidates = []
+    for node in nodes:
+        try:
+            tflops, memory_gb, bandwidth = node_capacity(node)
+            max_layers = min(int(memory_gb * mem_util // layer_mem_gb), num_layers)
+        except (AttributeError, TypeError, ValueError, OverflowError):
+            # 节点上报的硬件信息不完整或格式不对，不参与划分
+            continue
+        if tflops <= 0 or bandwidth <= 0 or max_layers <= 0:
+            continue
+        candidates.append({
+            "node": node,
+            "layer_ms": max(ms_per_tflops / tflops, layer_mem_gb / bandwidth * 1000),
+            "max_layers": max_layers,
+            "memory_gb": memory_gb,
+        })
+    # 保证结果与输入顺序无关
+    candidates.sort(key=lambda c: (c["layer_ms"], -c["max_layers"], str(c["node"].get('name'))))
+    if sum(c["max_layers"] for c in candidates) < num_layers:
+        raise PlanError("insufficient GPU memory across candidate nodes")
+
+    def capacity(c, bound):
+        if bound < overhead_ms + c["layer_ms"]:
+            return 0
+        return min(c["max_layers"], int((bound - overhead_ms) / c["layer_ms"] + 1e-9))
+
+    def feasible(bound):
+        return sum(capacity(c, bound) for c in candidates) >= num_layers
+
+    def next_bound(lower):
+        """大于 lower 的最小的 开销 + k * 每层耗时"""
+        best = None
+        for c in candidates:
+            k = max(1, int((lower - overhead_ms) / c["layer_ms"]))
+            while overhead_ms + k * c["layer_ms"] <= lower:
+                k += 1
+            if k <= c["max_layers"]:
+                value = overhead_ms + k * c["layer_ms"]
+                best = value if best is None else min(best, value)
+        return best
+
+    # 所有节点满载时必然可行；lo 始终不可行，hi 始终可行
+    lo = 0.0
+    hi = max(overhead_ms + c["max_layers"] * c["layer_ms"] for c in candidates)
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if mid <= lo or mid >= hi:
+            break
+        if feasible(mid):
+            hi = mid
+        else:
+            lo = mid
+    # 可行性只在上述取值处变化，从 lo 向上找到第一个可行的取值
+    bound = next_bound(lo)
+    while not feasible(bound):
+        bound = next_bound(bound)
+
+    # 在该瓶颈下用尽可能少的段（容量大的节点优先），减少段间传输
+    chosen = []
+    total = 0
+    for c in sorted(candidates, key=lambda c: (-capacity(c, bound), c["layer_ms"], str(c["node"].get('name')))):
+        cap = capacity(c, bound)
+        if cap <= 0 or total >= num_layers:
+            break
+        chosen.append([c, cap])
+        total += cap
+
+    # 多余的层从当前最慢的段削减
+    heap = [(-(overhead_ms + cap * c["layer_ms"]), i) for i, (c, cap) in enumerate(chosen)]
+    heapq.heapify(heap)
+    while total > num_layers:
+        _, i = heapq.heappop(heap)
+        chosen[i][1] -= 1
+        total -= 1
+        if chosen[i][1] > 0:
+            heapq.heappush(heap, (-(overhead_ms + chosen[i][1] * chosen[i][0]["layer_ms"]), i))
+    chosen = [(c, layers) for c, layers in chosen if layers > 0]
+
+    # 段顺序：快节点在前，名称作为稳定的次序
+    chosen.sort(key=lambda item: (item[0]["layer_ms"], str(item[0]["node"].get('name'))))
+    stages = []
+    first = 0
+    for c, layers in chosen:
+        stage_ms = overhead_ms + layers * c["layer_ms"]
+        stages.append({
+            "node": c["node"].get('name'),
+            "ip": c["node"].get('ip'),
+            "layers": [first, first + layers],
+            "num_layers": layers,
+            "stage_time_ms": round(stage_ms, 4),
+            "memory_gb": round(layers * layer_mem_gb, 3),
+            "memory_capacity_gb": round(c["memory_gb"], 3),
+        })
+        first += layers
+    bottleneck = max(stage["stage_time_ms"] for stage in stages)
+    return {
+        "stages": stages,
+        "bottleneck_ms": bottleneck,
+        "throughput_tokens_per_s": round(params["batch_size"] * 1000 / bottleneck, 3),
+        "candidate_nodes": len(candidates),
+        "plan_seconds": round(time.monotonic() - start, 6),
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='MoLink流水线层划分',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('model', help='模型描述文件(JSON)')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--nodes', help='节点列表文件(JSON)，格式同 GET /nodes 返回的 nodes')
+    source.add_argument('--control-plane', help='控制平面地址，从 GET /nodes 读取节点')
+    parser.add_argument('--gpu-type', help='只使用该型号的节点')
+    args = parser.parse_args()
+
+    with open(args.model, 'r') as f:
+        model = json.load(f)
+    if args.nodes:
+        with open(args.nodes, 'r') as f:
+            nodes = json.load(f)
+        if isinstance(nodes, dict):
+            nodes = nodes.get('nodes', [])
+    else:
+        import requests
+        import urllib3
+        urllib3.disable_warnings()
+        nodes = []
+        params = {"fields": "name,ip,num_gpu,gpu_type,hw_info", "limit": 1000}
+        if args.gpu_type:
+            params["gpu_type"] = args.gpu_type
+        while True:
+            resp = requests.get(f"https://{args.control_plane}:12000/nodes", params=params, verify=False, timeout=10)
+            resp.raise_for_status()
+            page = resp.json()
+            nodes.extend(page['nodes'])
+            if not page.get('next'):
+                break
+            params['after'] = page['next']
+
+    try:
+        print(json.dumps(plan_pipeline(model, nodes), indent=2, ensure_ascii=False))
+    except PlanError as e:
+        print(f"无法生成划分: {e}")
+        exit(1)
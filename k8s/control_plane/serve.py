@@ -0,0 +1,180 @@
+# serve.py
+# 控制平面的生产启动入口：gunicorn gthread 工作进程 + 磁盘上持久化的 TLS 证书。
+#   python serve.py                        按 Config.Serve* 启动
+#   python serve.py --workers 2 --threads 64
+#   kill -HUP <master pid>                 平滑重载：新工作进程就绪后，旧进程处理完进行中的请求再退出
+#   python serve.py --fingerprint          打印证书 SHA-256 指纹，客户端可据此固定证书
+# 未安装 gunicorn 时退回 Werkzeug 多线程服务器（单进程，仍使用持久化证书与 HTTP/1.1 keep-alive）。
+import argparse
+import hashlib
+import ipaddress
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+def _san(hosts):
+    entries = []
+    for host in hosts:
+        try:
+            ipaddress.ip_address(host)
+            entries.append(f"IP:{host}")
+        except ValueError:
+            entries.append(f"DNS:{host}")
+    return ','.join(entries)
+
+def ensure_certificate(cert_file, key_file, hosts=(), days=3650):
+    """证书与私钥已存在时直接使用，否则用 openssl 生成一次自签名证书并缓存到磁盘
+
+    先写入同目录的临时文件再改名，多个进程同时启动时不会读到写了一半的文件。
+    """
+    if os.path.exists(cert_file) and os.path.exists(key_file):
+        return cert_file, key_file
+    hosts = list(dict.fromkeys(['localhost', '127.0.0.1', socket.gethostname(), *hosts]))
+    for path in (cert_file, key_file):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd, tmp_cert = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(cert_file)))
+    os.close(fd)
+    fd, tmp_key = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(key_file)))
+    os.close(fd)
+    try:
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-sha256',
+            '-days', str(days), '-subj', '/CN=molink-control-plane',
+            '-addext', f"subjectAltName={_san(hosts)}",
+            '-keyout', tmp_key, '-out', tmp_cert
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        os.chmod(tmp_key, 0o600)
+        os.chmod(tmp_cert, 0o644)
+        os.replace(tmp_key, key_file)
+        os.replace(tmp_cert, cert_file)
+    finally:
+        for path in (tmp_cert, tmp_key):
+            if os.path.exists(path):
+                os.unlink(path)
+    return cert_file, key_file
+
+def certificate_fingerprint(cert_file):
+    with open(cert_file, 'r') as f:
+        der = ssl.PEM_cert_to_DER_cert(f.read())
+    return hashlib.sha256(der).hexdigest()
+
+def server_ssl_context(cert_file, key_file):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.load_cert_chain(cert_file, key_file)
+    # 会话票据：客户端重连时恢复会话，省去完整握手（票据密钥按进程生成，跨工作进程不能恢复）
+    context.options &= ~ssl.OP_NO_TICKET
+    if hasattr(context, 'num_tickets'):
+        context.num_tickets = 2
+    return context
+
+def _post_worker_init(worker):
+    # 每个工作进程有自己的节点缓存，fork 之后再启动 informer 和后台线程
+    import backend
+    backend.check_schema_version()
+    if backend.Config.InformerEnabled:
+        backend.node_informer.start()
+    if backend.Config.MetricsSelfScrape:
+        backend.update_service_discovery(backend.Config.MetricsSelfTarget, 'molink_backend')
+
+def _worker_exit(server, worker):
+    # 平滑退出：已接收的移除任务继续执行到结束，待写回的节点状态落库
+    import backend
+    if not backend.removal_jobs.wait_idle(server.cfg.graceful_timeout):
+        server.log.warning(f"worker {worker.pid}: exiting with {backend.removal_jobs.active()} removal jobs unfinished")
+    backend.node_informer.stop()
+
+def serve_gunicorn(bind, workers, threads, cert_file, key_file, keepalive, graceful_timeout, configure=None):
+    from gunicorn.app.base import BaseApplication
+
+    class ControlPlaneApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': bind,
+                'workers': workers,
+                'worker_class': 'gthread',
+                'threads': threads,
+                'keepalive': keepalive,
+                'graceful_timeout': graceful_timeout,
+                'certfile': cert_file,
+                'keyfile': key_file,
+                'ssl_context': lambda conf, default: server_ssl_context(cert_file, key_file),
+                'post_worker_init': _post_worker_init,
+                'worker_exit': _worker_exit,
+                'proc_name': 'molink-control-plane',
+                'accesslog': None,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import backend
+            if configure is not None:
+                configure(backend)
+            return backend.app
+
+    ControlPlaneApplication().run()
+
+def serve_werkzeug(host, port, cert_file, key_file, configure=None):
+    from werkzeug.serving import WSGIRequestHandler, run_simple
+    import backend
+    if configure is not None:
+        configure(backend)
+    _post_worker_init(None)
+    # 缺省的 HTTP/1.0 每个请求都会关闭连接
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    try:
+        run_simple(host, port, backend.app, threaded=True,
+                   ssl_context=server_ssl_context(cert_file, key_file) if cert_file else None)
+    finally:
+        backend.removal_jobs.wait_idle(backend.Config.ServeGracefulTimeout)
+        backend.node_informer.stop()
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from backend import Config
+
+    parser = argparse.ArgumentParser(
+        description='MoLink 控制平面生产启动入口',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument('--bind', default=Config.ListenAddr, help='监听地址')
+    parser.add_argument('--workers', type=int, default=Config.ServeWorkers, help='工作进程数')
+    parser.add_argument('--threads', type=int, default=Config.ServeThreads, help='每个工作进程的线程数')
+    parser.add_argument('--keepalive', type=int, default=Config.ServeKeepAlive, help='空闲连接保持时间(秒)')
+    parser.add_argument('--graceful-timeout', type=int, default=Config.ServeGracefulTimeout,
+                        help='重载/退出时等待进行中请求的时间(秒)')
+    parser.add_argument('--cert', default=Config.TlsCertFile, help='证书文件，不存在时自动生成')
+    parser.add_argument('--key', default=Config.TlsKeyFile, help='私钥文件，不存在时自动生成')
+    parser.add_argument('--fingerprint', action='store_true', help='打印证书 SHA-256 指纹后退出')
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'werkzeug'), default='auto', help='HTTP 服务器')
+    args = parser.parse_args()
+
+    host, port = args.bind.rsplit(':', 1)
+    start = time.perf_counter()
+    cert_file, key_file = ensure_certificate(args.cert, args.key, () if host in ('0.0.0.0', '') else (host,))
+    fingerprint = certificate_fingerprint(cert_file)
+    if args.fingerprint:
+        print(fingerprint)
+        raise SystemExit(0)
+    print(f"TLS certificate {cert_file} sha256={fingerprint} ({time.perf_counter() - start:.3f}s)")
+
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            print("gunicorn 未安装，使用 Werkzeug 多线程服务器（单进程）", file=sys.stderr)
+            server = 'werkzeug'
+    if server == 'gunicorn':
+        if args.workers > 1 and not os.environ.get('MOLINK_SESSION_SECRET'):
+            raise SystemExit("多个工作进程需要通过 MOLINK_SESSION_SECRET 共享会话令牌密钥")
+        serve_gunicorn(args.bind, args.workers, args.threads, cert_file, key_file,
+                       args.keepalive, args.graceful_timeout)
+    else:
+        serve_werkzeug(host, int(port), cert_file, key_file)
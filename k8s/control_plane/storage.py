@@ -0,0 +1,605 @@
+# storage.py
+# 控制平面的存储后端，按 Config.DbType 选择：
+#   mysql   mysql.connector 连接，由 ConnectionPool 管理
+#   sqlite  本地 SQLite 文件，单机部署与测试无需外部数据库
+# 两种后端返回的连接接口一致：cursor(dictionary=...)、execute/executemany 使用 %s 占位符、
+# fetchone/fetchall、rowcount、commit/rollback、close、is_connected，调用方的 SQL 无需区分后端。
+# 表结构按 MIGRATIONS 版本化：MySQL 通过 `python backend.py --migrate` 升级，SQLite 在首次打开时自动升级。
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+try:
+    import mysql.connector
+    import mysql.connector.pooling
+except ImportError:  # 只使用 SQLite 时不需要安装 mysql-connector
+    mysql = None
+
+# 两种后端的数据库异常，供 except 使用
+DatabaseError = (sqlite3.Error,) + ((mysql.connector.Error,) if mysql is not None else ())
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL COLLATE NOCASE,
+    password TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS node (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL COLLATE NOCASE,
+    ip TEXT,
+    type INTEGER DEFAULT 0,
+    status INTEGER DEFAULT 0,
+    user_id INTEGER,
+    num_cpu INTEGER,
+    size_mem REAL,
+    num_gpu INTEGER,
+    gpu_type TEXT,
+    hw_info TEXT
+);
+"""
+
+class PoolTimeout(Exception):
+    """连接池已满且在超时时间内没有连接归还"""
+
+class PooledConnection:
+    """从 ConnectionPool 借出的连接，close() 把连接归还连接池"""
+
+    def __init__(self, pool, conn, created):
+        self._pool = pool
+        self._conn = conn
+        self._created = created
+
+    def is_connected(self):
+        # 不发往服务器：借出前已做过存活检查，出错的连接在归还时丢弃
+        return self._conn is not None
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._release(conn, self._created)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+class _Waiter:
+    __slots__ = ('event', 'item')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.item = None
+
+class ConnectionPool:
+    """阻塞式连接池
+
+    空闲连接保持在 max_idle 个（后台线程补足），按需增长到 max_open 个；
+    连接池满时借用方按先来后到排队，最多等待 timeout 秒，归还的连接直接交给队首。
+    连接存活超过 max_lifetime 秒后关闭重建，空闲超过 ping_after 秒的连接借出前先 ping 一次，失败则重建。
+    """
+
+    def __init__(self, connect, ping, max_idle, max_open, max_lifetime, timeout=5.0, ping_after=5.0,
+                 maintain_interval=1.0):
+        self._connect = connect
+        self._ping = ping
+        self.max_idle = max(0, min(max_idle, max_open))
+        self.max_open = max_open
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._idle = []  # [(conn, created, returned)]，末尾为最近归还的连接
+        self._waiters = deque()
+        self._open = 0  # 已建立和正在建立的连接数
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.discarded = 0
+        self.connect_failures = 0
+        self._maintainer = threading.Thread(target=self._maintain, args=(maintain_interval,), daemon=True)
+        self._maintainer.start()
+
+    def _expired(self, created, now):
+        return self.max_lifetime and now - created >= self.max_lifetime
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _hand_off(self, item):
+        """把空闲连接（或 None 表示一个可新建连接的名额）交给队首的等待者，需持有 _lock"""
+        if not self._waiters:
+            return False
+        waiter = self._waiters.popleft()
+        waiter.item = item
+        waiter.event.set()
+        return True
+
+    def _free_slot(self):
+        """关闭一个连接后调用，需持有 _lock；有人排队时名额直接转给队首"""
+        self._open -= 1
+        if self._waiters and self._open < self.max_open:
+            self._open += 1
+            self._hand_off(None)
+
+    def _new(self):
+        """在锁外建立连接；调用前已为其占用一个 _open 名额"""
+        try:
+            conn = self._connect()
+        except BaseException:
+            with self._lock:
+                self.connect_failures += 1
+                self._free_slot()
+            raise
+        with self._lock:
+            self.created += 1
+        return conn, time.monotonic()
+
+    def _usable(self, conn, created, returned):
+        now = time.monotonic()
+        if self._expired(created, now):
+            with self._lock:
+                self.recycled += 1
+            return False
+        if now - returned < self.ping_after:
+            return True
+        try:
+            self._ping(conn)
+            return True
+        except Exception:
+            with self._lock:
+                self.discarded += 1
+            return False
+
+    def connect(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        waiter = None
+        with self._lock:
+            if self._idle and not self._waiters:
+                item = self._idle.pop()
+            elif self._open < self.max_open and not self._waiters:
+                self._open += 1
+                item = None
+            else:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self.waits += 1
+        if waiter is not None:
+            if not waiter.event.wait(timeout):
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+                        self.timeouts += 1
+                        raise PoolTimeout(f"no database connection available within {timeout}s "
+                                          f"({self._open}/{self.max_open} open)")
+            item = waiter.item
+        if item is not None:
+            conn, created, returned = item
+            if not self._usable(conn, created, returned):
+                # 过期或失效：关闭后沿用其名额新建连接
+                self._close(conn)
+                item = None
+        if item is None:
+            conn, created = self._new()
+        with self._lock:
+            self.checkouts += 1
+        return PooledConnection(self, conn, created)
+
+    def _release(self, conn, created):
+        try:
+            if getattr(conn, 'in_transaction', True):
+                # 回滚未提交的事务，同时结束 REPEATABLE READ 下的读快照
+                conn.rollback()
+            reusable = True
+        except Exception:
+            reusable = False
+        now = time.monotonic()
+        expired = reusable and self._expired(created, now)
+        with self._lock:
+            if reusable and not expired:
+                if self._hand_off((conn, created, now)):
+                    return
+                if len(self._idle) < self.max_idle:
+                    self._idle.append((conn, created, now))
+                    return
+            elif expired:
+                self.recycled += 1
+            else:
+                self.discarded += 1
+            self._free_slot()
+        self._close(conn)
+
+    def _maintain(self, interval):
+        """关闭空闲中已过期的连接，并把空闲连接补足到 max_idle 个"""
+        while True:
+            time.sleep(interval)
+            now = time.monotonic()
+            with self._lock:
+                expired = [item for item in self._idle if self._expired(item[1], now)]
+                if expired:
+                    self._idle[:] = [item for item in self._idle if not self._expired(item[1], now)]
+                    self.recycled += len(expired)
+                    for _ in expired:
+                        self._free_slot()
+                missing = 0 if self._waiters else max(0, min(self.max_idle - len(self._idle),
+                                                             self.max_open - self._open))
+                self._open += missing
+            for conn, _, _ in expired:
+                self._close(conn)
+            for index in range(missing):
+                try:
+                    conn, created = self._new()
+                except Exception:
+                    # 数据库暂不可用，释放其余预留名额，下一轮再补；借用方会得到真实的连接错误
+                    with self._lock:
+                        for _ in range(missing - index - 1):
+                            self._free_slot()
+                    break
+                with self._lock:
+                    if not self._hand_off((conn, created, time.monotonic())):
+                        self._idle.append((conn, created, time.monotonic()))
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+            return {
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                "waiting": len(self._waiters),
+                "max_open": self.max_open,
+                "max_idle": self.max_idle,
+                "utilization": round((self._open - idle) / self.max_open, 4) if self.max_open else 0,
+                "checkouts": self.checkouts,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "recycled": self.recycled,
+                "discarded": self.discarded,
+                "connect_failures": self.connect_failures,
+            }
+
+def _mysql_ping(conn):
+    conn.ping(reconnect=False)
+
+class MySQLStorage:
+    dialect = 'mysql'
+
+    def __init__(self, config):
+        if mysql is None:
+            raise RuntimeError("Config.DbType = 'mysql' requires mysql-connector-python")
+        params = dict(
+            host=config.DbHost,
+            port=config.DbPort,
+            user=config.DbUser,
+            password=config.DbPwd,
+            database=config.DbName,
+        )
+        self.pool = ConnectionPool(
+            lambda: mysql.connector.connect(**params),
+            _mysql_ping,
+            max_idle=config.MaxIdleConns,
+            max_open=config.MaxOpenConns,
+            max_lifetime=config.MaxLifeTime,
+            timeout=config.DbPoolTimeout,
+            ping_after=config.DbPingAfterIdle,
+        )
+
+    def connect(self):
+        return self.pool.connect()
+
+    def stats(self):
+        return self.pool.stats()
+
+class SQLiteCursor:
+    """把 %s 占位符改写为 ?；改写结果按 SQL 缓存，同一语句复用连接内已编译的预处理语句"""
+
+    _translated = {}
+
+    def __init__(self, cursor, dictionary=False):
+        self._cursor = cursor
+        self._dictionary = dictionary
+
+    @classmethod
+    def translate(cls, operation):
+        sql = cls._translated.get(operation)
+        if sql is None:
+            sql = operation.replace('%s', '?')
+            if len(cls._translated) < 1024:
+                cls._translated[operation] = sql
+        return sql
+
+    def execute(self, operation, params=()):
+        self._cursor.execute(self.translate(operation), params or ())
+        return self
+
+    def executemany(self, operation, seq_of_params):
+        self._cursor.executemany(self.translate(operation), seq_of_params)
+        return self
+
+    def _row(self, row):
+        if row is None or not self._dictionary:
+            return row
+        return dict(zip((column[0] for column in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        if not self._dictionary:
+            return rows
+        columns = [column[0] for column in self._cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+class SQLiteConnection:
+    """每个线程一个长期打开的连接；close() 只回滚未提交的事务，不真正关闭"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, dictionary=False, **kwargs):
+        return SQLiteCursor(self._conn.cursor(), dictionary=dictionary)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+class SQLiteStorage:
+    dialect = 'sqlite'
+
+    def __init__(self, path, busy_timeout=5.0):
+        self.path = os.path.expanduser(path)
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        if not self._schema_ready:
+            with self._schema_lock:
+                if not self._schema_ready:
+                    migrate_connection(SQLiteConnection(conn), self.dialect)
+                    self._schema_ready = True
+        return conn
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return SQLiteConnection(conn)
+
+    def stats(self):
+        # 每个线程一个连接，没有可报告的连接池状态
+        return {}
+
+class MigrationError(Exception):
+    pass
+
+def _column_exists(cursor, dialect, table, column):
+    if dialect == 'sqlite':
+        cursor.execute(f"PRAGMA table_info({table})")
+        return any(row[1] == column for row in cursor.fetchall())
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def _create_index(cursor, dialect, name, table, columns, unique=False):
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    if dialect == 'sqlite':
+        cursor.execute(f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+        return
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, name))
+    if cursor.fetchone()[0] == 0:
+        cursor.execute(f"CREATE {kind} {name} ON {table} ({', '.join(columns)})")
+
+def _duplicates(cursor, table, column):
+    cursor.execute(f"SELECT {column} FROM {table} GROUP BY {column} HAVING COUNT(*) > 1 LIMIT 20")
+    return [row[0] for row in cursor.fetchall()]
+
+def _base_tables(cursor, dialect):
+    if dialect == 'sqlite':
+        for statement in SQLITE_SCHEMA.split(';'):
+            if statement.strip():
+                cursor.execute(statement)
+        return
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(64) NOT NULL,
+            password VARCHAR(255) NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS node (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            ip VARCHAR(64),
+            type INT DEFAULT 0,
+            status INT DEFAULT 0,
+            user_id INT,
+            num_cpu INT,
+            size_mem FLOAT,
+            num_gpu INT,
+            gpu_type VARCHAR(255),
+            hw_info JSON NULL
+        )
+    """)
+
+def _hw_info_column(cursor, dialect):
+    # 早期部署按 README 手动添加过该列
+    if not _column_exists(cursor, dialect, 'node', 'hw_info'):
+        cursor.execute(f"ALTER TABLE node ADD COLUMN hw_info {'TEXT' if dialect == 'sqlite' else 'JSON NULL'}")
+
+def _unique_names(cursor, dialect):
+    """节点按名称去重（保留最近一次加入的记录）后建立唯一索引；重名用户需人工处理"""
+    users = _duplicates(cursor, 'users', 'username')
+    if users:
+        raise MigrationError(f"duplicate usernames must be merged by hand: {', '.join(map(str, users))}")
+    if _duplicates(cursor, 'node', 'name'):
+        if not _column_exists(cursor, dialect, 'node', 'id'):
+            raise MigrationError("node has duplicate names and no id column to pick the latest row")
+        if dialect == 'sqlite':
+            cursor.execute("DELETE FROM node WHERE id NOT IN (SELECT MAX(id) FROM node GROUP BY name)")
+        else:
+            cursor.execute("DELETE n FROM node n JOIN node m ON m.name = n.name AND m.id > n.id")
+    _create_index(cursor, dialect, 'uniq_users_username', 'users', ('username',), unique=True)
+    _create_index(cursor, dialect, 'uniq_node_name', 'node', ('name',), unique=True)
+    _create_index(cursor, dialect, 'idx_node_gpu_type_status', 'node', ('gpu_type', 'status'))
+    _create_index(cursor, dialect, 'idx_node_status', 'node', ('status',))
+
+def _join_failure_table(cursor, dialect):
+    if dialect == 'sqlite':
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS join_failure (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                node_name TEXT,
+                ip TEXT,
+                username TEXT,
+                stage TEXT,
+                error TEXT,
+                timings TEXT,
+                hw_info TEXT,
+                reported_at REAL NOT NULL
+            )
+        """)
+    else:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS join_failure (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                node_name VARCHAR(255),
+                ip VARCHAR(64),
+                username VARCHAR(64),
+                stage VARCHAR(64),
+                error TEXT,
+                timings JSON NULL,
+                hw_info JSON NULL,
+                reported_at DOUBLE NOT NULL
+            )
+        """)
+    _create_index(cursor, dialect, 'idx_join_failure_reported_at', 'join_failure', ('reported_at',))
+    _create_index(cursor, dialect, 'idx_join_failure_node_name', 'join_failure', ('node_name',))
+
+# (版本, 说明, 步骤)；每个步骤都可重复执行，中途失败后重新运行即可
+MIGRATIONS = [
+    (1, "users and node tables", _base_tables),
+    (2, "node.hw_info column", _hw_info_column),
+    (3, "unique node.name and users.username, node gpu_type/status indexes", _unique_names),
+    (4, "join_failure table for /k8s_fail", _join_failure_table),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def _ensure_version_table(cursor, dialect):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER NOT NULL PRIMARY KEY,
+            description {'TEXT' if dialect == 'sqlite' else 'VARCHAR(255)'} NOT NULL,
+            applied_at DOUBLE PRECISION NOT NULL
+        )
+    """)
+
+def schema_version(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT MAX(version) FROM schema_version")
+        return cursor.fetchone()[0] or 0
+    except DatabaseError:
+        return 0
+    finally:
+        cursor.close()
+
+def migrate_connection(conn, dialect, log=None):
+    """把数据库升级到 SCHEMA_VERSION，返回本次执行的版本号
+
+    多个进程同时迁移时串行执行：SQLite 使用 BEGIN IMMEDIATE，MySQL 使用 GET_LOCK。
+    """
+    cursor = conn.cursor()
+    applied = []
+    try:
+        if dialect == 'sqlite':
+            conn.commit()
+            cursor.execute("BEGIN IMMEDIATE")
+        else:
+            cursor.execute("SELECT GET_LOCK('molink_schema_migration', 60)")
+            if cursor.fetchone()[0] != 1:
+                raise MigrationError("timed out waiting for another migration")
+        _ensure_version_table(cursor, dialect)
+        cursor.execute("SELECT version FROM schema_version")
+        done = {row[0] for row in cursor.fetchall()}
+        for version, description, step in MIGRATIONS:
+            if version in done:
+                continue
+            if log:
+                log(f"applying schema {version}: {description}")
+            step(cursor, dialect)
+            cursor.execute(
+                "INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, %s)",
+                (version, description, time.time())
+            )
+            if dialect != 'sqlite':
+                conn.commit()
+            applied.append(version)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        if dialect != 'sqlite':
+            cursor.execute("SELECT RELEASE_LOCK('molink_schema_migration')")
+            cursor.fetchall()
+        cursor.close()
+    return applied
+
+def migrate(storage, log=None):
+    conn = storage.connect()
+    try:
+        return migrate_connection(conn, storage.dialect, log)
+    finally:
+        conn.close()
+
+def open_storage(config):
+    if config.DbType == 'mysql':
+        return MySQLStorage(config)
+    if config.DbType == 'sqlite':
+        return SQLiteStorage(config.SqlitePath)
+    raise ValueError(f"unsupported Config.DbType: {config.DbType}")
@@ -10,6 +10,11 @@ setup(
     packages=find_packages(),
     install_requires=parse_requirements('requirements.txt'),  # 从 requirements.txt 中读取依赖
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'molink=k8s.cli.molink:main',
+        ],
+    },
     description='High-performance and cost-efficient distributed LLM serving engine',
     #long_description=open('README.md').read(),
     #long_description_content_type='text/markdown',
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各目录下的脚本按文件名互相导入（from planner import ...），测试与直接运行脚本时保持一致
+for path in (os.path.join(ROOT, 'k8s', 'cli'), os.path.join(ROOT, 'k8s', 'control_plane')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    """使用临时 SQLite 库的控制平面；缺少 flask 等依赖时跳过"""
+    backend = pytest.importorskip('backend')
+    monkeypatch.setattr(backend.Config, 'DbType', 'sqlite')
+    monkeypatch.setattr(backend.Config, 'SqlitePath', str(tmp_path / 'molink.sqlite'))
+    monkeypatch.setattr(backend, 'db_storage', None)
+    monkeypatch.setattr(backend, 'node_snapshot', backend.NodeSnapshot(max_age=60))
+    monkeypatch.setattr(backend, 'ip_rate_limiter', backend.RateLimiter(*backend.Config.RateLimitPerIP))
+    monkeypatch.setattr(backend, 'user_rate_limiter', backend.RateLimiter(*backend.Config.RateLimitPerUser))
+    monkeypatch.setattr(backend, 'idempotency_cache', backend.IdempotencyCache(
+        backend.Config.IdempotencyTTL, backend.Config.IdempotencyMaxKeys
+    ))
+    # 服务发现文件写到临时目录
+    for name, registry in list(backend.service_discovery.items()):
+        monkeypatch.setitem(backend.service_discovery, name, backend.ServiceDiscoveryRegistry(
+            name, str(tmp_path / 'sd' / registry.json_file.name), registry.port, debounce=0.01, labels=registry.labels
+        ))
+    return backend
+
+@pytest.fixture
+def users(backend):
+    """alice、bob 与管理员，密码为 <用户名>-pw；返回 {用户名: id}"""
+    from werkzeug.security import generate_password_hash
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    ids = {}
+    for username in ('alice', 'bob', backend.Config.AdminUser):
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)",
+                       (username, generate_password_hash(f"{username}-pw")))
+        ids[username] = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return ids
@@ -0,0 +1,49 @@
+# 控制平面的按用户限流与会话令牌校验（临时 SQLite 库）
+import pytest
+
+FAIL_REPORT = {"hardware_info": {"name": "node-a", "ip": "10.0.0.1"}, "stage": "kubeadm_join", "error": "timeout"}
+
+@pytest.fixture
+def client(backend, monkeypatch):
+    # 每个用户只有 1 个令牌且几乎不恢复；来源 IP 不限流
+    monkeypatch.setattr(backend, 'user_rate_limiter', backend.RateLimiter(0.001, 1))
+    monkeypatch.setattr(backend, 'ip_rate_limiter', backend.RateLimiter(1000, 1000))
+    return backend.app.test_client()
+
+def session_validations(backend):
+    return {result: backend.token_validations.labels('session', result).value for result in ('ok', 'failure')}
+
+def test_claimed_username_does_not_consume_user_limit(backend, client):
+    # 任何人都可以在请求体里写上别人的用户名，不能因此耗尽该用户的额度
+    for _ in range(3):
+        resp = client.post('/k8s_fail', json=dict(FAIL_REPORT, username='alice'))
+        assert resp.status_code == 200, resp.get_json()
+
+    token = backend.issue_session_token('alice', 1, 'node-a')
+    assert client.post('/k8s_fail', json=dict(FAIL_REPORT, session_token=token)).status_code == 200
+    resp = client.post('/k8s_fail', json=dict(FAIL_REPORT, session_token=token))
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After']
+
+    # 失败记录仍保存请求中声明的用户名，供排查
+    resp = client.get('/k8s_failures', query_string={"node": "node-a"})
+    assert {item['username'] for item in resp.get_json()['failures']} == {'alice'}
+
+def test_invalid_session_token_is_not_rate_limited_as_user(backend, client):
+    token = backend.issue_session_token('alice', 1, 'node-a')
+    assert client.post('/k8s_fail', json=dict(FAIL_REPORT, session_token=token)).status_code == 200
+    forged = token[:-4] + ('AAAA' if not token.endswith('AAAA') else 'BBBB')
+    assert client.post('/k8s_fail', json=dict(FAIL_REPORT, session_token=forged)).status_code == 200
+
+def test_session_token_is_verified_once_per_request(backend, client):
+    before = session_validations(backend)
+    resp = client.post('/k8s_complete', json={"hardware_info": {"name": "node-a"}, "session_token": "bogus"})
+    assert resp.status_code == 401
+    after = session_validations(backend)
+    assert after['failure'] - before['failure'] == 1
+    assert after['ok'] == before['ok']
+
+    token = backend.issue_session_token('alice', 1, 'node-a')
+    resp = client.post('/k8s_complete', json={"hardware_info": {"name": "node-b"}, "session_token": token})
+    assert resp.status_code == 401
+    assert session_validations(backend)['ok'] - after['ok'] == 1
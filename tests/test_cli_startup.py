@@ -0,0 +1,64 @@
+# molink 命令的启动耗时预算，以及 --help 不加载重量级模块
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MOLINK = os.path.join(ROOT, 'k8s', 'cli', 'molink.py')
+# 这些模块只应在子命令真正执行时导入，任何 --help 都不应加载
+HEAVY_MODULES = ('requests', 'urllib3', 'psutil', 'GPUtil', 'flask', 'molink_client')
+# molink --help 连子命令模块也不应加载
+SUBCOMMAND_MODULES = ('molink_join_k8s', 'molink_quit_k8s', 'molink_hwprobe')
+# 相对 python -c pass 的额外耗时预算（中位数，毫秒）
+BUDGET_MS = 100
+RUNS = 7
+HELP_COMMANDS = [['--help'], ['join', '--help'], ['quit', '--help'], ['logs', '--help'], ['status', '--help']]
+
+def run_env():
+    # 与测试进程相同的模块搜索路径：已安装的重量级依赖同样能被（误）导入
+    return dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+def median_ms(command):
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=run_env())
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+def imported_modules(argv):
+    """用 -X importtime 列出命令加载的全部顶层模块，返回 (退出码, 模块集合)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', MOLINK] + argv,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=run_env())
+    modules = set()
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            modules.add(line.rsplit('|', 1)[1].strip().split('.')[0])
+    return result.returncode, modules
+
+@pytest.fixture(scope='module')
+def interpreter_ms():
+    return median_ms([sys.executable, '-c', 'pass'])
+
+@pytest.mark.parametrize("argv", [['--help'], ['join', '--help']])
+def test_help_within_budget(interpreter_ms, argv):
+    overhead = median_ms([sys.executable, MOLINK] + argv) - interpreter_ms
+    assert overhead < BUDGET_MS, f"molink {' '.join(argv)}: {overhead:.1f} ms over bare interpreter start"
+
+@pytest.mark.parametrize("argv", HELP_COMMANDS)
+def test_help_skips_heavy_modules(argv):
+    forbidden = set(HEAVY_MODULES) | (set(SUBCOMMAND_MODULES) if argv == ['--help'] else set())
+    returncode, modules = imported_modules(argv)
+    assert returncode == 0
+    assert 'argparse' in modules
+    assert not modules & forbidden
+
+def test_usage_error_skips_heavy_modules():
+    returncode, modules = imported_modules(['bogus'])
+    assert returncode != 0
+    assert 'argparse' in modules
+    assert not modules & (set(HEAVY_MODULES) | set(SUBCOMMAND_MODULES))
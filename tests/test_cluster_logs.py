@@ -0,0 +1,48 @@
+# 控制平面 /k8s_logs 的节点筛选：nodes 只接受节点名列表或逗号分隔的字符串（节点日志服务用桩代替）
+import pytest
+
+@pytest.fixture
+def fetched(backend, monkeypatch):
+    """记录被拉取日志的节点 IP"""
+    ips = []
+
+    def fetch_node_log(ip, params, deadline):
+        ips.append(ip)
+        return [(1.0, f"log from {ip}")]
+
+    monkeypatch.setattr(backend, 'fetch_node_log', fetch_node_log)
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    for name, ip in (('node-a', '10.0.0.1'), ('node-b', '10.0.0.2'), ('node-c', '10.0.0.3')):
+        cursor.execute("INSERT INTO node (name, ip) VALUES (%s, %s)", (name, ip))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return ips
+
+@pytest.mark.parametrize("request_kwargs", [
+    {"json": {"nodes": ["node-a", "node-c"]}},
+    {"json": {"nodes": "node-a,node-c"}},
+    {"query_string": {"nodes": "node-a,,node-c"}},
+])
+def test_nodes_filter(backend, fetched, request_kwargs):
+    resp = backend.app.test_client().post('/k8s_logs', **request_kwargs)
+    assert resp.status_code == 200
+    assert set(resp.get_json()['nodes']) == {'node-a', 'node-c'}
+    assert sorted(fetched) == ['10.0.0.1', '10.0.0.3']
+
+def test_all_nodes_by_default(backend, fetched):
+    resp = backend.app.test_client().post('/k8s_logs', json={"n": 5})
+    assert set(resp.get_json()['nodes']) == {'node-a', 'node-b', 'node-c'}
+
+@pytest.mark.parametrize("nodes", [
+    {"node-a": True},
+    ["node-a", 7],
+    [["node-a"]],
+    42,
+    True,
+])
+def test_malformed_nodes_rejected(backend, fetched, nodes):
+    resp = backend.app.test_client().post('/k8s_logs', json={"nodes": nodes})
+    assert resp.status_code == 400
+    assert fetched == []
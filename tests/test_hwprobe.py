@@ -0,0 +1,173 @@
+# molink_hwprobe.py 在测试用的 /proc、/sys 目录树上探测（--proc-root/--sys-root）
+import json
+import os
+
+import pytest
+
+import molink_hwprobe
+
+CPUINFO = """\
+processor\t: {cpu}
+vendor_id\t: GenuineIntel
+model name\t: Intel(R) Xeon(R) Gold 6330 CPU @ 2.00GHz
+physical id\t: {socket}
+core id\t\t: {core}
+
+"""
+
+NVIDIA_SMI = """\
+#!/bin/sh
+if [ "$1" = "topo" ]; then
+cat <<'EOF'
+\tGPU0\tGPU1\tGPU2\tCPU Affinity\tNUMA Affinity
+GPU0\t X \tNV12\tSYS\t0-3\t0
+GPU1\tNV12\t X \tSYS\t0-3\t0
+GPU2\tSYS\tSYS\t X \t4-7\t1
+
+Legend:
+  X    = Self
+EOF
+exit 0
+fi
+cat <<'EOF'
+0, NVIDIA A100-SXM4-80GB, 81920, 00000000:3B:00.0, GPU-aaaa
+1, NVIDIA A100-SXM4-80GB, 81920, 00000000:3C:00.0, GPU-bbbb
+2, NVIDIA GeForce RTX 4090, 24564, 00000000:AF:00.0, GPU-cccc
+EOF
+"""
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+@pytest.fixture
+def roots(tmp_path):
+    """2 路 x 2 核 x 2 超线程、2 个 NUMA 节点、3 块 NVIDIA GPU、1 块 NVMe、1 块网卡"""
+    proc = tmp_path / 'proc'
+    sys = tmp_path / 'sys'
+    cpus = [(socket, core) for socket in range(2) for core in range(2) for _ in range(2)]
+    write(str(proc / 'cpuinfo'), ''.join(CPUINFO.format(cpu=i, socket=s, core=c) for i, (s, c) in enumerate(cpus)))
+    write(str(proc / 'meminfo'), "MemTotal:       263921412 kB\nMemFree:        1000 kB\n")
+    write(str(proc / 'sys/kernel/random/boot_id'), "3c1d7b0e-boot\n")
+    for node, cpulist in ((0, '0-3'), (1, '4-7')):
+        base = str(sys / f'devices/system/node/node{node}')
+        write(os.path.join(base, 'cpulist'), cpulist + '\n')
+        write(os.path.join(base, 'meminfo'), f"Node {node} MemTotal:       131960706 kB\n")
+    for bus_id, numa in (('0000:3b:00.0', 0), ('0000:3c:00.0', 0), ('0000:af:00.0', 1)):
+        base = str(sys / 'bus/pci/devices' / bus_id)
+        write(os.path.join(base, 'vendor'), '0x10de\n')
+        write(os.path.join(base, 'class'), '0x030200\n')
+        write(os.path.join(base, 'numa_node'), f"{numa}\n")
+        write(os.path.join(base, 'current_link_speed'), '16.0 GT/s PCIe\n')
+        write(os.path.join(base, 'current_link_width'), '16\n')
+    # 非 GPU 的 NVIDIA 设备（音频）不计入
+    write(str(sys / 'bus/pci/devices/0000:af:00.1/vendor'), '0x10de\n')
+    write(str(sys / 'bus/pci/devices/0000:af:00.1/class'), '0x040300\n')
+    write(str(sys / 'block/nvme0n1/size'), '3750748848\n')
+    write(str(sys / 'block/nvme0n1/queue/rotational'), '0\n')
+    write(str(sys / 'block/loop0/size'), '100\n')
+    write(str(sys / 'class/net/eth0/device/vendor'), '0x15b3\n')
+    write(str(sys / 'class/net/eth0/speed'), '100000\n')
+    write(str(sys / 'class/net/eth0/operstate'), 'up\n')
+    write(str(sys / 'class/net/eth0/mtu'), '9000\n')
+    os.makedirs(str(sys / 'class/net/lo'))
+    return str(proc), str(sys)
+
+@pytest.fixture
+def no_nvidia_smi(tmp_path, monkeypatch):
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+
+@pytest.fixture
+def nvidia_smi(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    path = bin_dir / 'nvidia-smi'
+    path.write_text(NVIDIA_SMI)
+    path.chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}:/bin:/usr/bin")
+
+def test_cpu_memory_numa_disks_nics(roots, no_nvidia_smi):
+    inventory = molink_hwprobe.run_probes(*roots)
+    assert inventory['errors'] == {}
+    assert inventory['cpu'] == {
+        "model": "Intel(R) Xeon(R) Gold 6330 CPU @ 2.00GHz", "logical": 8, "physical": 4, "sockets": 2,
+    }
+    assert inventory['memory'] == {"total_gb": 251.7}
+    assert inventory['numa'] == [
+        {"id": 0, "cpus": [0, 1, 2, 3], "mem_gb": 125.85},
+        {"id": 1, "cpus": [4, 5, 6, 7], "mem_gb": 125.85},
+    ]
+    assert inventory['disks'] == [{"name": "nvme0n1", "size_gb": 1920.4, "rotational": False}]
+    assert inventory['nics'] == [{"name": "eth0", "speed_mbps": 100000, "operstate": "up", "mtu": 9000}]
+
+def test_gpus_from_sysfs_without_nvidia_smi(roots, no_nvidia_smi):
+    inventory = molink_hwprobe.run_probes(*roots)
+    assert [(gpu['pci_bus_id'], gpu['numa_node'], gpu['name']) for gpu in inventory['gpus']] == [
+        ('0000:3b:00.0', 0, None), ('0000:3c:00.0', 0, None), ('0000:af:00.0', 1, None),
+    ]
+    assert inventory['gpu_topology'] == {}
+    summary = molink_hwprobe.summarize(inventory)
+    assert summary['num_gpu'] == 3
+    assert summary['gpu_type'] == 'unknown'
+    assert summary['gpu_mix'] is None
+
+def test_gpus_and_topology_from_nvidia_smi(roots, nvidia_smi):
+    inventory = molink_hwprobe.run_probes(*roots)
+    assert inventory['errors'] == {}
+    first = inventory['gpus'][0]
+    assert first == {
+        "index": 0, "name": "NVIDIA A100-SXM4-80GB", "memory_mb": 81920, "pci_bus_id": "0000:3b:00.0",
+        "uuid": "GPU-aaaa", "numa_node": 0, "pcie_link_speed": "16.0 GT/s PCIe", "pcie_link_width": "16",
+    }
+    assert inventory['gpus'][2]['numa_node'] == 1
+    assert inventory['gpu_topology']['GPU0'] == {"GPU1": "NV12", "GPU2": "SYS"}
+    assert inventory['gpu_topology']['GPU2'] == {"GPU0": "SYS", "GPU1": "SYS"}
+
+def test_mixed_gpus_keep_dominant_gpu_type(roots, nvidia_smi):
+    summary = molink_hwprobe.summarize(molink_hwprobe.run_probes(*roots))
+    assert summary == {
+        "num_cpu": 4,
+        "size_mem": 251.7,
+        "num_gpu": 3,
+        "gpu_type": "NVIDIA A100-SXM4-80GB",
+        "gpu_mix": "NVIDIA A100-SXM4-80GB x2, NVIDIA GeForce RTX 4090 x1",
+    }
+
+def test_summary_without_gpus():
+    summary = molink_hwprobe.summarize({"cpu": {"physical": 8}, "memory": {"total_gb": 31.2}, "gpus": []})
+    assert summary == {"num_cpu": 8, "size_mem": 31.2, "num_gpu": 0, "gpu_type": None, "gpu_mix": None}
+
+def test_inventory_is_cached_per_boot(roots, no_nvidia_smi, tmp_path):
+    cache_file = str(tmp_path / 'cache' / 'hwinfo.json')
+    first = molink_hwprobe.probe_inventory(*roots, cache_file=cache_file)
+    assert first['boot_id'] == '3c1d7b0e-boot'
+    with open(cache_file) as f:
+        assert json.load(f) == first
+
+    # 同一次开机内读取缓存，不再探测
+    os.unlink(os.path.join(roots[0], 'cpuinfo'))
+    assert molink_hwprobe.probe_inventory(*roots, cache_file=cache_file) == first
+
+    write(os.path.join(roots[0], 'sys/kernel/random/boot_id'), 'next-boot\n')
+    second = molink_hwprobe.probe_inventory(*roots, cache_file=cache_file)
+    assert second['boot_id'] == 'next-boot'
+    assert 'cpu' in second['errors']
+
+def test_failed_probe_is_not_cached(roots, no_nvidia_smi, tmp_path, monkeypatch):
+    cache_file = str(tmp_path / 'cache' / 'hwinfo.json')
+
+    def broken(proc_root, sys_root):
+        raise RuntimeError("nvidia-smi timed out")
+
+    original = molink_hwprobe.PROBES['gpu_topology']
+    monkeypatch.setitem(molink_hwprobe.PROBES, 'gpu_topology', broken)
+    inventory = molink_hwprobe.probe_inventory(*roots, cache_file=cache_file)
+    assert inventory['errors'] == {"gpu_topology": "nvidia-smi timed out"}
+    assert inventory['cpu']['physical'] == 4
+    assert not os.path.exists(cache_file)
+
+    # 故障恢复后重新探测并写入缓存
+    monkeypatch.setitem(molink_hwprobe.PROBES, 'gpu_topology', original)
+    assert molink_hwprobe.probe_inventory(*roots, cache_file=cache_file)['errors'] == {}
+    assert os.path.exists(cache_file)
@@ -0,0 +1,95 @@
+# 控制平面的 Idempotency-Key：重放、键冲突、5xx 不缓存与处理中的重复请求（以 /k8s_fail 为例，临时 SQLite 库）
+import threading
+
+import pytest
+
+REPORT = {"hardware_info": {"name": "node-a", "ip": "10.0.0.1"}, "stage": "kubeadm_join", "error": "timeout"}
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+def failure_rows(backend):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM join_failure")
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count
+
+def report(client, body, key):
+    return client.post('/k8s_fail', json=body, headers={'Idempotency-Key': key})
+
+def test_replay_returns_cached_response(backend, client):
+    first = report(client, REPORT, 'key-1')
+    assert first.status_code == 200
+    assert 'Idempotent-Replayed' not in first.headers
+
+    replay = report(client, REPORT, 'key-1')
+    assert replay.status_code == 200
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json() == first.get_json()
+    # 重放不再写库
+    assert failure_rows(backend) == 1
+    assert backend.idempotency_cache.replays == 1
+
+    # 没有键或换一个键都是新的操作
+    assert 'Idempotent-Replayed' not in client.post('/k8s_fail', json=REPORT).headers
+    assert report(client, REPORT, 'key-2').get_json()['id'] != first.get_json()['id']
+    assert failure_rows(backend) == 3
+
+def test_key_reused_with_different_body(backend, client):
+    assert report(client, REPORT, 'key-1').status_code == 200
+    resp = report(client, dict(REPORT, error="other"), 'key-1')
+    assert resp.status_code == 422
+    assert failure_rows(backend) == 1
+    assert backend.idempotency_cache.conflicts == 1
+
+    # 键按路由区分：同一个键用于另一个路由不冲突
+    resp = client.post('/k8s_delete', json={}, headers={'Idempotency-Key': 'key-1'})
+    assert resp.status_code != 422
+
+def test_key_too_long(client):
+    assert report(client, REPORT, 'k' * 129).status_code == 400
+
+def test_server_error_is_not_cached(backend, client, monkeypatch):
+    insert_sql = backend.JOIN_FAILURE_INSERT_SQL
+    monkeypatch.setattr(backend, 'JOIN_FAILURE_INSERT_SQL', "INSERT INTO missing_table VALUES (%s)")
+    assert report(client, REPORT, 'key-1').status_code == 500
+    monkeypatch.setattr(backend, 'JOIN_FAILURE_INSERT_SQL', insert_sql)
+    # 失败的请求不留下条目，重试会重新执行
+    resp = report(client, REPORT, 'key-1')
+    assert resp.status_code == 200
+    assert 'Idempotent-Replayed' not in resp.headers
+    assert failure_rows(backend) == 1
+
+def test_duplicate_in_progress_request(backend, client, monkeypatch):
+    monkeypatch.setattr(backend.Config, 'AdmissionQueueTimeout', 0.05)
+    release = threading.Event()
+    entered = threading.Event()
+    join_failure_row = backend.join_failure_row
+
+    def slow_row(data, username):
+        entered.set()
+        release.wait(5)
+        return join_failure_row(data, username)
+
+    monkeypatch.setattr(backend, 'join_failure_row', slow_row)
+    results = []
+    thread = threading.Thread(target=lambda: results.append(report(backend.app.test_client(), REPORT, 'key-1')))
+    thread.start()
+    assert entered.wait(5)
+
+    # 第一次请求还在处理：重复请求不执行，提示稍后重试
+    resp = report(client, REPORT, 'key-1')
+    assert resp.status_code == 409
+    assert resp.headers['Retry-After'] == '1'
+
+    release.set()
+    thread.join(5)
+    assert results[0].status_code == 200
+    resp = report(client, REPORT, 'key-1')
+    assert resp.headers['Idempotent-Replayed'] == 'true'
+    assert resp.get_json() == results[0].get_json()
+    assert failure_rows(backend) == 1
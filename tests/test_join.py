@@ -0,0 +1,106 @@
+# 控制平面的节点登记：/k8s_complete 与 /k8s_complete_batch（临时 SQLite 库）
+import pytest
+
+def hardware_info(name, ip):
+    return {"name": name, "ip": ip, "num_cpu": 8, "size_mem": 64.0, "num_gpu": 1, "gpu_type": "NVIDIA A100"}
+
+def node_row(backend, name):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT name, ip, user_id FROM node WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return row
+
+def targets(backend, name='node_exporters'):
+    return backend.service_discovery[name].snapshot()[1].decode()
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+def complete(backend, client, username, user_id, name, ip):
+    token = backend.issue_session_token(username, user_id, name)
+    return client.post('/k8s_complete', json={"hardware_info": hardware_info(name, ip), "session_token": token})
+
+def test_second_user_cannot_take_over_node(backend, users, client):
+    assert complete(backend, client, 'alice', users['alice'], 'node-a', '10.0.0.1').status_code == 200
+
+    # bob 用自己的凭据也能拿到 node-a 的会话令牌，但不能接管 alice 的节点
+    resp = complete(backend, client, 'bob', users['bob'], 'node-a', '10.0.0.66')
+    assert resp.status_code == 409
+    assert node_row(backend, 'node-a') == {"name": "node-a", "ip": "10.0.0.1", "user_id": users['alice']}
+    assert '10.0.0.66' not in targets(backend)
+
+    # 原用户重新加入照常更新，旧 IP 从服务发现中移除
+    assert complete(backend, client, 'alice', users['alice'], 'NODE-A', '10.0.0.2').status_code == 200
+    assert node_row(backend, 'node-a')['ip'] == '10.0.0.2'
+    assert '10.0.0.1:9100' not in targets(backend) and '10.0.0.2:9100' in targets(backend)
+
+def test_batch_cannot_take_over_node(backend, users, client):
+    assert complete(backend, client, 'alice', users['alice'], 'node-a', '10.0.0.1').status_code == 200
+    for username, record in (('bob', {}), (backend.Config.AdminUser, {"username": "bob"})):
+        resp = client.post('/k8s_complete_batch', json={
+            "username": username,
+            "user_password": f"{username}-pw",
+            "nodes": [
+                dict(record, hardware_info=hardware_info('node-a', '10.0.0.66')),
+                dict(record, hardware_info=hardware_info('node-b', '10.0.0.3')),
+            ],
+        })
+        assert resp.status_code == 207
+        results = resp.get_json()['results']
+        assert results[0] == {"index": 0, "name": "node-a", "status": "error",
+                              "error": "Node is registered by another user"}
+        assert results[1]['status'] == 'registered'
+    assert node_row(backend, 'node-a') == {"name": "node-a", "ip": "10.0.0.1", "user_id": users['alice']}
+    assert node_row(backend, 'node-b')['user_id'] == users['bob']
+
+def test_upsert_never_changes_owner(backend, users):
+    # 检查与写入之间并发登记时，SQL 本身也不会改写其他用户的节点
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    upsert = backend.NODE_UPSERT_SQL[backend.Config.DbType]
+    cursor.execute(upsert, backend.node_row(hardware_info('node-a', '10.0.0.1'), users['alice']))
+    cursor.execute(upsert, backend.node_row(hardware_info('node-a', '10.0.0.66'), users['bob']))
+    conn.commit()
+    assert node_row(backend, 'node-a') == {"name": "node-a", "ip": "10.0.0.1", "user_id": users['alice']}
+    cursor.execute(upsert, backend.node_row(hardware_info('node-a', '10.0.0.2'), users['alice']))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    assert node_row(backend, 'node-a') == {"name": "node-a", "ip": "10.0.0.2", "user_id": users['alice']}
+
+@pytest.mark.parametrize("auth", [
+    {},
+    {"username": "alice"},
+    {"username": "alice", "user_password": "wrong"},
+    {"username": "nobody", "user_password": "nobody-pw"},
+    {"username": "alice", "user_password": ["alice-pw"]},
+    {"session_token": "bogus", "username": "alice"},
+])
+def test_complete_requires_session_or_credentials(backend, users, client, auth):
+    resp = client.post('/k8s_complete', json=dict(auth, hardware_info=hardware_info('node-a', '10.0.0.1')))
+    assert resp.status_code == 401
+    assert node_row(backend, 'node-a') is None
+
+def test_complete_with_credentials(backend, users, client):
+    resp = client.post('/k8s_complete', json={
+        "username": "alice", "user_password": "alice-pw", "hardware_info": hardware_info('node-a', '10.0.0.1'),
+    })
+    assert resp.status_code == 200
+    assert node_row(backend, 'node-a')['user_id'] == users['alice']
+
+@pytest.mark.parametrize("body", [
+    {"hardware_info": "node-a"},
+    {"hardware_info": ["node-a", "10.0.0.1"]},
+    {"hardware_info": None},
+    [{"hardware_info": {"name": "node-a"}}],
+])
+def test_complete_rejects_malformed_hardware_info(backend, users, client, body):
+    if isinstance(body, dict):
+        body = dict(body, session_token=backend.issue_session_token('alice', users['alice'], 'node-a'))
+    resp = client.post('/k8s_complete', json=body)
+    assert resp.status_code == 400
+    assert resp.get_json() == {"error": "Invalid request"}
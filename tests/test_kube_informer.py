@@ -0,0 +1,231 @@
+# kube_informer.py 对接回环上的假 API server：list 分页、watch 事件、断线续传、410 重新 list 与异常恢复
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip('requests')
+pytest.importorskip('yaml')
+
+import kube_informer
+from kube_informer import KubeClient, NodeInformer, NODE_CORDONED, NODE_NOT_READY, NODE_READY
+
+def node(name, ready=True, unschedulable=False, rv='1'):
+    return {
+        "metadata": {"name": name, "resourceVersion": rv},
+        "spec": {"unschedulable": unschedulable},
+        "status": {
+            "conditions": [{"type": "Ready", "status": "True" if ready else "False"}],
+            "addresses": [{"type": "InternalIP", "address": "10.0.0.1"}],
+            "allocatable": {"nvidia.com/gpu": "2"},
+        },
+    }
+
+class FakeApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.server.requests.append(params)
+        if url.path != '/api/v1/nodes':
+            self.send_error(404)
+        elif params.get('watch') == 'true':
+            self.watch()
+        else:
+            self.list(params)
+
+    def list(self, params):
+        names = sorted(self.server.nodes)
+        start = int(params.get('continue', 0))
+        end = start + int(params.get('limit', 500))
+        metadata = {"resourceVersion": str(self.server.resource_version)}
+        if end < len(names):
+            metadata["continue"] = str(end)
+        self.reply(200, json.dumps({"items": [self.server.nodes[n] for n in names[start:end]], "metadata": metadata}))
+
+    def watch(self):
+        """每次 watch 取出一段脚本：dict 为事件，bytes 原样发送，int 为错误状态码；没有脚本时立即正常结束"""
+        try:
+            script = self.server.watches.get(timeout=0.2)
+        except queue.Empty:
+            script = []
+        if isinstance(script, int):
+            self.reply(script, json.dumps({"kind": "Status", "code": script}))
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        for item in script:
+            self.wfile.write(item if isinstance(item, bytes) else json.dumps(item).encode() + b'\n')
+            self.wfile.flush()
+
+    def reply(self, status, body):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def api_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeApiHandler)
+    server.daemon_threads = True
+    server.nodes = {name: node(name) for name in ('node-a', 'node-b')}
+    server.resource_version = 10
+    server.watches = queue.Queue()
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def start_informer(api_server, monkeypatch):
+    # 退避时间缩短到毫秒级
+    monkeypatch.setattr(kube_informer.random, 'uniform', lambda a, b: 0.01)
+    informers = []
+
+    def start(factory=None, **kwargs):
+        changes = []
+        informer = NodeInformer(factory or (lambda: KubeClient(api_server.url)), on_change=changes.append,
+                                batch_interval=0.05, **kwargs)
+        informer.start()
+        informers.append(informer)
+        return informer, changes
+
+    yield start
+    for informer in informers:
+        informer.stop()
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def watch_requests(api_server):
+    return [params for params in api_server.requests if params.get('watch') == 'true']
+
+def test_list_paginates(api_server):
+    api_server.nodes.update({f"node-{i}": node(f"node-{i}") for i in range(5)})
+    items, resource_version = KubeClient(api_server.url).list_nodes(limit=2)
+    assert sorted(item['metadata']['name'] for item in items) == sorted(api_server.nodes)
+    assert resource_version == '10'
+    assert [params.get('continue') for params in api_server.requests] == [None, '2', '4', '6']
+
+def test_sync_and_watch_events(api_server, start_informer):
+    informer, changes = start_informer()
+    assert informer.wait_synced(5)
+    assert informer.is_ready('NODE-A') and informer.exists('node-b')
+    assert wait_for(lambda: changes)
+    assert {name: summary['status'] for name, summary in changes[0].items()} == {
+        'node-a': NODE_READY, 'node-b': NODE_READY,
+    }
+    assert informer.get('node-a')['allocatable_gpus'] == 2
+
+    api_server.watches.put([
+        {"type": "MODIFIED", "object": node('node-a', ready=False, rv='11')},
+        {"type": "MODIFIED", "object": node('node-b', unschedulable=True, rv='12')},
+        {"type": "ADDED", "object": node('node-c', rv='13')},
+        {"type": "DELETED", "object": node('node-b', rv='14')},
+        {"type": "BOOKMARK", "object": {"metadata": {"resourceVersion": "20"}}},
+    ])
+    assert wait_for(lambda: informer.resource_version == '20')
+    assert informer.status_of('node-a') == NODE_NOT_READY
+    assert informer.exists('node-c') and not informer.exists('node-b')
+    assert wait_for(lambda: 'node-c' in {name for batch in changes for name in batch})
+    merged = {}
+    for batch in changes[1:]:
+        merged.update(batch)
+    assert merged['node-b'] is None
+    assert merged['node-c']['status'] == NODE_READY
+
+def test_heartbeats_do_not_queue_writes(api_server, start_informer):
+    informer, changes = start_informer()
+    assert informer.wait_synced(5)
+    assert wait_for(lambda: changes)
+    api_server.watches.put([{"type": "MODIFIED", "object": node('node-a', rv=str(rv))} for rv in range(11, 20)])
+    assert wait_for(lambda: informer.resource_version == '19')
+    informer.flush()
+    assert len(changes) == 1
+
+def test_watch_resumes_from_last_resource_version(api_server, start_informer):
+    informer, _ = start_informer()
+    assert informer.wait_synced(5)
+    api_server.watches.put([{"type": "MODIFIED", "object": node('node-a', rv='15')}])
+    assert wait_for(lambda: any(params.get('resourceVersion') == '15' for params in watch_requests(api_server)))
+    assert informer.lists == 1
+    assert watch_requests(api_server)[0]['resourceVersion'] == '10'
+
+@pytest.mark.parametrize("expired", [
+    410,
+    [{"type": "ERROR", "object": {"kind": "Status", "code": 410, "message": "too old resource version"}}],
+])
+def test_expired_resource_version_relists(api_server, start_informer, expired):
+    informer, _ = start_informer()
+    assert informer.wait_synced(5)
+    api_server.nodes = {'node-z': node('node-z')}
+    api_server.resource_version = 30
+    api_server.watches.put(expired)
+    assert wait_for(lambda: informer.lists == 2)
+    assert wait_for(lambda: informer.resource_version == '30')
+    assert set(informer.nodes()) == {'node-z'}
+
+def test_unexpected_errors_back_off_and_keep_watching(api_server, start_informer):
+    informer, _ = start_informer()
+    assert informer.wait_synced(5)
+    # 不是对象的事件、metadata 不是对象的节点：以前会让监听线程直接退出
+    api_server.watches.put([[1, 2]])
+    api_server.watches.put([{"type": "MODIFIED", "object": {"metadata": ["node-a"]}}])
+    api_server.watches.put([b'{"type": "MODIFIED", "object": {"metad'])
+    api_server.watches.put(503)
+    assert wait_for(lambda: informer.reconnects == 4)
+    assert informer.lists >= 2
+    assert informer._threads[0].is_alive()
+
+    api_server.watches.put([{"type": "MODIFIED", "object": node('node-b', unschedulable=True, rv='40')}])
+    assert wait_for(lambda: informer.status_of('node-b') == NODE_CORDONED)
+    assert informer.stats()['last_error']
+
+def test_client_factory_failure_is_retried(api_server, start_informer):
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise RuntimeError("kubeconfig not ready")
+        return KubeClient(api_server.url)
+
+    informer, _ = start_informer(factory)
+    assert informer.wait_synced(5)
+    assert len(attempts) == 3
+    assert informer.stats()['last_error'] == "RuntimeError: kubeconfig not ready"
+
+def test_cli_prints_changes_from_server_option(api_server):
+    script = os.path.join(os.path.dirname(kube_informer.__file__), 'kube_informer.py')
+    proc = subprocess.Popen(
+        [sys.executable, script, '--server', api_server.url, '--batch-interval', '0.05'],
+        stdout=subprocess.PIPE, text=True, env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    )
+    try:
+        lines = [json.loads(proc.stdout.readline()) for _ in range(2)]
+    finally:
+        proc.kill()
+        proc.wait()
+    assert [(line['node'], line['status']) for line in lines] == [('node-a', NODE_READY), ('node-b', NODE_READY)]
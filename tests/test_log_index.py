@@ -0,0 +1,218 @@
+# 节点日志的稀疏索引 LogIndex 与 /molink_log/query：按时间、级别、子串查询，增量更新、截断与轮转（临时日志文件）
+import json
+import os
+import random
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('flask')
+
+import molink_cli_k8s
+from molink_cli_k8s import LEVELS, LogIndex, parse_line_ts
+
+BASE = datetime(2025, 3, 12, 10, 0, 0).timestamp()
+LEVEL_NAMES = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+def make_lines(count, first=0):
+    """每秒一行，每 7 行带一段两行的异常堆栈（无时间戳的续行）"""
+    lines = []
+    for i in range(first, first + count):
+        stamp = datetime.fromtimestamp(BASE + i).strftime('%Y-%m-%d %H:%M:%S')
+        lines.append(f"{stamp},{i % 1000:03d} {LEVEL_NAMES[i % 4]} worker request {i}\n")
+        if i % 7 == 3:
+            lines.append(f"Traceback (most recent call last): request {i}\n")
+            lines.append(f"  ValueError: bad request {i}\n")
+    return lines
+
+def write(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.write(''.join(lines))
+
+def annotate(lines):
+    """逐行标注 (ts, level, line)，续行沿用上一行的时间戳和级别"""
+    result = []
+    ts = level = None
+    for line in lines:
+        raw = line.encode()
+        line_ts = parse_line_ts(raw)
+        if line_ts is not None:
+            ts, level = line_ts, molink_cli_k8s.parse_line_level(raw)
+        result.append((ts, level, line.rstrip()))
+    return result
+
+def expected(lines, start=None, end=None, min_level=None, contains=None, limit=1000):
+    """不使用索引的参考结果：有 start 时取最早的 limit 行，否则取最近的 limit 行"""
+    matches = [
+        (ts, level, line) for ts, level, line in annotate(lines)
+        if (start is None or (ts is not None and ts >= start))
+        and (end is None or ts is None or ts <= end)
+        and (min_level is None or (level is not None and level >= min_level))
+        and (contains is None or contains in line)
+    ]
+    return matches[:limit] if start is not None else matches[-limit:]
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    # 小块反向读取，查询会跨越多个块
+    monkeypatch.setattr(molink_cli_k8s, 'BLOCK_SIZE', 256)
+    return str(tmp_path / 'molink_log.txt')
+
+def test_sparse_index_entries(log):
+    lines = make_lines(100)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=16)
+    assert index.update()
+    assert index.lines == len(lines)
+    assert index.scanned == os.path.getsize(log)
+    assert len(index.offsets) == (len(lines) + 15) // 16
+    with open(log, 'rb') as f:
+        data = f.read()
+    annotated = annotate(lines)
+    for n, (offset, ts) in enumerate(zip(index.offsets, index.timestamps)):
+        # 每个索引点位于第 16*n 行的行首，时间戳为该行（或其所属行）的时间
+        assert offset == len(''.join(lines[:16 * n]).encode())
+        assert data[offset - 1:offset] in (b'', b'\n')
+        assert ts == annotated[16 * n][0]
+    assert list(index.timestamps) == sorted(index.timestamps)
+
+@pytest.mark.parametrize("query", [
+    {"start": 10, "end": 20},
+    {"start": 0.5, "end": 0.5},
+    {"start": 33.2},
+    {"start": 3, "end": 60, "min_level": LEVELS[b'WARNING']},
+    {"start": 3, "contains": "ValueError"},
+    {"end": 50},
+    {"end": 50, "limit": 7},
+    {"end": 17, "min_level": LEVELS[b'ERROR'], "limit": 3},
+    {"contains": "request 9"},
+    {},
+    {"start": -100, "end": -50},
+    {"start": 1000},
+])
+def test_query_matches_full_scan(log, query):
+    lines = make_lines(200)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=8)
+    index.update()
+    for key in ('start', 'end'):
+        if key in query:
+            query[key] += BASE
+    assert list(index.query(**query)) == expected(lines, **query)
+
+def test_random_ranges(log):
+    lines = make_lines(500)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=8)
+    index.update()
+    rng = random.Random(0)
+    for _ in range(100):
+        start = BASE + rng.uniform(-10, 510) if rng.random() < 0.7 else None
+        end = BASE + rng.uniform(-10, 510) if rng.random() < 0.7 else None
+        min_level = rng.choice([None, 10, 20, 30, 40])
+        limit = rng.choice([1, 5, 50, 1000])
+        assert list(index.query(start, end, min_level, None, limit)) == expected(
+            lines, start, end, min_level, None, limit
+        )
+
+def test_lines_before_first_timestamp(log):
+    lines = ["banner without timestamp\n", "second banner\n"] + make_lines(5)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=2)
+    index.update()
+    result = list(index.query(limit=3))
+    assert result == expected(lines, limit=3)
+    assert [line for _, _, line in index.query()][:2] == ["banner without timestamp", "second banner"]
+    # 指定 start 时没有时间戳的行不在范围内
+    assert list(index.query(start=BASE - 100, limit=1))[0][2].endswith("request 0")
+
+def test_only_indexed_range_is_queried(log):
+    lines = make_lines(20)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=4)
+    index.update()
+    write(log, make_lines(5, first=20) + ["2025-03-12 10:00:30,000 ERROR half a li"])
+    # 新增内容在下一次 update 前不可见，半行在写完前不进入索引
+    assert list(index.query()) == expected(lines)
+    index.update()
+    assert list(index.query()) == expected(lines + make_lines(5, first=20))
+    write(log, ["ne\n"])
+    index.update()
+    assert list(index.query(limit=1))[0][2] == "2025-03-12 10:00:30,000 ERROR half a line"
+
+def test_incremental_update_and_reload(log):
+    lines = make_lines(50)
+    write(log, lines)
+    index = LogIndex(log, log + '.idx', every=4)
+    index.update()
+    entries = len(index.offsets)
+    more = make_lines(50, first=50)
+    write(log, more)
+    index.update()
+    assert len(index.offsets) > entries
+
+    # 重新打开时从索引文件加载，不重新扫描
+    reloaded = LogIndex(log, log + '.idx', every=4)
+    assert list(reloaded.offsets) == list(index.offsets)
+    assert list(reloaded.timestamps) == list(index.timestamps)
+    assert reloaded.indexed() == index.indexed()
+    assert list(reloaded.query(start=BASE + 40, end=BASE + 60)) == expected(lines + more, BASE + 40, BASE + 60)
+
+    # 采样间隔不同的索引文件不使用
+    assert LogIndex(log, log + '.idx', every=8).scanned == 0
+
+def test_truncation_rebuilds_index(log):
+    write(log, make_lines(100))
+    index = LogIndex(log, log + '.idx', every=4)
+    index.update()
+    lines = make_lines(10, first=500)
+    write(log, lines, mode='w')
+    index.update()
+    assert index.lines == len(lines)
+    assert list(index.query()) == expected(lines)
+    assert list(LogIndex(log, log + '.idx', every=4).query()) == expected(lines)
+
+def test_rotation_rebuilds_index(log):
+    write(log, make_lines(100))
+    index = LogIndex(log, log + '.idx', every=4)
+    index.update()
+    os.rename(log, log + '.1')
+    lines = make_lines(200, first=1000)
+    write(log, lines)
+    # 轮转后、重建索引前不返回旧文件的结果
+    assert list(index.query()) == []
+    index.update()
+    assert list(index.query(start=BASE + 1100, limit=5)) == expected(lines, start=BASE + 1100, limit=5)
+
+@pytest.fixture
+def service(log, monkeypatch):
+    monkeypatch.setattr(molink_cli_k8s, 'LOG_FILE', log)
+    index = LogIndex(log, log + '.idx', every=8)
+    # 测试中手动更新，不启动后台线程
+    monkeypatch.setattr(molink_cli_k8s, 'log_index', index)
+    return index, molink_cli_k8s.app.test_client()
+
+def ndjson(resp):
+    assert resp.status_code == 200
+    assert resp.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+def test_query_endpoint(service, log):
+    index, client = service
+    assert client.get('/molink_log/query').status_code == 404
+    lines = make_lines(100)
+    write(log, lines)
+    index.update()
+
+    start = datetime.fromtimestamp(BASE + 10).isoformat()
+    result = ndjson(client.get('/molink_log/query', query_string={"start": start, "end": BASE + 30, "level": "warn"}))
+    assert [(item['ts'], item['level'], item['line']) for item in result] == expected(
+        lines, BASE + 10, BASE + 30, LEVELS[b'WARN']
+    )
+    assert {item['level'] for item in result} == {30, 40}
+
+    result = ndjson(client.post('/molink_log/query', json={"contains": "ValueError", "limit": 2}))
+    assert [item['line'] for item in result] == [line for _, _, line in expected(lines, contains="ValueError", limit=2)]
+
+    for params in ({"level": "LOUD"}, {"start": "yesterday"}, {"limit": "many"}):
+        assert client.get('/molink_log/query', query_string=params).status_code == 400
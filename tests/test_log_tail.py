@@ -0,0 +1,118 @@
+# 节点日志服务的尾部读取与增量游标：get_last_n_lines、read_since 与 /molink_log（临时日志文件）
+import os
+
+import pytest
+
+pytest.importorskip('flask')
+
+import molink_cli_k8s
+from molink_cli_k8s import get_last_n_lines, read_since
+
+def write(path, lines, mode='a'):
+    with open(path, mode) as f:
+        f.write(''.join(lines))
+
+def numbered(first, last):
+    return [f"2025-03-12 10:00:00,000 INFO line {i}\n" for i in range(first, last)]
+
+@pytest.fixture
+def log(tmp_path, monkeypatch):
+    # 小块读取，跨多个块的情况也能覆盖到
+    monkeypatch.setattr(molink_cli_k8s, 'BLOCK_SIZE', 64)
+    path = tmp_path / 'molink_log.txt'
+    monkeypatch.setattr(molink_cli_k8s, 'LOG_FILE', str(path))
+    return str(path)
+
+def test_last_n_lines(log):
+    write(log, numbered(0, 200))
+    lines, cursor = get_last_n_lines(5, log)
+    assert lines == [line.rstrip('\n') for line in numbered(195, 200)]
+    assert cursor
+    assert get_last_n_lines(0, log)[0] == []
+    assert get_last_n_lines(1000, log)[0] == [line.rstrip('\n') for line in numbered(0, 200)]
+
+def test_last_n_lines_without_trailing_newline(log):
+    write(log, numbered(0, 10) + ["partial"])
+    assert get_last_n_lines(2, log)[0] == ["2025-03-12 10:00:00,000 INFO line 9", "partial"]
+
+def test_missing_file(log):
+    assert get_last_n_lines(5, log) == (None, None)
+    assert read_since('', log) == (None, '', False)
+
+def test_cursor_returns_only_new_complete_lines(log):
+    write(log, numbered(0, 3))
+    _, cursor = get_last_n_lines(3, log)
+    assert read_since(cursor, log)[0] == []
+
+    write(log, numbered(3, 5) + ["half a li"])
+    lines, cursor, reset = read_since(cursor, log)
+    assert lines == [line.rstrip('\n') for line in numbered(3, 5)] and not reset
+
+    # 半行留到写完后再返回
+    write(log, ["ne\n"])
+    lines, cursor, reset = read_since(cursor, log)
+    assert lines == ["half a line"] and not reset
+    assert read_since(cursor, log)[0] == []
+
+def test_truncation_resets_cursor(log):
+    write(log, numbered(0, 10))
+    _, cursor = get_last_n_lines(1, log)
+    write(log, ["after truncate\n"], mode='w')
+    lines, _, reset = read_since(cursor, log)
+    assert lines == ["after truncate"] and reset
+
+def test_rotation_resets_cursor(log):
+    write(log, numbered(0, 10))
+    _, cursor = get_last_n_lines(1, log)
+    os.rename(log, log + '.1')
+    write(log, numbered(100, 200))
+    lines, cursor, reset = read_since(cursor, log)
+    # 新文件比旧游标的偏移更长，仍按 inode 识别出轮转
+    assert reset and lines == [line.rstrip('\n') for line in numbered(100, 200)]
+    assert read_since(cursor, log) == ([], cursor, False)
+
+def test_invalid_cursor_reads_from_start(log):
+    write(log, numbered(0, 2))
+    for cursor in ('', 'not-base64!', 'Zm9v'):
+        lines, _, reset = read_since(cursor, log)
+        assert reset and len(lines) == 2
+
+def test_read_is_bounded(log):
+    write(log, numbered(0, 100))
+    lines, cursor, _ = read_since('', log, max_bytes=200)
+    assert lines == [line.rstrip('\n') for line in numbered(0, len(lines))]
+    assert 0 < len(lines) < 100
+    # 剩余部分由后续调用读取，不丢行
+    rest = []
+    while True:
+        more, cursor, reset = read_since(cursor, log, max_bytes=200)
+        assert not reset
+        if not more:
+            break
+        rest.extend(more)
+    assert lines + rest == [line.rstrip('\n') for line in numbered(0, 100)]
+
+    # 超过上限的单行按上限切开返回，游标仍然前进
+    write(log, ["x" * 500 + "\n"])
+    more, new_cursor, _ = read_since(cursor, log, max_bytes=200)
+    assert more == ["x" * 200] and new_cursor != cursor
+
+def test_log_endpoint_tail_and_cursor(log):
+    client = molink_cli_k8s.app.test_client()
+    assert client.post('/molink_log', json={"n": 2}).status_code == 404
+
+    write(log, ["2025-03-12 10:00:00,000 INFO start\n", "  continuation\n", "2025-03-12 10:00:01,500 WARN next\n"])
+    result = client.post('/molink_log', json={"n": 2}).get_json()
+    assert result['lines'] == ["continuation", "2025-03-12 10:00:01,500 WARN next"]
+    # 续行所属的带时间戳行不在返回范围内
+    assert result['ts'] == [None, molink_cli_k8s.parse_line_ts(b"2025-03-12 10:00:01,500")]
+    assert result['reset'] is False
+
+    write(log, ["2025-03-12 10:00:02,000 ERROR boom\n"])
+    result = client.post('/molink_log', query_string={"cursor": result['cursor']}).get_json()
+    assert result['lines'] == ["2025-03-12 10:00:02,000 ERROR boom"]
+    assert result['reset'] is False
+
+    write(log, ["fresh\n"], mode='w')
+    result = client.post('/molink_log', json={"cursor": result['cursor']}).get_json()
+    assert result['lines'] == ["fresh"] and result['reset'] is True
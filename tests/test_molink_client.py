@@ -0,0 +1,184 @@
+# molink_client.py 的重试与退避：回环上的脚本化 HTTP 服务，以及丢失响应后由控制平面按 Idempotency-Key 重放
+import json
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+import molink_client
+from molink_client import ControlPlaneClient
+
+class LoopbackSession(requests.Session):
+    """客户端固定使用 https，测试服务是明文 HTTP"""
+
+    def request(self, method, url, *args, **kwargs):
+        return super().request(method, url.replace('https://', 'http://', 1), *args, **kwargs)
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """按顺序取出脚本中的 (状态码, 响应头)；脚本用完后返回 200"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.respond()
+
+    def respond(self):
+        self.server.requests.append((self.command, self.headers.get('Idempotency-Key')))
+        try:
+            status, headers = self.server.script.get_nowait()
+        except queue.Empty:
+            status, headers = 200, {}
+        body = json.dumps({"status": status}).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    server.daemon_threads = True
+    server.script = queue.Queue()
+    server.requests = []
+
+    def play(*steps):
+        for step in steps:
+            server.script.put(step if isinstance(step, tuple) else (step, {}))
+
+    server.play = play
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def delays(monkeypatch):
+    """记录退避时间而不真正等待；抖动取上限，延迟可预测"""
+    slept = []
+    monkeypatch.setattr(molink_client.time, 'sleep', slept.append)
+    monkeypatch.setattr(molink_client.random, 'uniform', lambda low, high: high)
+    return slept
+
+def make_client(port, **kwargs):
+    client = ControlPlaneClient('127.0.0.1', port=port, **kwargs)
+    client.session = LoopbackSession()
+    return client
+
+def test_post_retries_with_one_idempotency_key(server, delays):
+    server.play(503, 500, 502)
+    resp = make_client(server.server_address[1]).post('k8s_complete', {"a": 1})
+    assert resp.status_code == 200
+    keys = [key for _, key in server.requests]
+    assert len(keys) == 4 and len(set(keys)) == 1 and keys[0]
+    # 指数退避：backoff * 2^attempt
+    assert delays == [0.5, 1.0, 2.0]
+
+    # 每次调用是一个新操作，使用新的键
+    make_client(server.server_address[1]).post('k8s_complete', {"a": 1})
+    assert server.requests[-1][1] != keys[0]
+
+def test_backoff_is_capped(server, delays):
+    server.play(*[503] * 4)
+    client = make_client(server.server_address[1], backoff=1, max_backoff=3)
+    assert client.get('k8s_nodes/node-a').status_code == 200
+    assert delays == [1, 2, 3, 3]
+
+def test_retry_after_is_honoured(server, delays):
+    server.play((429, {'Retry-After': '7'}), (503, {'Retry-After': '600'}))
+    client = make_client(server.server_address[1], max_backoff=30)
+    assert client.get('k8s_nodes/node-a').status_code == 200
+    # Retry-After 加上不超过 backoff 的抖动，且不超过 max_backoff
+    assert delays == [7 + 0.5, 30 + 0.5]
+
+def test_retries_exhausted_return_last_response(server, delays):
+    server.play(*[503] * 10)
+    resp = make_client(server.server_address[1], retries=2).get('k8s_nodes/node-a')
+    assert resp.status_code == 503
+    assert len(server.requests) == 3 and len(delays) == 2
+
+def test_non_idempotent_post_only_retries_rejections(server, delays):
+    # 503 时请求可能已经执行，不带 Idempotency-Key 的写操作不重试
+    server.play(503)
+    client = make_client(server.server_address[1])
+    assert client.post('k8s_logs', {}, idempotent=False).status_code == 503
+    assert server.requests == [('POST', None)]
+
+    # 429 表示控制平面尚未处理，可以安全重试
+    server.play(429)
+    assert client.post('k8s_logs', {}, idempotent=False).status_code == 200
+    assert len(server.requests) == 3
+
+def test_client_errors_are_not_retried(server, delays):
+    server.play(401)
+    assert make_client(server.server_address[1]).post('k8s_complete', {}).status_code == 401
+    assert len(server.requests) == 1 and delays == []
+
+def test_connection_errors(delays):
+    # 没有服务监听的端口
+    probe = ThreadingHTTPServer(('127.0.0.1', 0), ScriptedHandler)
+    port = probe.server_address[1]
+    probe.server_close()
+
+    client = make_client(port, retries=3)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.get('k8s_nodes/node-a')
+    assert delays == [0.5, 1.0, 2.0]
+
+    del delays[:]
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.post('k8s_logs', {}, idempotent=False)
+    assert delays == []
+
+# ---- 与控制平面配合 ----
+
+@pytest.fixture
+def lossy_control_plane(backend):
+    """第一次 /k8s_fail 正常执行，但响应在途中丢失（网关返回 502）"""
+    from werkzeug.serving import make_server
+    dropped = []
+
+    def app(environ, start_response):
+        if environ['PATH_INFO'] == '/k8s_fail' and not dropped:
+            dropped.append(environ.get('HTTP_IDEMPOTENCY_KEY'))
+            response = backend.app.test_client().open(
+                '/k8s_fail', method='POST', data=environ['wsgi.input'].read(int(environ['CONTENT_LENGTH'])),
+                headers={'Content-Type': 'application/json', 'Idempotency-Key': dropped[0]},
+            )
+            assert response.status_code == 200
+            start_response('502 Bad Gateway', [('Content-Length', '0')])
+            return [b'']
+        return backend.app(environ, start_response)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    server.dropped = dropped
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+
+def test_lost_response_is_replayed_not_repeated(backend, lossy_control_plane, delays):
+    client = make_client(lossy_control_plane.server_port)
+    report = {"hardware_info": {"name": "node-a", "ip": "10.0.0.1"}, "stage": "kubeadm_join", "error": "timeout"}
+    resp = client.post('k8s_fail', report)
+    assert resp.status_code == 200
+    assert resp.headers['Idempotent-Replayed'] == 'true'
+    assert lossy_control_plane.dropped[0]
+    assert len(delays) == 1
+
+    failures = client.get('k8s_failures').json()['failures']
+    assert len(failures) == 1
+    assert failures[0]['id'] == resp.json()['id']
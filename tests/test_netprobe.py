@@ -0,0 +1,193 @@
+# molink_netprobe.py 的测量/上报循环与控制平面 /netprobe/* 接口，全部在回环地址上运行
+import json
+import threading
+import types
+
+import pytest
+
+requests = pytest.importorskip('requests')
+
+import molink_netprobe
+
+class LoopbackSession(requests.Session):
+    """代理固定使用 https，测试用的控制平面是明文 HTTP"""
+
+    def request(self, method, url, *args, **kwargs):
+        return super().request(method, url.replace('https://', 'http://', 1), *args, **kwargs)
+
+@pytest.fixture
+def probe_server():
+    servers = []
+
+    def start(delay_ms=0.0):
+        server = molink_netprobe.start_server(0, delay_ms, host='127.0.0.1')
+        servers.append(server)
+        return server.server_address[1]
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def agent_args(port, **overrides):
+    args = dict(control_plane='127.0.0.1', control_plane_port=port, peers=8,
+                throughput_bytes=256 * 1024, control_plane_throughput_bytes=0)
+    args.update(overrides)
+    return types.SimpleNamespace(**args)
+
+def test_measure_peer_rtt_and_throughput(probe_server):
+    port = probe_server(delay_ms=20)
+    result = molink_netprobe.measure_peer('127.0.0.1', port, ping_count=3, throughput_bytes=256 * 1024)
+    assert 20 <= result['rtt_ms'] < 500
+    assert result['mbps'] > 0
+    assert 'mbps' not in molink_netprobe.measure_peer('127.0.0.1', port, ping_count=1, throughput_bytes=0)
+
+def test_oversized_throughput_is_refused(probe_server, monkeypatch):
+    monkeypatch.setattr(molink_netprobe, 'MAX_THROUGHPUT_BYTES', 1024)
+    port = probe_server()
+    with pytest.raises((OSError, ValueError)):
+        molink_netprobe.measure_peer('127.0.0.1', port, ping_count=1, throughput_bytes=1024 * 1024)
+
+# ---- 控制平面 ----
+
+@pytest.fixture
+def backend(backend, monkeypatch):
+    """矩阵容量缩小到 4（含控制平面）"""
+    monkeypatch.setattr(backend, 'net_matrix', backend.NetMatrix(capacity=2, max_nodes=4))
+    return backend
+
+def add_nodes(backend, *nodes):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    for name, ip in nodes:
+        cursor.execute("INSERT INTO node (name, ip) VALUES (%s, %s)", (name, ip))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    backend.node_snapshot.invalidate()
+
+def remove_node(backend, name):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM node WHERE name = %s", (name,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    backend.node_snapshot.invalidate()
+
+def report(client, node, measurements):
+    return client.post('/netprobe/report', data=json.dumps({"node": node, "measurements": measurements}),
+                       content_type='application/json')
+
+def test_report_accepts_only_registered_nodes(backend):
+    add_nodes(backend, ('node-a', '10.0.0.1'), ('node-b', '10.0.0.2'))
+    client = backend.app.test_client()
+
+    resp = report(client, 'intruder', [{"peer": "node-a", "rtt_ms": 1.0}])
+    assert resp.status_code == 404
+    resp = report(client, 'node-a', [
+        {"peer": "node-b", "rtt_ms": 1.5, "mbps": 900},
+        {"peer": "control-plane", "rtt_ms": 0.5},
+        {"peer": "made-up-1", "rtt_ms": 1.0},
+        {"peer": "node-a", "rtt_ms": 1.0},
+    ])
+    assert resp.get_json() == {"status": "ok", "accepted": 2}
+
+    matrix = client.get('/netprobe/matrix').get_json()
+    assert matrix['nodes'] == ['node-a', 'node-b', 'control-plane']
+    assert matrix['rtt_ms'][0] == [None, 1.5, 0.5]
+    assert matrix['mbps'][0] == [None, 900.0, None]
+
+def test_report_drops_malformed_measurements(backend):
+    add_nodes(backend, ('node-a', '10.0.0.1'), ('node-b', '10.0.0.2'))
+    client = backend.app.test_client()
+    resp = report(client, 'node-a', [
+        {"peer": "node-b", "rtt_ms": "fast"},
+        {"peer": "node-b", "mbps": True},
+        {"peer": "node-b", "rtt_ms": float('nan')},
+        {"peer": "node-b", "rtt_ms": -1},
+        {"peer": ["node-b"], "rtt_ms": 1.0},
+        {"peer": 7, "rtt_ms": 1.0},
+        "node-b",
+        {"peer": "node-b", "rtt_ms": 2},
+    ])
+    assert resp.status_code == 200
+    assert resp.get_json()['accepted'] == 1
+    assert client.get('/netprobe/matrix').get_json()['rtt_ms'][0] == [None, 2.0]
+
+    for body in ([], {"node": ["node-a"], "measurements": []}, {"node": "node-a", "measurements": {}}):
+        resp = client.post('/netprobe/report', data=json.dumps(body), content_type='application/json')
+        assert resp.status_code == 400
+
+def test_matrix_is_capped_and_removed_nodes_are_evicted(backend):
+    add_nodes(backend, *[(f'node-{i}', f'10.0.0.{i}') for i in range(5)])
+    client = backend.app.test_client()
+    measurements = [{"peer": f'node-{i}', "rtt_ms": float(i)} for i in range(1, 5)]
+    measurements.append({"peer": "control-plane", "rtt_ms": 0.1})
+
+    # 容量 4：node-0 与前三个对端占满，其余测量被丢弃
+    assert report(client, 'node-0', measurements).get_json()['accepted'] == 3
+    assert backend.net_matrix.snapshot()['nodes'] == ['node-0', 'node-1', 'node-2', 'node-3']
+
+    remove_node(backend, 'node-2')
+    matrix = client.get('/netprobe/matrix').get_json()
+    assert matrix['nodes'] == ['node-0', 'node-1', 'node-3']
+
+    # 空出的下标给新节点使用，且不带有旧节点的测量值
+    assert report(client, 'node-4', [{"peer": "node-3", "rtt_ms": 9.0}]).get_json()['accepted'] == 1
+    matrix = client.get('/netprobe/matrix').get_json()
+    assert matrix['nodes'] == ['node-0', 'node-1', 'node-3', 'node-4']
+    assert matrix['rtt_ms'][0] == [None, 1.0, 3.0, None]
+    assert matrix['rtt_ms'][3] == [None, None, 9.0, None]
+
+def test_sink_requires_bounded_content_length(backend, monkeypatch):
+    monkeypatch.setattr(backend.Config, 'NetProbeSinkMaxBytes', 1024)
+    client = backend.app.test_client()
+    resp = client.post('/netprobe/sink', data=b'\0' * 1024)
+    assert resp.get_json() == {"received": 1024}
+    assert client.post('/netprobe/sink', data=b'\0' * 1025).status_code == 413
+
+@pytest.fixture
+def control_plane(backend):
+    """在回环端口上运行完整的 backend"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, backend.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_port
+    server.shutdown()
+    thread.join()
+
+def test_round_reports_to_control_plane(backend, control_plane, probe_server, monkeypatch):
+    # node-c 的地址上没有测量服务，测量失败不影响其它结果的上报
+    monkeypatch.setattr(backend.Config, 'NetProbePort', probe_server(delay_ms=30))
+    add_nodes(backend, ('node-a', '127.0.0.1'), ('node-b', '127.0.0.1'), ('node-c', '127.0.0.2'))
+    session = LoopbackSession()
+
+    measurements = molink_netprobe.run_round(session, agent_args(control_plane), 'node-a')
+    by_peer = {item['peer']: item for item in measurements}
+    assert set(by_peer) == {'control-plane', 'node-b'}
+    assert 'mbps' not in by_peer['control-plane']
+    assert by_peer['node-b']['rtt_ms'] >= 30
+    assert by_peer['node-b']['mbps'] > 0
+
+    matrix = session.get(f"https://127.0.0.1:{control_plane}/netprobe/matrix").json()
+    row = matrix['rtt_ms'][matrix['nodes'].index('node-a')]
+    assert row[matrix['nodes'].index('node-b')] == by_peer['node-b']['rtt_ms']
+    assert row[matrix['nodes'].index('control-plane')] == by_peer['control-plane']['rtt_ms']
+
+def test_sink_rejects_chunked_upload(backend, control_plane):
+    def chunks():
+        yield b'\0' * 512
+
+    # 没有 Content-Length 时无法限制大小，直接拒绝
+    resp = LoopbackSession().post(f"https://127.0.0.1:{control_plane}/netprobe/sink", data=chunks())
+    assert resp.status_code == 413
+
+def test_control_plane_throughput_is_opt_in(backend, control_plane, probe_server, monkeypatch):
+    monkeypatch.setattr(backend.Config, 'NetProbePort', probe_server())
+    add_nodes(backend, ('node-a', '127.0.0.1'))
+    args = agent_args(control_plane, control_plane_throughput_bytes=512 * 1024)
+    measurements = molink_netprobe.run_round(LoopbackSession(), args, 'node-a')
+    assert measurements[0]['peer'] == 'control-plane'
+    assert measurements[0]['mbps'] > 0
@@ -0,0 +1,193 @@
+# planner.py 在固定的合成集群上的划分结果与输入校验，以及控制平面 /plan 的节点筛选（临时 SQLite 库）
+import itertools
+import random
+
+import pytest
+
+from planner import MAX_LAYERS, PlanError, node_capacity, parse_model, plan_pipeline
+
+MODEL = {
+    "num_layers": 32,
+    "layer_weight_gb": 1,
+    "kv_cache_per_layer_gb": 0,
+    "flops_per_layer_token": 100,
+    "batch_size": 1,
+    "stage_overhead_ms": 2,
+}
+
+def node(name, gpu_type, num_gpu=1, **extra):
+    return dict(name=name, ip=f"10.0.0.{len(name)}", gpu_type=gpu_type, num_gpu=num_gpu, **extra)
+
+def without_timing(plan):
+    return {key: value for key, value in plan.items() if key != 'plan_seconds'}
+
+def check_stages(plan, num_layers):
+    """各段首尾相接、覆盖全部层，瓶颈为最慢的一段"""
+    first = 0
+    for stage in plan['stages']:
+        assert stage['layers'] == [first, first + stage['num_layers']]
+        assert stage['num_layers'] > 0
+        first += stage['num_layers']
+    assert first == num_layers
+    assert plan['bottleneck_ms'] == max(stage['stage_time_ms'] for stage in plan['stages'])
+
+def brute_force_bottleneck(model, nodes):
+    """枚举每个节点承载的层数，返回最小的瓶颈段耗时"""
+    params = parse_model(model)
+    costs = []
+    for n in nodes:
+        tflops, memory_gb, bandwidth = node_capacity(n)
+        layer_ms = max(params['ms_per_tflops'] / tflops, params['layer_mem_gb'] / bandwidth * 1000)
+        max_layers = min(int(memory_gb * params['mem_util'] // params['layer_mem_gb']), params['num_layers'])
+        costs.append((layer_ms, max_layers))
+    best = None
+    for layers in itertools.product(*(range(max_layers + 1) for _, max_layers in costs)):
+        if sum(layers) != params['num_layers']:
+            continue
+        bottleneck = max(params['overhead_ms'] + k * layer_ms for k, (layer_ms, _) in zip(layers, costs) if k)
+        best = bottleneck if best is None else min(best, bottleneck)
+    return round(best, 4)
+
+def test_identical_nodes_split_evenly():
+    nodes = [node(f"a100-{i}", "NVIDIA A100-SXM4-80GB") for i in range(4)]
+    plan = plan_pipeline(MODEL, nodes)
+    check_stages(plan, 32)
+    assert [stage['num_layers'] for stage in plan['stages']] == [8, 8, 8, 8]
+    # 每层 100 GFLOPs / (312 TFLOPS * 0.5) = 0.641 ms，受算力限制
+    assert plan['bottleneck_ms'] == round(2 + 8 * 200 / 312, 4)
+    assert plan['candidate_nodes'] == 4
+
+def test_fast_node_takes_more_layers():
+    nodes = [node("h100", "NVIDIA H100 80GB HBM3"), node("t4", "Tesla T4")]
+    plan = plan_pipeline(MODEL, nodes)
+    check_stages(plan, 32)
+    assert plan['bottleneck_ms'] == brute_force_bottleneck(MODEL, nodes)
+    assert [stage['node'] for stage in plan['stages']] == ["h100", "t4"]
+    assert plan['stages'][0]['num_layers'] > plan['stages'][1]['num_layers']
+
+@pytest.mark.parametrize("cluster", [
+    [node("h100", "H100"), node("a100", "A100"), node("4090", "RTX 4090"), node("t4", "T4")],
+    [node("a100x2", "A100", 2), node("3090", "RTX 3090"), node("3080", "RTX 3080"), node("unknown", "mystery", 2)],
+    [node("l40", "L40"), node("a10", "A10"), node("v100", "V100"), node("4070", "RTX 4070")],
+])
+def test_bottleneck_is_optimal(cluster):
+    # 每层 2.5 GB：24 GB 的卡只放得下 8 层，16 GB 的卡 5 层，显存约束会起作用
+    model = dict(MODEL, num_layers=12, layer_weight_gb=2, kv_cache_per_layer_gb=0.5, flops_per_layer_token=2000)
+    plan = plan_pipeline(model, cluster)
+    check_stages(plan, 12)
+    assert plan['bottleneck_ms'] == brute_force_bottleneck(model, cluster)
+    for stage in plan['stages']:
+        assert stage['memory_gb'] <= stage['memory_capacity_gb'] * 0.9
+
+def test_memory_limit_forces_more_stages():
+    # 单卡只放得下 7 层（8 GB * 0.9 / 1 GB），4 个节点不够，5 个节点各承载 6~7 层
+    nodes = [node(f"n{i}", "RTX 3070") for i in range(5)]
+    with pytest.raises(PlanError):
+        plan_pipeline(MODEL, nodes[:4])
+    plan = plan_pipeline(MODEL, nodes)
+    check_stages(plan, 32)
+    assert sorted(stage['num_layers'] for stage in plan['stages']) == [6, 6, 6, 7, 7]
+    assert plan['bottleneck_ms'] == brute_force_bottleneck(MODEL, nodes)
+
+def test_hw_info_overrides_gpu_type():
+    hw_info = {"gpus": [{"name": "NVIDIA A100-SXM4-40GB", "memory_mb": 40960}]}
+    nodes = [node("a", "NVIDIA A100-SXM4-80GB", hw_info=hw_info)]
+    plan = plan_pipeline(MODEL, nodes)
+    assert plan['stages'][0]['memory_capacity_gb'] == 40
+
+def test_result_independent_of_input_order():
+    nodes = [node(f"{gpu}-{i}", gpu) for i in range(3) for gpu in ("A100", "RTX 4090", "T4", "V100")]
+    model = dict(MODEL, num_layers=80)
+    expected = without_timing(plan_pipeline(model, nodes))
+    check_stages(expected, 80)
+    rng = random.Random(0)
+    for _ in range(10):
+        shuffled = nodes[:]
+        rng.shuffle(shuffled)
+        assert without_timing(plan_pipeline(model, shuffled)) == expected
+
+def test_large_cluster_and_max_layers():
+    gpus = ("A100", "RTX 4090", "T4", "V100", "L40")
+    nodes = [node(f"n{i:04d}", gpus[i % len(gpus)]) for i in range(2000)]
+    model = dict(MODEL, num_layers=MAX_LAYERS, layer_weight_gb=0.5)
+    plan = plan_pipeline(model, nodes)
+    check_stages(plan, MAX_LAYERS)
+
+def test_malformed_nodes_are_skipped():
+    nodes = [
+        node("ok", "A100"),
+        node("bad-memory", "A100", hw_info={"gpus": [{"name": "A100", "memory_mb": "lots"}]}),
+        node("bad-hw-info", "A100", hw_info="x"),
+        node("bad-num-gpu", "A100", num_gpu="2"),
+    ]
+    plan = plan_pipeline(MODEL, nodes)
+    assert plan['candidate_nodes'] == 1
+    assert [stage['node'] for stage in plan['stages']] == ["ok"]
+
+@pytest.mark.parametrize("override", [
+    {"num_layers": None},
+    {"num_layers": "x"},
+    {"num_layers": 0},
+    {"num_layers": MAX_LAYERS + 1},
+    {"num_layers": True},
+    {"num_layers": [32]},
+    {"layer_weight_gb": None},
+    {"layer_weight_gb": float('nan')},
+    {"layer_weight_gb": float('inf')},
+    {"layer_weight_gb": "1e400"},
+    {"batch_size": -1},
+    {"memory_utilization": "x"},
+    {"memory_utilization": 0},
+    {"memory_utilization": 1.5},
+    {"stage_overhead_ms": "slow"},
+    {"stage_overhead_ms": -1},
+    {"kv_cache_per_layer_gb": {"gb": 1}},
+    {"kv_cache_per_layer_gb": -0.5},
+    {"flops_per_layer_token": float('-inf')},
+    {"flops_per_layer_token": 0},
+])
+def test_invalid_model_raises_plan_error(override):
+    model = dict(MODEL)
+    for key, value in override.items():
+        if value is None:
+            del model[key]
+        else:
+            model[key] = value
+    with pytest.raises(PlanError):
+        plan_pipeline(model, [node("a100", "A100")])
+
+def test_kv_cache_from_sequence_length():
+    model = dict(MODEL, kv_bytes_per_token_per_layer="x", max_seq_len=4096)
+    del model['kv_cache_per_layer_gb']
+    with pytest.raises(PlanError):
+        plan_pipeline(model, [node("a100", "A100")])
+    model['kv_bytes_per_token_per_layer'] = 1024 ** 3 / 4096
+    assert parse_model(model)['layer_mem_gb'] == 2
+
+def test_insufficient_memory():
+    with pytest.raises(PlanError, match="insufficient GPU memory"):
+        plan_pipeline(dict(MODEL, layer_weight_gb=10), [node("t4", "T4"), node("3070", "RTX 3070")])
+    with pytest.raises(PlanError, match="insufficient GPU memory"):
+        plan_pipeline(MODEL, [])
+
+@pytest.fixture
+def registered(backend):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    for name, ip in (('node-a', '10.0.0.1'), ('node-b', '10.0.0.2')):
+        cursor.execute("INSERT INTO node (name, ip, num_gpu, gpu_type) VALUES (%s, %s, 1, 'A100')", (name, ip))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return backend.app.test_client()
+
+def test_plan_endpoint_nodes_filter(registered):
+    resp = registered.post('/plan', json={"model": MODEL, "nodes": ["node-b"]})
+    assert resp.status_code == 200
+    assert [stage['node'] for stage in resp.get_json()['stages']] == ['node-b']
+    assert registered.post('/plan', json={"model": MODEL}).status_code == 200
+
+@pytest.mark.parametrize("nodes", [{"node-a": True}, "node-a", ["node-a", 7], [["node-a"]]])
+def test_plan_endpoint_rejects_malformed_nodes(registered, nodes):
+    resp = registered.post('/plan', json={"model": MODEL, "nodes": nodes})
+    assert resp.status_code == 400
@@ -0,0 +1,292 @@
+# molink_prefetch.py 对回环地址上的 HTTP/FTP 替身服务器下载、续传、校验与缓存
+import email.utils
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import molink_prefetch
+
+class Files:
+    """替身服务器共享的文件表与请求记录"""
+
+    def __init__(self):
+        self.content = {}
+        self.mtime = {}
+        self.requests = []
+        self.truncate_once = set()  # 第一次 GET 只发送一半后断开
+
+    def put(self, name, data, mtime=1700000000):
+        self.content[name] = data
+        self.mtime[name] = mtime
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+@pytest.fixture
+def files():
+    return Files()
+
+@pytest.fixture
+def http_server(files):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _lookup(self):
+            name = self.path.rsplit('/', 1)[-1]
+            if name not in files.content:
+                self.send_error(404)
+                return None, None
+            return name, files.content[name]
+
+        def _headers(self, name, status, length, extra=None):
+            self.send_response(status)
+            self.send_header('Content-Length', str(length))
+            self.send_header('Last-Modified', email.utils.formatdate(files.mtime[name], usegmt=True))
+            for key, value in (extra or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+
+        def do_HEAD(self):
+            files.requests.append(('HEAD', self.path, None))
+            name, data = self._lookup()
+            if name is not None:
+                self._headers(name, 200, len(data))
+
+        def do_GET(self):
+            byte_range = self.headers.get('Range')
+            files.requests.append(('GET', self.path, byte_range))
+            name, data = self._lookup()
+            if name is None:
+                return
+            start = int(byte_range[len('bytes='):].split('-')[0]) if byte_range else 0
+            if start >= len(data) and byte_range:
+                self.send_error(416)
+                return
+            if byte_range:
+                self._headers(name, 206, len(data) - start,
+                              {'Content-Range': f"bytes {start}-{len(data) - 1}/{len(data)}"})
+            else:
+                self._headers(name, 200, len(data))
+            body = data[start:]
+            if name in files.truncate_once:
+                files.truncate_once.discard(name)
+                self.wfile.write(body[:len(body) // 2])
+                self.wfile.flush()
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/share"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def ftp_server(files):
+    """只实现 ftplib 下载用到的命令：USER/PASS/TYPE/SIZE/MDTM/PASV/REST/RETR/QUIT"""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def reply(self, line):
+            self.wfile.write((line + '\r\n').encode())
+
+        def handle(self):
+            self.reply('220 molink test ftp')
+            rest = 0
+            data_listener = None
+            while True:
+                line = self.rfile.readline().decode().strip()
+                if not line:
+                    return
+                command, _, arg = line.partition(' ')
+                command = command.upper()
+                name = arg.rsplit('/', 1)[-1]
+                files.requests.append((command, arg, rest if command == 'RETR' else None))
+                if command == 'USER':
+                    self.reply('331 password required')
+                elif command == 'PASS':
+                    self.reply('230 logged in')
+                elif command == 'TYPE':
+                    self.reply('200 ok')
+                elif command in ('SIZE', 'MDTM', 'RETR') and name not in files.content:
+                    self.reply('550 not found')
+                elif command == 'SIZE':
+                    self.reply(f"213 {len(files.content[name])}")
+                elif command == 'MDTM':
+                    self.reply('213 ' + time.strftime('%Y%m%d%H%M%S', time.gmtime(files.mtime[name])))
+                elif command == 'PASV':
+                    data_listener = socket.create_server(('127.0.0.1', 0))
+                    port = data_listener.getsockname()[1]
+                    self.reply(f"227 Entering Passive Mode (127,0,0,1,{port >> 8},{port & 0xff})")
+                elif command == 'REST':
+                    rest = int(arg)
+                    self.reply('350 restarting')
+                elif command == 'RETR':
+                    self.reply('150 opening data connection')
+                    conn, _ = data_listener.accept()
+                    with conn:
+                        conn.sendall(files.content[name][rest:])
+                    data_listener.close()
+                    rest = 0
+                    self.reply('226 transfer complete')
+                elif command == 'QUIT':
+                    self.reply('221 bye')
+                    return
+                else:
+                    self.reply('502 not implemented')
+
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f"ftp://127.0.0.1:{server.server_address[1]}/share"
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(molink_prefetch, 'RETRIES', 2)
+    monkeypatch.setattr(molink_prefetch.time, 'sleep', lambda seconds: None)
+
+def gets(files, name):
+    return [entry for entry in files.requests if entry[0] in ('GET', 'RETR') and entry[1].endswith(name)]
+
+def test_http_download_verifies_digest_and_hits_cache(files, http_server, tmp_path):
+    data = os.urandom(300000)
+    files.put('cni.tar', data)
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+    archive = {"name": "cni.tar", "sha256": sha256(data)}
+
+    path = molink_prefetch.fetch_archive(cache, http_server, archive, 5, False)
+    assert open(path, 'rb').read() == data
+    assert os.path.basename(path) == sha256(data)
+
+    assert molink_prefetch.fetch_archive(cache, http_server, archive, 5, False) == path
+    assert len(gets(files, 'cni.tar')) == 1
+
+def test_http_resumes_interrupted_download(files, http_server, tmp_path):
+    data = os.urandom(400000)
+    files.put('node.tar', data)
+    files.truncate_once.add('node.tar')
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+
+    path = molink_prefetch.fetch_archive(cache, http_server, {"name": "node.tar", "sha256": sha256(data)}, 5, False)
+    assert open(path, 'rb').read() == data
+    first, second = gets(files, 'node.tar')
+    assert first[2] is None
+    assert second[2] == f"bytes={len(data) // 2}-"
+
+def test_digest_mismatch_is_an_error(files, http_server, tmp_path):
+    files.put('cni.tar', b'corrupted')
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+
+    with pytest.raises(RuntimeError):
+        molink_prefetch.fetch_archive(cache, http_server, {"name": "cni.tar", "sha256": sha256(b'original')}, 5, False)
+    assert os.listdir(cache.blob_dir) == []
+
+def test_sha256_sidecar_is_used_when_manifest_has_no_digest(files, http_server, tmp_path):
+    data = b'archive with sidecar'
+    files.put('cni.tar', data)
+    files.put('cni.tar.sha256', f"{sha256(data)}  cni.tar\n".encode())
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+
+    path = molink_prefetch.fetch_archive(cache, http_server, {"name": "cni.tar"}, 5, False)
+    assert os.path.basename(path) == sha256(data)
+
+def test_republished_archive_without_digest_is_refetched(files, http_server, tmp_path):
+    files.put('node.tar', b'version 1', mtime=1700000000)
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+
+    first = molink_prefetch.fetch_archive(cache, http_server, {"name": "node.tar"}, 5, False)
+    assert molink_prefetch.fetch_archive(cache, http_server, {"name": "node.tar"}, 5, False) == first
+    assert len(gets(files, 'node.tar')) == 1
+
+    files.put('node.tar', b'version 2', mtime=1700003600)
+    second = molink_prefetch.fetch_archive(cache, http_server, {"name": "node.tar"}, 5, False)
+    assert open(second, 'rb').read() == b'version 2'
+    assert len(gets(files, 'node.tar')) == 2
+
+def test_stale_partial_download_is_discarded(files, http_server, tmp_path):
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+    with open(cache.partial_path('node.tar'), 'wb') as f:
+        f.write(b'old version prefix')
+    with open(cache.partial_path('node.tar') + '.meta', 'w') as f:
+        json.dump({"size": 100, "mtime": "Tue, 14 Nov 2023 22:13:20 GMT"}, f)
+    files.put('node.tar', b'new version', mtime=1700003600)
+
+    path = molink_prefetch.fetch_archive(cache, http_server, {"name": "node.tar"}, 5, False)
+    assert open(path, 'rb').read() == b'new version'
+    assert gets(files, 'node.tar')[0][2] is None
+
+def test_ftp_download_and_resume(files, ftp_server, tmp_path):
+    data = os.urandom(200000)
+    files.put('molink.tar', data)
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+    with open(cache.partial_path('molink.tar'), 'wb') as f:
+        f.write(data[:50000])
+
+    path = molink_prefetch.fetch_archive(cache, ftp_server, {"name": "molink.tar", "sha256": sha256(data)}, 5, False)
+    assert open(path, 'rb').read() == data
+    assert gets(files, 'molink.tar') == [('RETR', 'share/molink.tar', 50000)]
+
+def test_ftp_republished_archive_without_digest_is_refetched(files, ftp_server, tmp_path):
+    files.put('molink.tar', b'version 1', mtime=1700000000)
+    cache = molink_prefetch.ImageCache(str(tmp_path))
+    molink_prefetch.fetch_archive(cache, ftp_server, {"name": "molink.tar"}, 5, False)
+    molink_prefetch.fetch_archive(cache, ftp_server, {"name": "molink.tar"}, 5, False)
+    assert len(gets(files, 'molink.tar')) == 1
+
+    files.put('molink.tar', b'version 2', mtime=1700003600)
+    path = molink_prefetch.fetch_archive(cache, ftp_server, {"name": "molink.tar"}, 5, False)
+    assert open(path, 'rb').read() == b'version 2'
+
+def write_ctr(bin_dir, body):
+    path = bin_dir / 'ctr'
+    path.write_text('#!/bin/sh\n' + body + '\n')
+    path.chmod(0o755)
+
+def manifest(base_url, data):
+    return {"base_url": base_url, "archives": [{"name": "cni.tar", "sha256": sha256(data)}], "images": ["pause:3.9"]}
+
+def test_prefetch_imports_and_pulls(files, http_server, tmp_path, monkeypatch):
+    data = b'image archive'
+    files.put('cni.tar', data)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    calls = tmp_path / 'calls'
+    write_ctr(bin_dir, f'printf "%s\\n" "$*" >> {calls}')
+    monkeypatch.setenv('PATH', str(bin_dir))
+
+    errors = molink_prefetch.prefetch(manifest(http_server, data), str(tmp_path / 'cache'))
+    assert errors == []
+    lines = sorted(calls.read_text().splitlines())
+    assert lines[0].startswith('-n k8s.io images import ') and lines[0].endswith(sha256(data))
+    assert lines[1] == '-n k8s.io images pull pause:3.9'
+
+def test_prefetch_reports_missing_ctr(files, http_server, tmp_path, monkeypatch):
+    data = b'image archive'
+    files.put('cni.tar', data)
+    monkeypatch.setenv('PATH', str(tmp_path / 'empty'))
+
+    errors = molink_prefetch.prefetch(manifest(http_server, data), str(tmp_path / 'cache'))
+    assert len(errors) == 2
+    assert any(error.startswith('镜像导入失败: cni.tar') for error in errors)
+    assert any(error.startswith('镜像拉取失败: pause:3.9') for error in errors)
+
+def test_prefetch_reports_failing_ctr(files, http_server, tmp_path, monkeypatch):
+    data = b'image archive'
+    files.put('cni.tar', data)
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    write_ctr(bin_dir, 'echo "ctr: broken" >&2; exit 1')
+    monkeypatch.setenv('PATH', str(bin_dir))
+
+    errors = molink_prefetch.prefetch(manifest(http_server, data), str(tmp_path / 'cache'))
+    assert sorted(errors) == ['镜像导入失败: cni.tar: ctr: broken', '镜像拉取失败: pause:3.9: ctr: broken']
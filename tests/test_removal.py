@@ -0,0 +1,194 @@
+# 节点移除任务：/k8s_delete、/k8s_delete_batch 与 /k8s_jobs/<id>（kubectl 用桩代替，临时 SQLite 库）
+import subprocess
+import threading
+import time
+
+import pytest
+
+class FakeKubectl:
+    """记录 kubectl 调用；failures[(动词, 节点)] 为依次抛出的异常，gates[(动词, 节点)] 阻塞到被放行"""
+
+    def __init__(self):
+        self.calls = []
+        self.failures = {}
+        self.gates = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, cmd, **kwargs):
+        assert cmd[0] == 'kubectl'
+        verb = cmd[1]
+        node = cmd[3] if verb == 'delete' else cmd[2]
+        with self.lock:
+            self.calls.append(cmd[1:])
+            pending = self.failures.get((verb, node))
+            error = pending.pop(0) if pending else None
+        gate = self.gates.get((verb, node))
+        if gate is not None:
+            assert gate.wait(5)
+        if error is not None:
+            raise error
+        stdout = f'node/{node} deleted' if verb == 'delete' else f'node/{node} {verb}ed'
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr='')
+
+    def fail(self, verb, node, *errors):
+        self.failures[(verb, node)] = list(errors)
+
+    def commands(self, node):
+        with self.lock:
+            return [call[:1] if call[0] != 'delete' else call[:2] for call in self.calls if node in call]
+
+def kubectl_error(stderr):
+    return subprocess.CalledProcessError(1, ['kubectl'], output='', stderr=stderr)
+
+@pytest.fixture
+def kubectl(backend, monkeypatch):
+    fake = FakeKubectl()
+    monkeypatch.setattr(backend, 'run_subprocess', fake)
+    monkeypatch.setattr(backend, 'removal_jobs', backend.RemovalJobs(workers=4, retries=2, drain_timeout=5))
+    # 重试退避缩短到毫秒级
+    sleep = time.sleep
+    monkeypatch.setattr(backend.time, 'sleep', lambda seconds: sleep(min(seconds, 0.01)))
+    return fake
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+def add_node(backend, user_id, name, ip):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO node (name, ip, user_id) VALUES (%s, %s, %s)", (name, ip, user_id))
+    conn.commit()
+    cursor.close()
+    conn.close()
+    backend.update_service_discovery(ip, 'node_exporters')
+
+def node_exists(backend, name):
+    conn = backend.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM node WHERE name = %s", (name,))
+    count = cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
+    return count > 0
+
+def targets(backend):
+    return backend.service_discovery['node_exporters'].snapshot()[1].decode()
+
+def wait_for_job(client, job_id, states=('succeeded', 'failed'), timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/k8s_jobs/{job_id}').get_json()
+        if job['state'] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} still {job['state']}")
+
+def delete(client, name, username='alice'):
+    return client.post('/k8s_delete', json={"node_name": name, "username": username, "user_password": f"{username}-pw"})
+
+def test_delete_job_lifecycle(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    drain = kubectl.gates[('drain', 'node-a')] = threading.Event()
+
+    resp = delete(client, 'Node-A')
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body['job']['state'] == 'queued' and body['job']['requested_by'] == 'alice'
+
+    # 排空进行中可以查询进度；同一节点的重复请求返回同一个任务
+    job = wait_for_job(client, body['job_id'], states=('draining',))
+    assert [step['message'] for step in job['steps']] == ["节点已设置为不可调度"]
+    assert delete(client, 'node-a').get_json()['job_id'] == body['job_id']
+    assert node_exists(backend, 'node-a')
+
+    drain.set()
+    job = wait_for_job(client, body['job_id'])
+    assert job['state'] == 'succeeded' and job['attempts'] == 1 and job['error'] is None
+    assert kubectl.commands('node-a') == [['cordon'], ['drain'], ['delete', 'node']]
+    assert kubectl.calls[1] == ['drain', 'node-a', '--ignore-daemonsets', '--delete-emptydir-data', '--timeout=5s']
+    assert kubectl.calls[2] == ['delete', 'node', 'node-a', '--ignore-not-found=true']
+    assert not node_exists(backend, 'Node-A')
+    assert '10.0.0.1' not in targets(backend)
+
+    # 任务结束后可以再次提交
+    assert delete(client, 'node-a').get_json()['job_id'] != body['job_id']
+
+def test_drain_failure_still_deletes(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    kubectl.fail('drain', 'node-a', kubectl_error("error: cannot evict pod"))
+    job = wait_for_job(client, delete(client, 'node-a').get_json()['job_id'])
+    assert job['state'] == 'succeeded'
+    assert any("cannot evict pod" in step['message'] for step in job['steps'])
+    assert kubectl.commands('node-a') == [['cordon'], ['drain'], ['delete', 'node']]
+    assert not node_exists(backend, 'node-a')
+
+def test_node_missing_from_cluster(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    kubectl.fail('cordon', 'node-a', kubectl_error('Error from server (NotFound): nodes "node-a" not found'))
+    job = wait_for_job(client, delete(client, 'node-a').get_json()['job_id'])
+    assert job['state'] == 'succeeded'
+    # 集群中没有该节点：跳过排空与删除，只清理数据库记录
+    assert kubectl.commands('node-a') == [['cordon']]
+    assert not node_exists(backend, 'node-a')
+
+def test_transient_failure_is_retried_from_failed_step(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    kubectl.fail('delete', 'node-a', kubectl_error("connection refused"))
+    job = wait_for_job(client, delete(client, 'node-a').get_json()['job_id'])
+    assert job['state'] == 'succeeded' and job['attempts'] == 2
+    assert any("connection refused" in step['message'] for step in job['steps'])
+    # 已完成的 cordon/drain 不重复执行
+    assert kubectl.commands('node-a') == [['cordon'], ['drain'], ['delete', 'node'], ['delete', 'node']]
+
+def test_job_fails_after_retries(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    kubectl.fail('cordon', 'node-a', *[kubectl_error("the server is currently unable to handle the request")] * 3)
+    job = wait_for_job(client, delete(client, 'node-a').get_json()['job_id'])
+    assert job['state'] == 'failed' and job['attempts'] == 3
+    assert job['error'] == "the server is currently unable to handle the request"
+    assert kubectl.commands('node-a') == [['cordon']] * 3
+    assert node_exists(backend, 'node-a')
+
+def test_delete_requires_credentials(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    resp = client.post('/k8s_delete', json={"node_name": "node-a", "username": "alice", "user_password": "wrong"})
+    assert resp.status_code == 401
+    assert client.post('/k8s_delete', json={"node_name": "node_a!", "username": "alice",
+                                            "user_password": "alice-pw"}).status_code == 400
+    assert kubectl.calls == []
+    assert client.get('/k8s_jobs/unknown').status_code == 404
+
+def test_batch_partial_failure(backend, users, kubectl, client):
+    add_node(backend, users['alice'], 'node-a', '10.0.0.1')
+    add_node(backend, users['alice'], 'node-b', '10.0.0.2')
+    kubectl.fail('delete', 'node-b', *[kubectl_error("etcdserver: request timed out")] * 3)
+    resp = client.post('/k8s_delete_batch', json={
+        "node_names": ["node-a", "node-b", "bad_name!", 7],
+        "username": "alice",
+        "user_password": "alice-pw",
+    })
+    assert resp.status_code == 202
+    jobs = resp.get_json()['jobs']
+    assert jobs['bad_name!'] == {"error": "无效的节点名称"}
+    assert jobs['7'] == {"error": "无效的节点名称"}
+
+    done = {name: wait_for_job(client, jobs[name]['job_id']) for name in ('node-a', 'node-b')}
+    assert done['node-a']['state'] == 'succeeded'
+    assert done['node-b']['state'] == 'failed'
+    assert done['node-b']['error'] == "etcdserver: request timed out"
+    assert not node_exists(backend, 'node-a') and node_exists(backend, 'node-b')
+    assert '10.0.0.1' not in targets(backend) and '10.0.0.2' in targets(backend)
+    # 每个节点都按 cordon -> drain -> delete 的顺序执行
+    assert kubectl.commands('node-a') == [['cordon'], ['drain'], ['delete', 'node']]
+    assert kubectl.commands('node-b') == [['cordon'], ['drain']] + [['delete', 'node']] * 3
+
+def test_batch_validation(backend, users, kubectl, client, monkeypatch):
+    monkeypatch.setattr(backend.Config, 'MaxBatchSize', 2)
+    auth = {"username": "alice", "user_password": "alice-pw"}
+    assert client.post('/k8s_delete_batch', json=dict(auth, node_names=[])).status_code == 400
+    assert client.post('/k8s_delete_batch', json=dict(auth, node_names="node-a")).status_code == 400
+    assert client.post('/k8s_delete_batch', json=dict(auth, node_names=['a', 'b', 'c'])).status_code == 413
+    assert client.post('/k8s_delete_batch', json={"node_names": ["node-a"], "username": "alice",
+                                                  "user_password": "wrong"}).status_code == 401
+    assert kubectl.calls == []
@@ -0,0 +1,172 @@
+# Prometheus 服务发现注册表：原子写入、去重、旧 IP 清理与 /sd/<type>（服务发现目录指向 tmp_path）
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def registry(backend, tmp_path):
+    def make(name='node_exporters', port=9100, **kwargs):
+        kwargs.setdefault('debounce', 0.01)
+        return backend.ServiceDiscoveryRegistry(name, str(tmp_path / 'sd' / f'{name}.json'), port, **kwargs)
+    return make
+
+def read(registry):
+    with open(registry.json_file) as f:
+        return json.load(f)
+
+def targets(registry):
+    return [target for group in json.loads(registry.snapshot()[1]) for target in group['targets']]
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_flush_replaces_file_atomically(registry, tmp_path):
+    sd = registry()
+    sd.add(['10.0.0.1'])
+    sd.flush()
+    assert read(sd) == [{"targets": ["10.0.0.1:9100"]}]
+    inode = os.stat(sd.json_file).st_ino
+
+    sd.add(['10.0.0.2'])
+    sd.flush()
+    assert read(sd) == [{"targets": ["10.0.0.1:9100", "10.0.0.2:9100"]}]
+    # 新内容写入临时文件后整体替换，读取方不会看到写了一半的文件
+    assert os.stat(sd.json_file).st_ino != inode
+    assert stat.S_IMODE(os.stat(sd.json_file).st_mode) == 0o644
+    assert os.listdir(tmp_path / 'sd') == ['node_exporters.json']
+
+def test_failed_write_keeps_old_file(backend, registry, tmp_path, monkeypatch):
+    sd = registry()
+    sd.add(['10.0.0.1'])
+    sd.flush()
+
+    replace = os.replace
+
+    def broken_replace(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(backend.os, 'replace', broken_replace)
+    sd.add(['10.0.0.2'])
+    with pytest.raises(OSError):
+        sd.flush()
+    assert read(sd) == [{"targets": ["10.0.0.1:9100"]}]
+    assert os.listdir(tmp_path / 'sd') == ['node_exporters.json']
+
+    # 失败的版本不算已写入，恢复后再次写入
+    monkeypatch.setattr(backend.os, 'replace', replace)
+    sd.flush()
+    assert read(sd) == [{"targets": ["10.0.0.1:9100", "10.0.0.2:9100"]}]
+
+def test_background_writer_batches_changes(backend, registry, monkeypatch):
+    writes = []
+    replace = os.replace
+
+    def counting_replace(src, dst):
+        writes.append(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(backend.os, 'replace', counting_replace)
+    sd = registry(debounce=0.2)
+    threads = [threading.Thread(target=sd.add, args=([f'10.0.1.{i}'],)) for i in range(50)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert wait_for(lambda: sd.json_file.exists() and len(read(sd)[0]['targets']) == 50)
+    # 去抖时间内的 50 次变更合并为一两次写入
+    assert len(writes) <= 2
+
+def test_targets_are_deduplicated(registry):
+    sd = registry()
+    assert sd.add(['10.0.0.1', ' 10.0.0.1 ', '10.0.0.2', '10.0.0.1']) == ['10.0.0.1:9100', '10.0.0.2:9100']
+    assert sd.add(['10.0.0.2']) == []
+    etag = sd.snapshot()[0]
+    # 没有变化时不重新序列化，ETag 不变
+    assert sd.snapshot()[0] == etag
+    assert targets(sd) == ['10.0.0.1:9100', '10.0.0.2:9100']
+    assert sd.remove(['10.0.0.9']) == []
+    assert sd.snapshot()[0] == etag
+
+def test_existing_file_is_loaded_once(registry):
+    sd = registry(labels={"__scheme__": "https"})
+    sd.json_file.parent.mkdir(parents=True)
+    sd.json_file.write_text(json.dumps([
+        {"targets": ["10.0.0.1:9100"], "labels": {"job": "node"}},
+        {"targets": ["10.0.0.2:9100", "10.0.0.3:9100"]},
+    ]))
+    # 其它目标组中已有的目标不重复添加，删除时从所在的组移除
+    assert sd.add(['10.0.0.3', '10.0.0.4']) == ['10.0.0.4:9100']
+    assert sd.remove(['10.0.0.2']) == ['10.0.0.2:9100']
+    sd.flush()
+    assert read(sd) == [
+        {"targets": ["10.0.0.1:9100", "10.0.0.4:9100"], "labels": {"job": "node"}},
+        {"targets": ["10.0.0.3:9100"]},
+    ]
+    # 之后对文件的手工修改不会被重新读取
+    sd.json_file.write_text('[]')
+    assert targets(sd) == ["10.0.0.1:9100", "10.0.0.4:9100", "10.0.0.3:9100"]
+
+@pytest.mark.parametrize("content", ['not json', '{"targets": []}', '[1, 2]'])
+def test_malformed_file_is_replaced(registry, content):
+    sd = registry(labels={"__scheme__": "https"})
+    sd.json_file.parent.mkdir(parents=True)
+    sd.json_file.write_text(content)
+    assert sd.add(['10.0.0.1']) == ['10.0.0.1:9100']
+    sd.flush()
+    assert read(sd) == [{"targets": ["10.0.0.1:9100"], "labels": {"__scheme__": "https"}}]
+
+def test_stale_ips(backend):
+    previous = {"node-a": "10.0.0.1", "node-b": "10.0.0.2", "node-c": None}
+    infos = [
+        {"name": "NODE-A", "ip": "10.0.0.11"},
+        {"name": "node-b", "ip": "10.0.0.2"},
+        {"name": "node-c", "ip": "10.0.0.3"},
+        {"name": "node-d", "ip": "10.0.0.4"},
+        {"ip": "10.0.0.5"},
+    ]
+    # 只有 IP 发生变化的已登记节点需要清理旧目标
+    assert backend.stale_ips(previous, infos) == ["10.0.0.1"]
+
+def test_remove_service_discovery_covers_every_registry(backend):
+    for name in ('node_exporters', 'dcgm'):
+        backend.update_service_discovery(['10.0.0.1', '10.0.0.2'], name)
+    backend.remove_service_discovery('10.0.0.1')
+    assert targets(backend.service_discovery['node_exporters']) == ['10.0.0.2:9100']
+    assert targets(backend.service_discovery['dcgm']) == ['10.0.0.2:9400']
+
+def test_rejoin_with_new_ip_drops_old_targets(backend, users):
+    client = backend.app.test_client()
+    for ip in ('10.0.0.1', '10.0.0.2'):
+        resp = client.post('/k8s_complete', json={
+            "hardware_info": {"name": "node-a", "ip": ip},
+            "session_token": backend.issue_session_token('alice', users['alice'], 'node-a'),
+        })
+        assert resp.status_code == 200
+    assert targets(backend.service_discovery['node_exporters']) == ['10.0.0.2:9100']
+    assert targets(backend.service_discovery['dcgm']) == ['10.0.0.2:9400']
+
+    # 后台线程最终把同样的内容写入文件
+    sd = backend.service_discovery['dcgm']
+    assert wait_for(lambda: sd.json_file.exists() and read(sd) == [{"targets": ['10.0.0.2:9400']}])
+
+def test_http_sd_endpoint(backend):
+    client = backend.app.test_client()
+    backend.update_service_discovery('10.0.0.1', 'node_exporters')
+    resp = client.get('/sd/node_exporters')
+    assert resp.get_json() == [{"targets": ["10.0.0.1:9100"]}]
+    etag = resp.headers['ETag']
+    assert client.get('/sd/node_exporters', headers={'If-None-Match': etag}).status_code == 304
+
+    backend.update_service_discovery('10.0.0.2', 'node_exporters')
+    resp = client.get('/sd/node_exporters', headers={'If-None-Match': etag})
+    assert resp.status_code == 200 and resp.headers['ETag'] != etag
+    assert client.get('/sd/unknown').status_code == 404
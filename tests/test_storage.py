@@ -0,0 +1,233 @@
+# storage.py：ConnectionPool 的排队、上限、超时、回收与后台补足（假连接），以及 SQLite 上的 MIGRATIONS
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import storage
+from storage import ConnectionPool, PoolTimeout, SQLiteStorage
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+        self.in_transaction = False
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+def ping(conn):
+    if not conn.alive:
+        raise OSError("server has gone away")
+
+@pytest.fixture
+def make_pool():
+    """默认不做 ping、不过期、后台线程实际上不运行"""
+    connections = []
+
+    def connect():
+        connections.append(FakeConnection(len(connections)))
+        return connections[-1]
+
+    def make(**kwargs):
+        options = dict(max_idle=0, max_open=1, max_lifetime=0, timeout=1.0, ping_after=3600,
+                       maintain_interval=3600)
+        options.update(kwargs)
+        pool = ConnectionPool(connect, ping, **options)
+        pool.connections = connections
+        return pool
+
+    return make
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_waiters_are_served_in_order(make_pool):
+    pool = make_pool(max_open=1)
+    held = pool.connect()
+    order = []
+
+    def borrow(index):
+        conn = pool.connect(timeout=5)
+        order.append((index, conn.number))
+        conn.close()
+
+    threads = []
+    for index in range(4):
+        threads.append(threading.Thread(target=borrow, args=(index,)))
+        threads[-1].start()
+        # 确认已经排上队再启动下一个
+        assert wait_for(lambda: pool.stats()['waiting'] == index + 1)
+    held.close()
+    for thread in threads:
+        thread.join(5)
+    # 归还的连接按排队顺序直接交接，不新建连接
+    assert order == [(index, 0) for index in range(4)]
+    assert pool.stats()['created'] == 1
+    assert pool.stats()['waits'] == 4
+
+def test_max_open_limit(make_pool):
+    pool = make_pool(max_open=2)
+    first, second = pool.connect(), pool.connect()
+    with pytest.raises(PoolTimeout):
+        pool.connect(timeout=0.05)
+    stats = pool.stats()
+    assert (stats['open'], stats['in_use'], stats['created'], stats['timeouts']) == (2, 2, 2, 1)
+    assert stats['utilization'] == 1
+
+    # 归还后名额可再次使用；max_idle 为 0 时连接直接关闭
+    first.close()
+    assert pool.connections[0].closed
+    third = pool.connect(timeout=0.05)
+    assert third.number == 2
+    second.close()
+    third.close()
+    assert pool.stats()['open'] == 0
+
+def test_timed_out_waiter_leaves_the_queue(make_pool):
+    pool = make_pool(max_open=1, max_idle=1)
+    held = pool.connect()
+    start = time.monotonic()
+    with pytest.raises(PoolTimeout):
+        pool.connect(timeout=0.1)
+    assert time.monotonic() - start >= 0.1
+    assert pool.stats()['waiting'] == 0
+
+    # 超时的等待者不会拿走随后归还的连接
+    held.close()
+    assert pool.stats()['idle'] == 1
+    conn = pool.connect(timeout=0.05)
+    assert conn.number == 0
+    conn.close()
+
+def test_expired_connection_is_recycled(make_pool):
+    pool = make_pool(max_open=1, max_idle=1, max_lifetime=0.1)
+    conn = pool.connect()
+    conn.close()
+    assert pool.stats()['idle'] == 1
+    time.sleep(0.15)
+    # 空闲中过期：借出时关闭并沿用名额新建
+    conn = pool.connect()
+    assert conn.number == 1 and pool.connections[0].closed
+    time.sleep(0.15)
+    # 借出期间过期：归还时关闭，不放回空闲列表
+    conn.close()
+    assert pool.connections[1].closed
+    stats = pool.stats()
+    assert (stats['recycled'], stats['open'], stats['idle']) == (2, 0, 0)
+
+def test_failed_health_check_evicts_connection(make_pool):
+    pool = make_pool(max_open=1, max_idle=1, ping_after=0)
+    conn = pool.connect()
+    conn.close()
+    pool.connections[0].alive = False
+    conn = pool.connect()
+    assert conn.number == 1 and pool.connections[0].closed
+    assert pool.stats()['discarded'] == 1
+    conn.close()
+
+    # 存活的连接通过检查后照常复用
+    conn = pool.connect()
+    assert conn.number == 1
+    conn.close()
+    assert pool.stats()['created'] == 2
+
+def test_rollback_failure_discards_connection(make_pool):
+    pool = make_pool(max_open=1, max_idle=1)
+    conn = pool.connect()
+
+    def broken_rollback():
+        raise OSError("lost connection")
+
+    pool.connections[0].in_transaction = True
+    pool.connections[0].rollback = broken_rollback
+    conn.close()
+    assert pool.connections[0].closed
+    stats = pool.stats()
+    assert (stats['discarded'], stats['open'], stats['idle']) == (1, 0, 0)
+
+def test_maintainer_fills_idle_and_recycles_expired(make_pool):
+    pool = make_pool(max_open=4, max_idle=2, max_lifetime=0.2, maintain_interval=0.02)
+    assert wait_for(lambda: pool.stats()['idle'] == 2)
+    first = list(pool.connections[:2])
+    # 空闲连接过期后由后台线程关闭并补足
+    assert wait_for(lambda: all(conn.closed for conn in first) and pool.stats()['idle'] == 2)
+    stats = pool.stats()
+    assert stats['recycled'] >= 2 and stats['open'] == 2
+
+def test_maintainer_releases_slots_when_connect_fails():
+    failures = []
+
+    def connect():
+        failures.append(1)
+        raise OSError("database is down")
+
+    pool = ConnectionPool(connect, ping, max_idle=2, max_open=2, max_lifetime=0, maintain_interval=0.02)
+    assert wait_for(lambda: pool.stats()['connect_failures'] >= 2)
+    assert pool.stats()['open'] == 0
+    with pytest.raises(OSError):
+        pool.connect(timeout=0.05)
+    assert pool.stats()['open'] == 0
+
+# ---- SQLite 与迁移 ----
+
+def applied_versions(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT version FROM schema_version ORDER BY version")
+    versions = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return versions
+
+def test_migrations_on_fresh_sqlite(tmp_path):
+    db = SQLiteStorage(str(tmp_path / 'db' / 'molink.sqlite'))
+    conn = db.connect()
+    assert applied_versions(conn) == [version for version, _, _ in storage.MIGRATIONS] == [1, 2, 3, 4]
+    assert storage.schema_version(conn) == storage.SCHEMA_VERSION
+    assert storage.migrate(db) == []
+
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", ('alice', 'x'))
+    cursor.execute("INSERT INTO node (name, ip, hw_info) VALUES (%s, %s, %s)", ('node-a', '10.0.0.1', '{}'))
+    cursor.execute("INSERT INTO join_failure (node_name, reported_at) VALUES (%s, %s)", ('node-a', 1.0))
+    # 节点名与用户名唯一（不区分大小写）
+    with pytest.raises(sqlite3.IntegrityError):
+        cursor.execute("INSERT INTO node (name) VALUES (%s)", ('NODE-A',))
+    with pytest.raises(sqlite3.IntegrityError):
+        cursor.execute("INSERT INTO users (username, password) VALUES (%s, %s)", ('Alice', 'y'))
+    cursor.execute("SELECT name, hw_info FROM node")
+    assert cursor.fetchall() == [{"name": "node-a", "hw_info": "{}"}]
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def test_migrations_upgrade_legacy_sqlite(tmp_path):
+    # 没有 schema_version、没有 hw_info 列且节点重名的旧库
+    path = str(tmp_path / 'legacy.sqlite')
+    legacy = sqlite3.connect(path)
+    legacy.executescript("""
+        CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, password TEXT NOT NULL);
+        CREATE TABLE node (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, ip TEXT, type INTEGER,
+                           status INTEGER, user_id INTEGER, num_cpu INTEGER, size_mem REAL, num_gpu INTEGER,
+                           gpu_type TEXT);
+        INSERT INTO node (name, ip) VALUES ('node-a', '10.0.0.1'), ('node-a', '10.0.0.2'), ('node-b', '10.0.0.3');
+    """)
+    legacy.commit()
+    legacy.close()
+
+    conn = SQLiteStorage(path).connect()
+    assert applied_versions(conn) == [1, 2, 3, 4]
+    cursor = conn.cursor()
+    cursor.execute("SELECT name, ip, hw_info FROM node ORDER BY name")
+    # 重名节点保留最近一次加入的记录
+    assert cursor.fetchall() == [('node-a', '10.0.0.2', None), ('node-b', '10.0.0.3', None)]
+    cursor.close()
@@ -0,0 +1,147 @@
+# KubeadmTokenCache：后台按 TTL 刷新、过期 token、未命中时的按需刷新与并发 single-flight（kubeadm 用桩代替）
+import json
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+TOKEN_A = 'abcdef.0123456789abcdef'
+TOKEN_B = 'bcdefg.0123456789abcdef'
+
+class FakeKubeadm:
+    """`kubeadm token list -o json` 的桩：tokens 为 {token: expires}，记录调用次数"""
+
+    def __init__(self):
+        self.tokens = {TOKEN_A: None}
+        self.calls = 0
+        self.delay = 0
+        self.error = None
+        self.lock = threading.Lock()
+
+    def __call__(self, cmd, **kwargs):
+        assert cmd == ['kubeadm', 'token', 'list', '-o', 'json']
+        with self.lock:
+            self.calls += 1
+            tokens = dict(self.tokens)
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        # kubeadm 连续输出多个 JSON 对象，而不是数组
+        stdout = '\n'.join(json.dumps({"token": token, "expires": expires}) for token, expires in tokens.items())
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout.encode())
+
+@pytest.fixture
+def kubeadm(backend, monkeypatch):
+    fake = FakeKubeadm()
+    monkeypatch.setattr(backend, 'run_subprocess', fake)
+    return fake
+
+@pytest.fixture
+def make_cache(backend, kubeadm):
+    caches = []
+
+    def make(**kwargs):
+        cache = backend.KubeadmTokenCache(**kwargs)
+        caches.append(cache)
+        cache.start()
+        assert wait_for(lambda: cache.stats()['refreshes'] + cache.stats()['refresh_failures'] >= 1)
+        return cache
+
+    yield make
+    for cache in caches:
+        cache.stop()
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def iso(delta):
+    return (datetime.now(timezone.utc) + delta).isoformat().replace('+00:00', 'Z')
+
+def test_hits_do_not_run_kubeadm(make_cache, kubeadm):
+    cache = make_cache(ttl=3600)
+    for _ in range(50):
+        assert cache.validate(TOKEN_A)
+    assert kubeadm.calls == 1
+    assert cache.stats()['hits'] == 50
+
+    # token id 相同但 secret 不同
+    assert not cache.lookup('abcdef.ffffffffffffffff')
+
+def test_expired_tokens_are_rejected(make_cache, kubeadm):
+    kubeadm.tokens = {TOKEN_A: iso(timedelta(hours=1)), TOKEN_B: iso(-timedelta(seconds=1))}
+    cache = make_cache(ttl=3600, min_refresh_interval=60)
+    assert cache.validate(TOKEN_A)
+    assert not cache.validate(TOKEN_B)
+    # 已在索引中只是过期：不会因为未命中反复调用 kubeadm
+    assert kubeadm.calls == 1
+
+def test_background_refresh_follows_ttl(make_cache, kubeadm):
+    cache = make_cache(ttl=0.05, min_refresh_interval=60)
+    assert not cache.lookup(TOKEN_B)
+
+    kubeadm.tokens = {TOKEN_B: None}
+    # 只查内存索引：新 token 与删除的 token 都由后台刷新生效
+    assert wait_for(lambda: cache.lookup(TOKEN_B, count=False))
+    assert not cache.lookup(TOKEN_A, count=False)
+    assert kubeadm.calls >= 2
+
+    cache.stop()
+    assert wait_for(lambda: not cache._thread.is_alive(), timeout=1)
+    calls = kubeadm.calls
+    time.sleep(0.2)
+    assert kubeadm.calls == calls
+
+def test_miss_triggers_rate_limited_refresh(make_cache, kubeadm):
+    cache = make_cache(ttl=3600, min_refresh_interval=0.2)
+    kubeadm.tokens[TOKEN_B] = None
+    # 刚刷新过，未命中也不立即调用 kubeadm
+    assert not cache.validate(TOKEN_B)
+    assert kubeadm.calls == 1
+
+    time.sleep(0.2)
+    assert cache.validate(TOKEN_B)
+    assert kubeadm.calls == 2
+
+    # 伪造的 token 连续未命中，最小刷新间隔内只调用一次
+    for _ in range(20):
+        assert not cache.validate('zzzzzz.0123456789abcdef')
+    assert kubeadm.calls <= 3
+    for invalid in (None, '', 7):
+        assert not cache.validate(invalid)
+    assert kubeadm.calls <= 3
+
+def test_concurrent_misses_share_one_refresh(make_cache, kubeadm):
+    cache = make_cache(ttl=3600, min_refresh_interval=0)
+    kubeadm.tokens[TOKEN_B] = None
+    kubeadm.delay = 0.2
+    barrier = threading.Barrier(20)
+    results = []
+
+    def validate():
+        barrier.wait()
+        results.append(cache.validate(TOKEN_B))
+
+    threads = [threading.Thread(target=validate) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == [True] * 20
+    # 初始加载 + 一次按需刷新
+    assert kubeadm.calls == 2
+    assert cache.stats()['refreshes'] == 2
+
+def test_failed_refresh_keeps_index(make_cache, kubeadm):
+    cache = make_cache(ttl=3600, min_refresh_interval=0)
+    kubeadm.error = subprocess.CalledProcessError(1, ['kubeadm'])
+    assert not cache.validate(TOKEN_B)
+    assert cache.validate(TOKEN_A)
+    assert cache.stats()['refresh_failures'] == 1
+    assert cache.stats()['tokens'] == 1